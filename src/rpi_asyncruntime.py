@@ -0,0 +1,321 @@
+'''
+Name:		rpi_asyncruntime.py
+Purpose:	Class RPiAsyncRuntime runs the message pump of a process on an asyncio event loop
+            as an alternative to the blocking consume loop of RPiMessageConsumer
+
+Author:
+
+Created:
+Copyright:
+Licence:
+'''
+import asyncio
+import collections
+import time
+
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+from pika.exceptions import AMQPError, AMQPConnectionError
+
+class RPiAsyncRuntime():
+    '''
+    This class is created to run a process on a single asyncio event loop where following
+    tasks run as separate coroutines:
+        - Consuming the input queue => messages are pushed by the broker and handled as soon
+          as they arrive
+        - Ticking => the tick call back function (driving the hardware) is run every
+          'tickTime' seconds, as soon as messages were handled, and at the deadline returned
+          by the next_deadline function (if set), whichever comes first
+        - Publishing => messages passed to send_message (input button events, event
+          subscriptions) are published on the channel of the runtime, so a process using
+          the runtime doesn't need a blocking connection to send messages. Messages sent
+          before the runtime is connected (or while reconnecting) are kept and published
+          once the channel is open
+    The constructor takes following parameters:
+        - message_consumer => RPiMessageConsumer instance of the process. Its configuration
+          dictionary is used (queue, exchange, tick time, drain limits, prefetch and ack
+          batching) as well as its ack and topic binding handling
+        - log_handler => handle to the logger instance
+    Following attributes are defined:
+        - next_deadline => function returning the time (time.monotonic) the tick call back
+          function must be run next, or None. Used to wake up for timer deadlines
+        - connection, channel => Handle to the connection and channel (while connected)
+    When the connection is lost, a new connection is created after 'sleepTime' * 10 seconds
+    '''
+    SETUP_TIMEOUT = 10
+
+    def __init__(self, message_consumer, log_handler=None):
+        self.logger_instance = log_handler
+
+        self.message_consumer = message_consumer
+        self.config = message_consumer.config
+        self.next_deadline = None
+
+        self.loop = None
+        self.connection = None
+        self.channel = None
+        self._run_message_pump = True
+        self._messages_received = 0
+        self._tick_requested = None
+        self._publish_requested = None
+        self._connection_closed = None
+        self._outbox = collections.deque()
+
+    def run(self, message_received_callback, tick_callback):
+        '''
+        method that runs the event loop until message_received_callback returns False
+        (for example when a STOP message is received). The return value is False in that case
+        '''
+        self.loop = asyncio.new_event_loop()
+        try:
+            return self.loop.run_until_complete(
+                self._run(message_received_callback, tick_callback))
+        finally:
+            self.loop.close()
+            self.loop = None
+
+    def send_message(self, queue_list, message, topic=False):
+        '''
+        method that publishes a message for the queues in queue_list on the channel of
+        the runtime (same parameters as RPiMessageSender.send_message). Can be called from
+        any thread, the message is published by the publisher coroutine
+        When topic is True, the message is published to the topic exchange and the
+        entries of queue_list are used as routing keys
+        '''
+        if self.loop is None:
+            # Event loop not running yet, published once connected
+            self._outbox.append((queue_list, message, topic))
+        else:
+            self.loop.call_soon_threadsafe(self._queue_message, (queue_list, message, topic))
+
+    def _queue_message(self, item):
+        self._outbox.append(item)
+        if self._publish_requested is not None:
+            self._publish_requested.set()
+
+    async def _run(self, message_received_callback, tick_callback):
+        self._run_message_pump = True
+        self._tick_requested = asyncio.Event()
+        self._publish_requested = asyncio.Event()
+        while self._run_message_pump is True:
+            try:
+                await self._connect()
+                await self._setup_consumer(message_received_callback, tick_callback)
+            except (AMQPError, asyncio.TimeoutError, OSError) as err:
+                self._log_error("RPiAsyncRuntime - Unable to consume queue {} - {}".format(
+                    self.config['queueName'],
+                    repr(err)))
+                self._close_connection()
+                await asyncio.sleep(self.config['sleepTime'] * 10)
+                continue
+
+            # Publish the messages sent while not connected
+            self._publish_requested.set()
+            tasks = [self.loop.create_task(self._tick(tick_callback)),
+                     self.loop.create_task(self._publish_messages())]
+            await self._connection_closed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.channel = None
+
+            if self._run_message_pump is True:
+                self._log_error("RPiAsyncRuntime - Connection lost, reconnecting")
+                await asyncio.sleep(self.config['sleepTime'] * 10)
+
+        return self._run_message_pump
+
+    async def _connect(self):
+        '''
+        Open the connection and the channel
+        '''
+        opened = self.loop.create_future()
+        self._connection_closed = self.loop.create_future()
+
+        def on_open(connection):
+            if not opened.done():
+                opened.set_result(connection)
+
+        def on_open_error(connection, err):    # pylint: disable=unused-argument
+            if not opened.done():
+                opened.set_exception(AMQPConnectionError(err))
+
+        def on_close(connection, reason):    # pylint: disable=unused-argument
+            if not opened.done():
+                opened.set_exception(AMQPConnectionError(reason))
+            if not self._connection_closed.done():
+                self._connection_closed.set_result(reason)
+
+        self.connection = AsyncioConnection(pika.ConnectionParameters(self.config['host']),
+                                            on_open_callback=on_open,
+                                            on_open_error_callback=on_open_error,
+                                            on_close_callback=on_close,
+                                            custom_ioloop=self.loop)
+        await asyncio.wait_for(opened, self.SETUP_TIMEOUT)
+
+        channel_opened = self.loop.create_future()
+        self.connection.channel(on_open_callback=channel_opened.set_result)
+        self.channel = await asyncio.wait_for(channel_opened, self.SETUP_TIMEOUT)
+        self.channel.add_on_close_callback(lambda channel, reason: self._close_connection())
+
+    async def _call(self, method, **kwargs):
+        '''
+        Run a channel method and wait for the reply of the broker
+        '''
+        reply = self.loop.create_future()
+        method(callback=lambda frame: reply.done() or reply.set_result(frame), **kwargs)
+        return await asyncio.wait_for(reply, self.SETUP_TIMEOUT)
+
+    async def _setup_consumer(self, message_received_callback, tick_callback):
+        '''
+        Declare the exchange and the queue, bind the queue and start consuming
+        '''
+        await self._call(self.channel.exchange_declare,
+                         exchange=self.config['exchangeName'],
+                         exchange_type=self.config['exchangeType'],
+                         passive=self.config['exchangePassive'],
+                         durable=self.config['exchangeDurable'],
+                         auto_delete=self.config['exchangeAutoDelete'],
+                         internal=self.config['exchangeInternal'])
+        await self._call(self.channel.queue_declare,
+                         queue=self.config['queueName'],
+                         passive=self.config['queuePassive'],
+                         durable=self.config['queueDurable'],
+                         exclusive=self.config['queueExclusive'],
+                         auto_delete=self.config['queueAutoDelete'])
+        await self._call(self.channel.queue_bind,
+                         queue=self.config['queueName'],
+                         exchange=self.config['exchangeName'],
+                         routing_key=self.config['routingKey'])
+        for routing_key in self.config['bindingKeys']:
+            await self._call(self.channel.queue_bind,
+                             queue=self.config['queueName'],
+                             exchange=self.config['exchangeName'],
+                             routing_key=routing_key)
+        self.message_consumer.attach_channel(self.channel)
+        if self.config['prefetchCount'] > 0:
+            await self._call(self.channel.basic_qos,
+                             prefetch_count=self.config['prefetchCount'])
+
+        self._messages_received = 0
+        self.message_consumer.start_slice()
+
+        def on_message(channel, method, properties, body):    # pylint: disable=unused-argument
+            if self._run_message_pump is not True:
+                # A STOP message was already received, leave the message on the queue
+                self.message_consumer.flush_acks(channel)
+                channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                return
+            self._run_message_pump = message_received_callback(body.decode())
+            self._messages_received += 1
+            self.message_consumer.ack_message(channel, method.delivery_tag)
+            if self._run_message_pump is not True:
+                self.message_consumer.flush_acks(channel)
+                self._flush_outbox()
+                self._close_connection()
+            elif self.message_consumer.end_of_slice():
+                # Don't wait for the end of the batch to drive the outputs
+                self._run_tick(tick_callback)
+            else:
+                self._tick_requested.set()
+
+        self.channel.basic_consume(queue=self.config['queueName'],
+                                   on_message_callback=on_message)
+
+    def _run_tick(self, tick_callback):
+        self._messages_received = 0
+        self._tick_requested.clear()
+        if self.channel is not None and self.channel.is_open:
+            self.message_consumer.flush_acks(self.channel)
+        tick_callback()
+        self.message_consumer.start_slice()
+
+    async def _tick(self, tick_callback):
+        '''
+        Tick coroutine: runs the tick call back function every 'tickTime' seconds, when
+        messages were handled and when the next deadline is reached
+        '''
+        next_tick = time.monotonic()
+        while True:
+            wake_up = next_tick
+            if self.next_deadline is not None:
+                deadline = self.next_deadline()
+                if deadline is not None and deadline < wake_up:
+                    wake_up = deadline
+            try:
+                await asyncio.wait_for(self._tick_requested.wait(),
+                                       max(wake_up - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                pass
+            self._run_tick(tick_callback)
+
+            now = time.monotonic()
+            if now >= next_tick:
+                next_tick += self.config['tickTime']
+                if next_tick < now:
+                    # We are running late, don't try to catch up on the missed ticks
+                    next_tick = now + self.config['tickTime']
+
+    async def _publish_messages(self):
+        '''
+        Publisher coroutine: publishes the messages passed to send_message
+        '''
+        while True:
+            await self._publish_requested.wait()
+            self._publish_requested.clear()
+            self._flush_outbox()
+
+    def _flush_outbox(self):
+        '''
+        Publish the messages waiting in the outbox. A message is only removed from the outbox
+        once it was published, so it is published again after a reconnect
+        '''
+        while self._outbox and self.channel is not None and self.channel.is_open:
+            queue_list, message, topic = self._outbox[0]
+            if topic:
+                exchange_name = self.config['topicExchangeName']
+            else:
+                exchange_name = self.config['exchangeName']
+            for queue_name in queue_list:
+                self.channel.basic_publish(exchange=exchange_name,
+                                           routing_key=queue_name,
+                                           body=message)
+            self._outbox.popleft()
+
+    def _close_connection(self):
+        if self.connection is not None and\
+           not (self.connection.is_closing or self.connection.is_closed):
+            self.connection.close()
+
+    def _log_error(self, message):
+        if self.logger_instance is not None:
+            self.logger_instance.error(message)
+
+def main():
+    '''
+    main function used mainly for testing purposes
+    '''
+    from rpi_messageconsumer import RPiMessageConsumer  # pylint: disable=import-outside-toplevel
+
+    def my_function(message):
+        print("message= ", message)
+        if message[:4] == "STOP":
+            return False
+        return True
+
+    def my_other_function():
+        pass
+
+    message_configuration = {'queueName': "TESTQUEUE",
+                             'host': 'localhost',
+                             'exchangeName': "HomeDomotica",
+                             'routingKey': "TESTQUEUE",
+                             'consumeMode': 'push'}
+
+    print("Hello world! I'm the Async Runtime class")
+    RPiAsyncRuntime(RPiMessageConsumer(message_configuration)).run(my_function,
+                                                                   my_other_function)
+    print("Bye world")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+'''
+Name:		rpi_compileconfig.py
+Purpose:	Compile the configuration files of the Homedomotica processes into binary files
+            which are loaded by the processes instead of parsing the text files
+
+Author:
+
+Created:
+Copyright:
+Licence:
+'''
+import argparse
+import glob
+import os
+import sys
+
+from rpi_homedomoticaconfigurationfile import RPiHomedomoticaConfigurationFile
+
+def compile_configuration_files(config_file_path, config_file_names):
+    '''
+    Compile the configuration files in config_file_path (all *.cfg files when
+    config_file_names is empty). Return value is the number of invalid files
+    '''
+    if not config_file_names:
+        config_file_names = sorted(
+            os.path.basename(file_name)
+            for file_name in glob.glob(os.path.join(config_file_path, "*.cfg")))
+
+    invalid_files = 0
+    for config_file_name in config_file_names:
+        config_file = RPiHomedomoticaConfigurationFile(file_name=config_file_name,
+                                                       file_path=config_file_path)
+        if config_file.compile_configuration_file():
+            print("Compiled {} => {}".format(config_file.__repr__(),
+                                             config_file.get_compiled_file_name()))
+        else:
+            invalid_files += 1
+            print("Invalid entries found in config file {} - {}".format(
+                config_file.__repr__(),
+                config_file.invalid_keyword_list))
+
+    return invalid_files
+
+def main():
+    '''
+    Compile the configuration files, the exit code is 1 when invalid files were found
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-cfp",
+        nargs="?",
+        type=str,
+        const="/home/homedomotica",
+        default="/home/homedomotica",
+        action="store",
+        dest="config_file_path",
+        help="Path to the configuration files (Default value is /home/homedomotica)."
+        )
+    parser.add_argument(
+        "config_file_names",
+        nargs="*",
+        help="Names of the configuration files to compile (Default: all *.cfg files)."
+        )
+    arguments = parser.parse_args()
+
+    if compile_configuration_files(arguments.config_file_path, arguments.config_file_names):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+'''
+Name:		rpi_configwatcher.py
+Purpose:	Class RPiConfigWatcher is used to detect changes of a configuration file
+            using inotify
+
+Author:
+
+Created:
+Copyright:
+Licence:
+'''
+import ctypes
+import ctypes.util
+import os
+import struct
+
+# inotify events (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+# Header of an inotify event: watch descriptor, mask, cookie and length of the name
+INOTIFY_EVENT = struct.Struct("iIII")
+
+class RPiConfigWatcher():
+    '''
+    This class is created to detect changes of a configuration file without reading it
+    The directory of the file is watched with inotify (Linux), so changes are also detected
+    when an editor replaces the file instead of writing it. The inotify file descriptor is non
+    blocking, so changed() can be called on every tick of the message pump.
+    When inotify is not available, changed() compares the modification time and size of
+    the file instead.
+    The constructor takes following parameters:
+        - file_name => full name of the configuration file
+        - log_handler => handle to the logger instance
+    Following attributes are defined:
+        - file_name => full name of the configuration file
+        - inotify_active => True when the file is watched with inotify
+    '''
+    def __init__(self, file_name, log_handler=None):
+        self.logger_instance = log_handler
+
+        self.file_name = file_name
+        self._directory, self._base_name = os.path.split(file_name)
+        self._file_version = self._get_file_version()
+        self._inotify_fd = self._create_inotify_watch()
+        self.inotify_active = self._inotify_fd is not None
+
+    def __del__(self):
+        self.close()
+
+    def __str__(self):
+        return "Config watcher: {} ({})\n".format(
+            self.file_name,
+            "inotify" if self.inotify_active else "polling")
+
+    def _get_file_version(self):
+        '''
+        Return value is the modification time and size of the file, None when it doesn't exist
+        '''
+        try:
+            file_stat = os.stat(self.file_name)
+        except OSError:
+            return None
+        return (file_stat.st_mtime_ns, file_stat.st_size)
+
+    def _create_inotify_watch(self):
+        '''
+        Return value is a non blocking inotify file descriptor watching the directory of
+        the file, None when inotify is not available
+        '''
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            inotify_fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            inotify_fd = -1
+        if inotify_fd < 0:
+            self._log_warning("RPiConfigWatcher - inotify not available, polling {}".format(
+                self.file_name))
+            return None
+
+        if libc.inotify_add_watch(inotify_fd,
+                                  os.fsencode(self._directory or "."),
+                                  IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            self._log_warning("RPiConfigWatcher - Unable to watch {} - {}, polling {}".format(
+                self._directory,
+                os.strerror(ctypes.get_errno()),
+                self.file_name))
+            os.close(inotify_fd)
+            return None
+
+        return inotify_fd
+
+    def changed(self):
+        '''
+        method that returns True when the file was changed since the previous call
+        '''
+        if self._inotify_fd is not None:
+            file_written = False
+            while True:
+                try:
+                    events = os.read(self._inotify_fd, 4096)
+                except BlockingIOError:
+                    break
+                position = 0
+                while position < len(events):
+                    name_length = INOTIFY_EVENT.unpack_from(events, position)[3]
+                    position += INOTIFY_EVENT.size
+                    name = events[position:position + name_length].rstrip(b"\0")
+                    position += name_length
+                    if os.fsdecode(name) == self._base_name:
+                        file_written = True
+            if not file_written:
+                return False
+
+        file_version = self._get_file_version()
+        if file_version == self._file_version or file_version is None:
+            # Nothing changed or the file is being replaced
+            return False
+        self._file_version = file_version
+        return True
+
+    def close(self):
+        '''
+        method to stop watching the file
+        '''
+        if getattr(self, "_inotify_fd", None) is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+    def _log_warning(self, message):
+        if self.logger_instance is not None:
+            self.logger_instance.warning(message)
+
+def main():
+    '''
+    main function used mainly for testing purposes
+    '''
+    import sys              # pylint: disable=import-outside-toplevel
+    import time             # pylint: disable=import-outside-toplevel
+
+    print("Hello world! I'm the Config Watcher class")
+    config_watcher_instance = RPiConfigWatcher(os.path.abspath(sys.argv[1]))
+    print(config_watcher_instance)
+    for tick in range(0, 300):      # pylint: disable=unused-variable
+        if config_watcher_instance.changed():
+            print("File changed")
+        time.sleep(0.1)
+    print("Bye world")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+'''
+Name:		rpi_eventring.py
+Purpose:	Class RPiEventRing is a preallocated ring buffer used to pass input events
+            from one thread to another without locking
+
+Author:
+
+Created:
+Copyright:
+Licence:
+'''
+from array import array
+
+class RPiEventRing():
+    '''
+    This class implements a ring buffer for input events with a fixed number of entries
+    All storage is allocated when the instance is created, so pushing and draining events
+    doesn't allocate any memory
+    Each event consists of:
+        - board_number
+        - pin_number
+        - state => 0 or 1
+        - timestamp
+    The ring buffer can be used without locks by exactly 1 producer thread (push) and
+    1 consumer thread (drain): the producer only updates the head index, the consumer only
+    updates the tail index, and an entry is made available by updating the head index after
+    the entry was written.
+    Following attributes are defined:
+        - size => number of entries in the ring buffer (always a power of 2)
+        - overflow_count => number of events dropped because the ring buffer was full
+    '''
+    def __init__(self, size=256):
+        # Round the size up to a power of 2 so the index can be calculated with a mask
+        self.size = 1
+        while self.size < size:
+            self.size <<= 1
+        self._index_mask = self.size - 1
+
+        self._board_number = array('B', bytes(self.size))
+        self._pin_number = array('B', bytes(self.size))
+        self._state = array('B', bytes(self.size))
+        self._timestamp = array('d', bytes(8 * self.size))
+
+        self._head = 0  # Only updated by the producer
+        self._tail = 0  # Only updated by the consumer
+        self.overflow_count = 0
+
+    def __len__(self):
+        return self._head - self._tail
+
+    def __str__(self):
+        return "Event ring: {} of {} entries used, {} events dropped\n".format(
+            len(self),
+            self.size,
+            self.overflow_count)
+
+    def push(self, board_number, pin_number, state, timestamp):
+        '''
+        method used by the producer to add an event to the ring buffer
+        Returns False when the ring buffer is full and the event was dropped
+        '''
+        head = self._head
+        if head - self._tail >= self.size:
+            self.overflow_count += 1
+            return False
+
+        index = head & self._index_mask
+        self._board_number[index] = board_number
+        self._pin_number[index] = pin_number
+        self._state[index] = state
+        self._timestamp[index] = timestamp
+        # Make the entry available to the consumer
+        self._head = head + 1
+        return True
+
+    def drain(self, callback):
+        '''
+        method used by the consumer to handle all events in the ring buffer
+        The callback function is run for each event with 4 parameters:
+        board_number, pin_number, state and timestamp
+        Returns the number of events handled
+        '''
+        start = tail = self._tail
+        head = self._head
+        while tail != head:
+            index = tail & self._index_mask
+            callback(self._board_number[index],
+                     self._pin_number[index],
+                     self._state[index],
+                     self._timestamp[index])
+            tail += 1
+            # Release the entry to the producer
+            self._tail = tail
+
+        return tail - start
@@ -11,7 +11,11 @@ Licence:
 '''
 
 from sys import platform
+import marshal
+import mmap
 import os
+import re
+import zlib
 
 class RPiHomedomoticaConfigurationFile():
     '''
@@ -30,68 +34,50 @@ class RPiHomedomoticaConfigurationFile():
         [S_RPIINPUTHANDLER]
         OutputHandler1 = [S_RPIOUTPUTHANDLER1]
         ButtonHandler2=[S_RPIINPUTHANDLER2]
+    Empty lines are ignored.
+    The file is read once into a parse tree (see parse_configuration_file) which is used to
+    validate the file and to extract the blocks. The parse tree is kept until the modification
+    time or the size of the file changes, so reading an unchanged file again only costs a stat
+    The parse tree can be compiled into a binary file (<file name>c, see
+    compile_configuration_file and rpi_compileconfig.py). When the compiled file is up to date,
+    it is loaded instead of parsing the text file
+    The values of the parse tree are also stored split in their fields (separated by ';'),
+    so the processes get the fields of a value without splitting it again (see split_value)
     '''
 
-    VALID_KEYWORDS = ("ConsumerQueue1", "ConsumerQueue2", "ConsumerQueue3",\
-                      "ConsumerQueue4", "ConsumerQueue5", "ConsumerQueue6",\
-                      "ConsumerQueue7", "ConsumerQueue8", "ConsumerQueue9",\
-                      "ConsumerQueue10", "ConsumerQueue11", "ConsumerQueue12",\
-                      "[RPI_INPUTBUTTON]", "[RPI_INPUTBUTTON_PI1]", "[RPI_INPUTBUTTON_PI2]",\
-                      "[RPI_INPUTBUTTON_PI3]", "[RPI_INPUTBUTTON_TST2]", "[RPI_OUTPUTLIGHTS]",\
-                      "[RPI_OUTPUTLIGHTS_PI1]","[RPI_OUTPUTLIGHTS_PI2]", "[RPI_OUTPUTLIGHTS_PI3]",\
-                      "[RPI_OUTPUTLIGHTS_TST2]", "[RPI_OUTPUTDIMMER]", "[RPI_OUTPUTDIMMER_PI1]",\
-                      "[RPI_OUTPUTDIMMER_PI2]","[RPI_OUTPUTDIMMER_PI3]","[RPI_OUTPUTDIMMER_TST2]",\
-                      "[RPI_OUTPUTRELAY]", "[RPI_OUTPUTRELAY_PI1]", "[RPI_OUTPUTRELAY_PI2]",\
-                      "[RPI_OUTPUTRELAY_PI3]", "[RPI_OUTPUTRELAY_PI4]", "[RPI_OUTPUTRELAY_TST2]",\
-                      "Port", "Host_IP",\
-                      "[RPI_LIGHTSIMULATOR_TSTMGMT]", "[RPI_LIGHTSIMULATOR_MGMT]",\
-                      "[RPI_OUTPUTVENTILATOR_TST2]", "[RPI_OUTPUTVENTILATOR_PI4]",\
-                      "Button00", "Button01", "Button02", "Button03", "Button04",\
-                      "Button05", "Button06", "Button07", "Button10", "Button11", "Button12",\
-                      "Button13", "Button14", "Button15", "Button16", "Button17", "Button20",\
-                      "Button21", "Button22", "Button23", "Button24", "Button25", "Button26",\
-                      "Button27", "Button30", "Button31", "Button32", "Button33", "Button34",\
-                      "Button35", "Button36", "Button37", "Output00",\
-                      "Light00", "Light01", "Light02", "Light03", "Light04",\
-                      "Light05", "Light06", "Light07", "Light10", "Light11", "Light12",\
-                      "Light13", "Light14", "Light15", "Light16", "Light17", "Light20",\
-                      "Light21", "Light22", "Light23", "Light24", "Light25", "Light26",\
-                      "Light27", "Light30", "Light31", "Light32", "Light33", "Light34",\
-                      "Light35", "Light36", "Light37",\
-                      "Dimmer00", "Dimmer01", "Dimmer02", "Dimmer03", "Dimmer04",\
-                      "Dimmer05", "Dimmer06", "Dimmer07", "Dimmer10", "Dimmer11", "Dimmer12",\
-                      "Dimmer13", "Dimmer14", "Dimmer15", "Dimmer16", "Dimmer17", "Dimmer20",\
-                      "Dimmer21", "Dimmer22", "Dimmer23", "Dimmer24", "Dimmer25", "Dimmer26",\
-                      "Dimmer27", "Dimmer30", "Dimmer31", "Dimmer32", "Dimmer33", "Dimmer34",\
-                      "Dimmer35", "Dimmer36", "Dimmer37",\
-                      "Relay00", "Relay01", "Relay10", "Relay11", "Relay20", "Relay21",\
-                      "Relay30", "Relay31",\
-                      "RelayTimer00", "RelayTimer01",\
-                      "Simulation00", "Simulation01", "Simulation02", "Simulation03",\
-                      "Simulation04", "Simulation05", "Simulation06", "Simulation07",\
-                      "Simulation08", "Simulation09", "Simulation10", "Simulation11",\
-                      "Simulation12", "Simulation13", "Simulation14", "Simulation15",\
-                      "Simulation16", "Simulation17", "Simulation18", "Simulation19",\
-                      "Simulation20", "Simulation21", "Simulation22", "Simulation23",\
-                      "Simulation24", "Simulation25", "Simulation26", "Simulation27",\
-                      "Simulation28", "Simulation29", "Simulation30", "Simulation31",\
-                      "Simulation32", "Simulation33", "Simulation34", "Simulation35",\
-                      "Simulation36", "Simulation37", "Simulation38", "Simulation39",\
-                      "Simulation40", "Simulation41", "Simulation42", "Simulation43",\
-                      "Simulation44", "Simulation45", "Simulation46", "Simulation47",\
-                      "Simulation48", "Simulation49", "Simulation50", "Simulation51",\
-                      "Simulation52", "Simulation53", "Simulation54", "Simulation55",\
-                      "Simulation56", "Simulation57", "Simulation58", "Simulation59",\
-                      "Simulation60", "Simulation61", "Simulation62", "Simulation63",\
-                      "Simulation64", "Simulation65", "Simulation66", "Simulation67",\
-                      "Simulation68", "Simulation69", "Simulation70", "Simulation71",\
-                      "Simulation72", "Simulation73", "Simulation74", "Simulation75",\
-                      "Simulation76", "Simulation77", "Simulation78", "Simulation79",\
-                      "Simulation80", "Simulation81", "Simulation82", "Simulation83",\
-                      "Simulation84", "Simulation85", "Simulation86", "Simulation87",\
-                      "Simulation88", "Simulation89", "Simulation90", "Simulation91",\
-                      "Simulation92", "Simulation93", "Simulation94", "Simulation95",\
-                      "Simulation96", "Simulation97", "Simulation98", "Simulation99")
+    # Keyword schema:
+    # - VALID_KEYWORDS => keywords which are valid as is
+    # - VALID_KEYWORD_PATTERNS => regular expressions for the families of keywords, like the
+    #   inputs and outputs of a board or the block of a process on a host
+    VALID_KEYWORDS = frozenset((
+        "Port", "Host_IP", "ConsumeMode", "TickTime", "InputMode", "SampleRate",
+        "DebounceTime", "ShortPressTime", "LongPressTime", "DoublePressTime",
+        "EventExchange", "DrainMaxMessages", "DrainMaxTime", "PrefetchCount",
+        "AckBatchSize", "AckBatchTime", "Runtime", "Roles",
+        "OutputArbiter", "OutputResyncTime", "ArbiterClaimTimeout", "HotReload",
+        "Output00"))
+    VALID_KEYWORD_PATTERNS = (
+        r"\[RPI_(INPUTBUTTON|OUTPUTLIGHTS|OUTPUTDIMMER|OUTPUTRELAY|OUTPUTVENTILATOR|"
+        r"OUTPUTHOST|OUTPUTARBITER|LIGHTSIMULATOR)(_[A-Z0-9]+)?\]",   # [RPI_<process>_<host>]
+        r"ConsumerQueue([1-9]|1[0-2])",
+        r"DebounceTime[0-3]",                       # <board>
+        r"(Button|Light|Dimmer)[0-3][0-7]",         # <board><pin>
+        r"(Relay|RelayTimer)[0-3][01]",             # <board><relay>
+        r"Simulation\d\d")
+    _valid_keyword_regex = re.compile("|".join(
+        "(?:{})".format(pattern) for pattern in VALID_KEYWORD_PATTERNS))
+
+    # Header of a compiled configuration file: format, marshal version and keyword schema.
+    # A compiled file with another header is ignored
+    COMPILED_FILE_HEADER = (2,
+                            marshal.version,
+                            zlib.crc32("\n".join(sorted(VALID_KEYWORDS) +
+                                                 list(VALID_KEYWORD_PATTERNS)).encode()))
+
+    # Parse tree of each configuration file read by this process:
+    # key => full file name, value => ((modification time, size), parse tree, value fields)
+    # where value fields is a dictionary: key => value, value => tuple of its fields
+    _parse_tree_cache = {}
 
 	# Initiator Method
 
@@ -124,6 +110,12 @@ class RPiHomedomoticaConfigurationFile():
 
     # Other Methods
 
+    def get_file_path(self):
+        '''
+        The get_file_path method returns the path of the configuration file
+        '''
+        return self._file_path
+
     def exist(self):
         '''
         The exist method will check if a file, presented by the _full_file_name exists
@@ -185,13 +177,25 @@ class RPiHomedomoticaConfigurationFile():
             return str(value).lstrip().rstrip()
         return None     # No key value found
 
+    @classmethod
+    def is_keyword(cls, keyword):
+        '''
+        The is_keyword() method will check if keyword is in the VALID_KEYWORDS set or matches
+        one of the VALID_KEYWORD_PATTERNS
+        In case it is True is returned, False if not
+        '''
+        if keyword is None:
+            return False
+        return keyword in cls.VALID_KEYWORDS or\
+            cls._valid_keyword_regex.fullmatch(keyword) is not None
+
     def is_valid_keyword(self, configuration_line_item):
         '''
         The is_valid_keyword() method will extract the key from the string presented by parameter
         configuration_line_item
-        In case the "key" is found in the VALID_KEYWORDS list, True is returned, False if not
+        In case the "key" is a valid keyword (see is_keyword), True is returned, False if not
         '''
-        if self.get_keyword(configuration_line_item) in self.VALID_KEYWORDS:
+        if self.is_keyword(self.get_keyword(configuration_line_item)):
             return True
 
         self.invalid_keyword_list.append(str(configuration_line_item).lstrip().rstrip('\n'))
@@ -212,76 +216,187 @@ class RPiHomedomoticaConfigurationFile():
 
         return False
 
-    def is_valid_config_file(self):
+    def parse_configuration_file(self):
         '''
-        The is_valid_config_file() method will read each line in the configuration file
-        and check if these entres are valid
-        In case all lines are valid True is returned, False if not
-        A file is considered valid when:
-        - All keys in the file are valid keywords
-        - Key-value pairs have a value that is not empty
-        - The file exists (and is not empty)
+        The parse_configuration_file() method reads the configuration file in a single pass and
+        returns its parse tree, a tuple (blocks, invalid_lines, valid_lines_count) where
+        - blocks is a dictionary where
+            - The key is set as the block keyword, for example [RPI_INPUTBUTTON_PI1]
+            - The corresponding value is the list of (line number, key, value, fields) entries
+              of the block, where fields is the tuple of the fields of the value
+              (separated by ';')
+        - invalid_lines is the list of invalid lines, prefixed by their line number
+        - valid_lines_count is the number of valid block and key-value lines
+        None is returned when the file does not exist or is empty
+        The parse tree is cached, the file is only read again when its modification time
+        or size changed
+        '''
+        try:
+            file_stat = os.stat(self._full_file_name)
+        except OSError:
+            return None
+        if file_stat.st_size == 0:
+            return None
+
+        file_version = (file_stat.st_mtime_ns, file_stat.st_size)
+        cached_parse_tree = self._parse_tree_cache.get(self._full_file_name)
+        if cached_parse_tree is not None and cached_parse_tree[0] == file_version:
+            return cached_parse_tree[1]
+
+        parse_tree = self._load_compiled_file(file_version)
+        if parse_tree is None:
+            # No (up to date) compiled file, parse the text file
+            parse_tree = self._parse_text_file()
+        value_fields = {}
+        for block in parse_tree[0].values():
+            for line_number, key, value, fields in block:    # pylint: disable=unused-variable
+                value_fields[value] = fields
+        self._parse_tree_cache[self._full_file_name] = (file_version, parse_tree, value_fields)
+        return parse_tree
+
+    def _parse_text_file(self):
         '''
-        # Initiate some counters
+        Read the text file and return its parse tree (see parse_configuration_file)
+        '''
+        blocks = {}
+        invalid_lines = []
         valid_lines_count = 0
-        invalid_lines_count = 0
-        comment_lines_count = 0
-
-        if self.exist():
-            with open(self._full_file_name, 'r') as file:
-                for line in file:
-                    if self.is_comment_line(line):
-                        comment_lines_count += 1    # We have found a comment line
-                    else:
-                        if self.is_valid_keyword(line):
-                        # Keyword is valid
-                            if self.get_keyword(line)[0] == '[':
-                                valid_lines_count += 1  # We have found a valid line
-                            else:
-                                if self.get_key_value(line) is None:
-                                # We are expecting a Key-value pair, line is invalid
-                                    invalid_lines_count += 1
-                                else:
-                                # We have found a Key-value pair, line is valid
-                                    valid_lines_count += 1
-                        # Keyword is not valid
-                        else:
-                            invalid_lines_count += 1
+        block = None    # Entries of the current block, None before the first block
+        with open(self._full_file_name, 'r') as file:
+            for line_number, line in enumerate(file, start=1):
+                line = line.strip()
+                if not line or line[0] == '#':
+                    continue                    # Empty or comment line
+
+                if line[0] == '[':              # start of 'Block' line found
+                    position = line.find(']')
+                    if position != -1 and self.is_keyword(line[:position+1]):
+                        block = blocks.setdefault(line[:position+1], [])
+                        valid_lines_count += 1
+                        continue
+                else:
+                    keyword, separator, value = line.partition('=')
+                    keyword = keyword.rstrip()
+                    if separator and self.is_keyword(keyword):
+                        if block is not None:
+                            value = value.strip()
+                            block.append((line_number, keyword, value, tuple(value.split(';'))))
+                        valid_lines_count += 1
+                        continue
+
+                invalid_lines.append("line {}: {}".format(line_number, line))
+
+        return (blocks, invalid_lines, valid_lines_count)
+
+    def split_value(self, value):
+        '''
+        The split_value() method returns the tuple of the fields (separated by ';') of a value
+        of the configuration file. The fields stored in the parse tree of the file are used, so
+        the value is only split when it is not found in the parse tree (for example a value
+        sent in a message)
+        '''
+        fields = None
+        cached_parse_tree = self._parse_tree_cache.get(self._full_file_name)
+        if cached_parse_tree is not None:
+            fields = cached_parse_tree[2].get(value)
+        if fields is None:
+            fields = tuple(str(value).split(';'))
+        return fields
+
+    def get_compiled_file_name(self):
+        '''
+        The get_compiled_file_name method returns the name of the compiled configuration file
+        '''
+        return self._full_file_name + "c"
+
+    def _load_compiled_file(self, file_version):
+        '''
+        Return value is the parse tree stored in the compiled file, None when there is no
+        compiled file or when it was not compiled from the current version of the text file
+        The compiled file is memory mapped, so it is loaded without copying it first
+        '''
+        try:
+            with open(self.get_compiled_file_name(), 'rb') as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as compiled_file:
+                    header, compiled_file_version, parse_tree = marshal.loads(compiled_file)
+        except (OSError, ValueError, EOFError, TypeError):
+            return None
+
+        if header != self.COMPILED_FILE_HEADER or compiled_file_version != file_version:
+            return None     # Stale compiled file
+        return parse_tree
+
+    def compile_configuration_file(self):
+        '''
+        The compile_configuration_file() method parses the text file and stores the parse
+        tree in the compiled file. Only valid files are compiled, the compiled file of an
+        invalid file is removed
+        In case the file is valid True is returned, False if not
+        '''
+        compiled_file_name = self.get_compiled_file_name()
+        try:
+            file_stat = os.stat(self._full_file_name)
+        except OSError:
+            file_stat = None
+        if file_stat is None or file_stat.st_size == 0:
+            parse_tree = None
         else:
-            self.invalid_keyword_list.append(
-                "{} does not exist or is empty!".format(self._full_file_name))
+            parse_tree = self._parse_text_file()
 
-        # In case we have not find a single valid line, must be something wrong
-        if (valid_lines_count == 0) or (invalid_lines_count > 0):
+        if not self._check_parse_tree(parse_tree):
+            if os.path.exists(compiled_file_name):
+                os.remove(compiled_file_name)
+            return False
+
+        # Write a temporary file first, so a process never loads a partly written file
+        with open(compiled_file_name + ".tmp", 'wb') as file:
+            marshal.dump((self.COMPILED_FILE_HEADER,
+                          (file_stat.st_mtime_ns, file_stat.st_size),
+                          parse_tree),
+                         file)
+        os.replace(compiled_file_name + ".tmp", compiled_file_name)
+        return True
+
+    def _check_parse_tree(self, parse_tree):
+        '''
+        Sets invalid_config_file and invalid_keyword_list for the parse tree of the file
+        Return value is True when the file is valid, False if not
+        '''
+        if parse_tree is None:
+            self.invalid_keyword_list = [
+                "{} does not exist or is empty!".format(self._full_file_name)]
             self.invalid_config_file = True
             return False
 
-        return True    # No invalid lines found and at least one valid one
+        blocks, invalid_lines, valid_lines_count = parse_tree    # pylint: disable=unused-variable
+        self.invalid_keyword_list = list(invalid_lines)
+        # In case we have not find a single valid line, must be something wrong
+        self.invalid_config_file = valid_lines_count == 0 or len(invalid_lines) > 0
+        return not self.invalid_config_file
+
+    def is_valid_config_file(self):
+        '''
+        The is_valid_config_file() method will check if all entries in the configuration file
+        are valid
+        In case all lines are valid True is returned, False if not
+        A file is considered valid when:
+        - All keys in the file are valid keywords
+        - Lines which are not a comment or a block keyword are key-value pairs
+        - The file exists (and is not empty)
+        The invalid lines are stored in invalid_keyword_list, prefixed by their line number
+        '''
+        return self._check_parse_tree(self.parse_configuration_file())
 
     def read_configuration_file(self, block_keyword):
         '''
-        The read_configuration_file() method will read all key-value pairs in
-        a (valid) configuration file and return these in a dictionary
+        The read_configuration_file() method will return all key-value pairs of
+        block block_keyword in a (valid) configuration file in a dictionary
         In case of an invalid file, None is returned
         '''
-        if self.is_valid_config_file():
-            found_block = False
-            dic_to_return = {}
-            with open(self._full_file_name, 'r') as file:
-                # Scan through the file until the block_keyword is found
-                for line in file:
-                    if not self.is_comment_line(line):          # We can skip the comment lines
-                        if found_block:
-                            key = self.get_keyword(line)
-                            if key[0] == '[':
-                                found_block = False             # We have reached the next block
-                            else:
-                                value = self.get_key_value(line)
-                                dic_to_return.update({key: value})
-                        if self.get_keyword(line) == block_keyword:
-                            found_block = True
-
-            return dic_to_return
+        parse_tree = self.parse_configuration_file()
+        if self._check_parse_tree(parse_tree):
+            return {key: value for line_number, key, value, fields in    # pylint: disable=unused-variable
+                    parse_tree[0].get(block_keyword, [])}
 
         return None         # In case the configuration file is not valid, we return None
 
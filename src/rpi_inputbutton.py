@@ -9,11 +9,91 @@ Copyright:	(c) Wim 2018
 Licence:
 '''
 
+import re
 import time
 
-from rpi_processframework import RPiProcessFramework
+from rpi_processframework import RPiProcessFramework, EVENT_ROUTING_KEY
 from rpi_piface import RPiPiface
-from rpi_messagesender import RPiMessageSender
+from rpi_messageoutbox import RPiMessageOutbox
+from rpi_eventring import RPiEventRing
+from rpi_inputsampler import RPiInputSampler
+from rpi_timerwheel import RPiTimerWheel
+
+# Events sent by an input button
+BUTTON_EVENTS = ("UP", "DOWN", "PRESSED", "PRESSEDLONG", "PRESSEDDOUBLE", "PRESSEDSHORT")
+
+class RPiInputButtonState():
+    '''
+    This class holds the state of a single input button
+    Following attributes are defined:
+        - key => Address of the input pin as used in the configuration file, for example (0,1)
+        - board_number => integer
+        - pin_number => integer
+        - state => integer that is either 0 (=Not Pressed) or 1 (=Pressed)
+        - signalup_timestamp => Time stamp when the button was pressed
+            (ie. move from State 0 to 1)
+        - signaldown_timestamp => Time stamp when the button was released
+            (ie.move from State 1 to 0)
+        - previous_signaldown_timestamp => Time stamp of the previous signaldown_timestamp.
+            This is used to identify "double press" activities
+        - press_count => Attribute of a button to identify double press events
+        - pending_timer => Timer of the gesture timer wheel sending the short press event,
+            None when no short press is pending
+        - description => String value
+        - consumer => String value that indicates to which "consummers" the button
+            input event should be send to. If more than 1 consummer is required, they can be
+            separated by a "," (=comma)
+        - consumer_queues => list of queue names the events of the button are sent to
+        - event_messages => dictionary with the message (as bytes) of each event in
+            BUTTON_EVENTS, for example b"I;RPI_INPUTBUTTON_PI1_0_1_PRESSED"
+        - event_queues => dictionary with the list of consumer queues of each event in
+            BUTTON_EVENTS, only holding the queues subscribed to the event
+        - event_routing_keys => dictionary with the routing key on the topic exchange
+            of each event in BUTTON_EVENTS, for example input.RPI_INPUTBUTTON_PI1.0.1.PRESSED
+    '''
+    __slots__ = ('key', 'board_number', 'pin_number', 'state', 'signalup_timestamp',
+                 'signaldown_timestamp', 'previous_signaldown_timestamp', 'press_count',
+                 'pending_timer', 'description', 'consumer', 'consumer_queues',
+                 'event_messages', 'event_queues', 'event_routing_keys')
+
+    def __init__(self, key, description, consumer, process_name):
+        self.key = key
+        self.board_number = int(key[1])
+        self.pin_number = int(key[3])
+        self.state = 0
+        self.signalup_timestamp = 0
+        self.signaldown_timestamp = 0
+        self.previous_signaldown_timestamp = 0
+        self.press_count = 0
+        self.pending_timer = None
+        self.description = description
+        self.consumer = consumer
+        self.consumer_queues = []
+        self.event_queues = {}
+        # Message of each event, the board and pin number don't change so they are
+        # only formatted once
+        self.event_messages = {}
+        self.event_routing_keys = {}
+        for event in BUTTON_EVENTS:
+            self.event_messages[event] = "I;{}_{}_{}_{}".format(
+                process_name,
+                self.board_number,
+                self.pin_number,
+                event).encode()
+            self.event_routing_keys[event] = [EVENT_ROUTING_KEY.format(
+                process_name,
+                self.board_number,
+                self.pin_number,
+                event)]
+
+    def __repr__(self):
+        return str([self.state,
+                    self.description,
+                    self.consumer,
+                    self.signalup_timestamp,
+                    self.signaldown_timestamp,
+                    self.previous_signaldown_timestamp,
+                    self.press_count])
 
 class RPiInputButton(RPiProcessFramework, RPiPiface):
     '''
@@ -29,24 +109,49 @@ class RPiInputButton(RPiProcessFramework, RPiPiface):
     Following attributes are defined in the RPiInputButton class:
         - input_buttons => dictionary where
             - The key is set as the address of the input pin consisting of the board and pin number
-            - The corresponding values a list structure containing following attributes:
-                - State => integer that is either 0 (=Not Pressed) or 1 (=Pressed)
-                - Previous State => integer that is either 0 (=Not Pressed) or 1 (=Pressed)
-                - SignalUpTimestamp => Time stamp when the button was pressed
-                    (ie. move from State 0 to 1)
-                - SignalDownTimestamp => Time stamp when the button was released
-                    (ie.move from State 1 to 0)
-                - PreviousSignalDownTimestamp => Time stamp of the previous SignalDownTimestamp.
-                    This is used to identify "double press" activities
-                - ButtonPressedCount => Attribute of a button to identify double press events
-                - Description => String value
-                - OutputHandler => String value that indicates to which "Outputhandler" the button
-                    input event should be send to. If more than  hanlder is required, they can be
-                    separated by a "," (=comma)
+            - The corresponding value is an RPiInputButtonState instance
+        - input_button_table => List with one entry per board, holding a list of 8 entries
+          (one per input pin) with the RPiInputButtonState instance of the button connected
+          to the pin, or None when the pin is not used
         - process_consumer_queue => dictionary where
             - The key is set as the consumer reference
             - The corresponding value is the queue name
+        - process_output_queue_handler => Handle to the message outbox used to send the
+          input button events. With the ASYNCIO runtime, the RPiAsyncRuntime instance is
+          used instead, so the events are published on its event loop
+        - consumer_subscriptions => dictionary where
+            - The key is set as the queue name of a consumer
+            - The corresponding value is the set of events (<board>_<pin>_<event>) the
+              consumer subscribed to. Consumers that didn't subscribe receive all events
+        - event_exchange => Name of the topic exchange set by the 'EventExchange' entry in
+          the process configuration file. When set, each event is published only once to
+          this exchange and the broker delivers it to the queues of the consumers bound to
+          the event (the consumers must use the same 'EventExchange'). When not set, the
+          event is sent to each consumer queue
+        - input_mode => How changes on the input buttons are detected, set by the 'InputMode'
+          entry in the process configuration file:
+            - POLL => the input ports are sampled at a fixed rate, set by the 'SampleRate'
+              entry in the process configuration file (default 200 samples per second)
+            - INTERRUPT => the interrupt-on-change line of the PiFace boards is used. The input
+              ports are only read when a change was detected by the event listener
+        - input_event_ring => ring buffer receiving the changes on the input pins
+        - input_sampler => Handle to the sampler thread reading the input ports. Changes are
+          pushed in the input_event_ring, which is handled by process_input_buttons
+          Contact bounce is filtered by the sampler, the debounce time is set by the
+          'DebounceTime' entry in the process configuration file (default 0.02 seconds) and
+          can be overruled per board with the 'DebounceTime0' to 'DebounceTime3' entries
+        - short_press_time, long_press_time, double_press_time => Thresholds in seconds used
+          to identify PRESSED, PRESSEDLONG and PRESSEDDOUBLE events, set by the
+          'ShortPressTime' (default 0.25), 'LongPressTime' (default 0.75) and
+          'DoublePressTime' (default 1) entries in the process configuration file
+        - gesture_timers => Timer wheel used to send the PRESSEDSHORT event of a short press
+          that is not followed by a second short press within double_press_time
     '''
+    # Entries of the process configuration file holding the input buttons, the consumer
+    # queues and the input timing
+    BUTTON_KEYWORD = re.compile(r"Button\d\d")
+    CONSUMER_KEYWORD = re.compile(r"ConsumerQueue\d+")
+    TIMING_KEYWORD = re.compile(r"DebounceTime\d?|ShortPressTime|LongPressTime|DoublePressTime")
 
     def __init__(self):
         # Initialize process framework attributes so we can start using them
@@ -67,17 +172,56 @@ class RPiInputButton(RPiProcessFramework, RPiPiface):
                 "RPiInputButton - Potentially not all PiFace boards detected." +\
                 "Address of last detected board = {}".format(self.get_number_of_boards()-1))
 
+        # Events the consumers subscribed to, see _subscribe_consumer
+        self.consumer_subscriptions = {}
+
         # Initialize the input buttons dictionary
         self.input_buttons = self.create_inputbutton_list(self.process_attributes.__repr__())
+        self.input_button_table = self.create_input_button_table()
 
         # Initialize message sender handles so we can send messages
         self.process_consumers = self.create_message_senders(self.process_attributes.__repr__())
 
+        # Initialize the input detection
+        # The input ports are read on a dedicated thread, so sampling doesn't depend
+        # on the messages received on the input queue
+        self.input_event_ring = RPiEventRing(256)
+        self.gesture_timers = RPiTimerWheel(0.05, 64)
+        self.input_sampler = RPiInputSampler(self.get_input_ports_state,
+                                             self.input_event_ring,
+                                             self.get_float_attribute("SampleRate", 200),
+                                             self.logger_instance,
+                                             self.get_float_attribute("DebounceTime", 0.02))
+        self._set_input_timing()
+        self.input_mode = str(self.process_attributes.get_item("InputMode")).upper()
+        if self.input_mode != "INTERRUPT":
+            self.input_mode = "POLL"
+        if self.run_process:
+            if self.input_mode == "INTERRUPT":
+                self.input_sampler.start(self.get_input_ports_state(), interrupt_mode=True)
+                self._synchronize_input_buttons()
+                self.activate_input_interrupts(self._input_interrupt_detected)
+                self.logger_instance.info(
+                    "RPiInputButton - Interrupt detection of input buttons active")
+            else:
+                self.input_sampler.set_input_masks(self._get_input_masks())
+                self.input_sampler.start()
+
         # Initialize the message sender handler
-        output_queue_configuration = {'exchangeName': 'HOMEDOMOTICA',
-                                      'host': 'localhost'}
-        self.process_output_queue_handler = RPiMessageSender(
-            output_queue_configuration, self.logger_instance)
+        # Messages are sent by the outbox publisher thread (or the publisher coroutine of the
+        # asyncio runtime), so reading the input buttons never has to wait for the
+        # message exchange
+        self.event_exchange = self.process_attributes.get_item("EventExchange")
+        if self.process_async_runtime is not None:
+            self.process_output_queue_handler = self.process_async_runtime
+        else:
+            output_queue_configuration = {'exchangeName': 'HOMEDOMOTICA',
+                                          'host': 'localhost',
+                                          'outboxSize': 100,
+                                          'topicExchangeName': self.event_exchange}
+            self.process_output_queue_handler = RPiMessageOutbox(
+                output_queue_configuration, self.logger_instance)
+        self._request_subscriptions()
 
     def __del__(self):
         self.logger_instance.info("RPiInputButton - Process Stopping!")
@@ -97,6 +241,13 @@ class RPiInputButton(RPiProcessFramework, RPiPiface):
                 long_string += "{} = {}\n".format(key, value)
         else:
             long_string += "No input_buttons process consumers information found!\n"
+        if self.consumer_subscriptions != {}:
+            long_string += "consumer subscriptions:\n"
+            for key, value in self.consumer_subscriptions.items():
+                long_string += "{} = {} events\n".format(key, len(value))
+        long_string += self.input_sampler.__str__()
+        long_string += self.gesture_timers.__str__()
+        long_string += self.process_output_queue_handler.__str__()
 
         return long_string
 
@@ -107,63 +258,44 @@ class RPiInputButton(RPiProcessFramework, RPiPiface):
         '''
         Return value is a dictionary where
           - The key is set as the address of the input pin consisting of the board and pin number
-          - The corresponding values a list structure containing following attributes:
-            - State => integer that is either 0 (=Not Pressed) or 1 (=Pressed)
-            - Previous State => integer that is either 0 (=Not Pressed) or 1 (=Pressed)
-            - SignalUpTimestamp => Time stamp when the button was pressed
-              (ie. move from State 0 to 1)
-            - SignalDownTimestamp => Time stamp when the button was released
-              (ie.move from State 1 to 0)
-            - PreviousSignalDownTimestamp => Time stamp of the previous SignalDownTimestamp.
-              This is used to identify "double press" activities
-            - ButtonPressedCount => Attribute of a button to identify double press events
-            - Description => String value
-            - Consumer => String value that indicates to which "consummers" the button
-              input event should be send to. If more than 1 consummer is required, they can be
-              separated by a "," (=comma)
+          - The corresponding value is an RPiInputButtonState instance holding the
+            attributes of the button
         '''
         reply = {}
+        process_name = str(self.process_attributes.get_item("ProcessName")).upper()
 
         for board in range(0, self.get_number_of_boards()):
             for pin in range(0, 8):
                 key = "Button" + str(board) + str(pin)
                 if key in process_attribute_list:
                     value = process_attribute_list[key]
-                    attribute_key, description, consumer = value.split(
-                        ";")
+                    attribute_key, description, consumer = self.split_attribute_value(value)
                     if description != "Not Used":
-                        reply[attribute_key] = [
-                            0,  # State
-                            0,  # Previous state
-                            description,
-                            consumer,
-                            0,  # SignalUpTimestamp
-                            0,  # SignalDownTimestamp
-                            0,  # PreviousSignalDownTimestamp
-                            0]  # ButtonPressedCount
+                        button = RPiInputButtonState(attribute_key, description, consumer,
+                                                     process_name)
+                        reply[attribute_key] = button
                         self.logger_instance.debug(
                             "RPiInputButton - Initializing input_button: {}".format(
                                 attribute_key) +\
-                            " - State: {}".format(
-                                reply[attribute_key][0]) +\
-                            " - Previous State: {}".format(
-                                reply[attribute_key][1]) +\
-                            " - Description: {}".format(
-                                reply[attribute_key][2]) +\
-                            " - Consumer: {}".format(
-                                reply[attribute_key][3]) +\
-                            " - Signal Up Timestamp: {}".format(
-                                reply[attribute_key][4]) +\
-                            " - Signal Down Timestamp: {}".format(
-                                reply[attribute_key][5]) +\
-                            " - Previous Signal Down Timestamp: {}".format(
-                                reply[attribute_key][6]) +\
-                            " - Button Pressed Count: {}".format(
-                                reply[attribute_key][7])
+                            " - State: {}".format(button.state) +\
+                            " - Description: {}".format(button.description) +\
+                            " - Consumer: {}".format(button.consumer)
                             )
 
         return reply
 
+    def create_input_button_table(self):
+        '''
+        Return value is the input_button_table: a list with one entry per board, holding a list
+        of 8 entries with the RPiInputButtonState instance of the button connected to the pin
+        (or None), so the button of a board and pin can be found without using the key
+        '''
+        input_button_table = [[None] * 8 for board in range(0, self.get_number_of_boards())]
+        for button in self.input_buttons.values():
+            if 0 <= button.board_number < self.get_number_of_boards():
+                input_button_table[button.board_number][button.pin_number] = button
+        return input_button_table
+
     def create_message_senders(self, process_attribute_list):
         '''
         method to create a consumer queue list based on all consumer entries found
@@ -172,18 +304,22 @@ class RPiInputButton(RPiProcessFramework, RPiPiface):
         Note: leading and trailing spaces are removed from the key to avoid KeyErrors
         '''
         process_consumer_queue = {}
-        for key in self.input_buttons:
-            consumer_list = self._get_button_consumers(key)
+        for key, button in self.input_buttons.items():
+            consumer_list = str(button.consumer).split(",")
             queue_list = []
             try:
                 for consumer in consumer_list:
                     queue_list.append(process_attribute_list[str(consumer).lstrip().rstrip()])
                 process_consumer_queue[key] = queue_list
+                button.consumer_queues = queue_list
+                self._set_event_queues(button)
                 self.logger_instance.debug(
                     "RPiInputButton - Initializing process_consumers {} = {}".format(
                         key, queue_list))
             except Exception:   # pylint: disable=broad-except
                 process_consumer_queue[key] = []
+                button.consumer_queues = []
+                self._set_event_queues(button)
                 self.logger_instance.warning(
                     "RPiInputButton - Invalide queue reference '{}' for input button {}. ".format(
                         consumer, key) +\
@@ -194,140 +330,135 @@ class RPiInputButton(RPiProcessFramework, RPiPiface):
 
         return process_consumer_queue
 
-    def _get_button_state(self, key):
-        '''
-        function that retrieves the button state value as set in the input
-        button list
-        '''
-        return self.input_buttons[key][0]
-
-    def _get_previous_button_state(self, key):
-        '''
-        function that retrieves the previous button state value as set in the input
-        button list
-        '''
-        return self.input_buttons[key][1]
-
-    def _get_button_description(self, key):
-        '''
-        function that retrieves the button description as set in the input
-        button list
-        '''
-        return self.input_buttons[key][2]
-
-    def _get_button_consumers(self, key):
-        '''
-        function that retrieves the button consumer list as set in the input
-        button list
-        '''
-        return str(self.input_buttons[key][3]).split(",")
-
-    def _get_button_signalup_timestamp(self, key):
-        '''
-        function that retrieves the button signal up timestamp
-        as set in the input button list
-        '''
-        return self.input_buttons[key][4]
-
-    def _get_button_signaldown_timestamp(self, key):
-        '''
-        function that retrieves the button signal down timestamp
-        as set in the input button list
-        '''
-        return self.input_buttons[key][5]
-
-    def _get_button_previous_signaldown_timestamp(self, key):
-        '''
-        function that retrieves the button previous signal down timestamp
-        as set in the input button list
-        '''
-        return self.input_buttons[key][6]
-
-    def _get_button_presscount(self, key):
-        '''
-        function that retrieves the button signal press count
-        as set in the input button list
-        '''
-        return self.input_buttons[key][7]
-
-    def _set_button_state(self, key, state):
-        '''
-        function that sets the button state value
-        in the input button list
-        '''
-        self.input_buttons[key][0] = int(state)
-
-    def _set_previous_button_state(self, key, state):
+    def _set_input_timing(self):
         '''
-        method that sets the previous button state value
-        in the input button list
+        method that reads the debounce time of each board and the thresholds used
+        to identify the button pressed events from the process attributes
         '''
-        self.input_buttons[key][1] = int(state)
-
-    def _set_button_description(self, key, description):
-        '''
-        method that sets the button description
-        in the input button list
-        '''
-        self.input_buttons[key][2] = description
-
-    def _set_button_consummers(self, key):
-        '''
-        method that sets the button consummer list
-        in the input button list
-        '''
-        str(self.input_buttons[key][3]).split(",")
-
-    def _set_button_signalup_timestamp(self, key, timestamp):
-        '''
-        method that sets the button signal up timestamp
-        in the input button list
-        '''
-        self.input_buttons[key][4] = timestamp
-
-    def _set_button_signaldown_timestamp(self, key, timestamp):
-        '''
-        method that sets the button signal down timestamp
-        in the input button list
-        '''
-        self.input_buttons[key][5] = timestamp
-
-    def _set_button_previous_signaldown_timestamp(self, key):
-        '''
-        method that sets the button previous signal down timestamp
-        in the input button list
-        '''
-        self.input_buttons[key][6] = self.input_buttons[key][5]
-
-    def _set_button_presscount(self, key):
-        '''
-        method that sets the button signal press count to 1
-        in the input button list
-        '''
-        self.input_buttons[key][7] = 1
-
-    def _reset_button_presscount(self, key):
-        '''
-        method that sets the button signal press count to 0
-        in the input button list
-        '''
-        self.input_buttons[key][7] = 0
+        debounce_times = []
+        for board in range(0, self.get_number_of_boards()):
+            debounce_times.append(self.get_float_attribute(
+                "DebounceTime" + str(board), self.input_sampler.debounce_time))
+        self.input_sampler.set_debounce_times(debounce_times)
+
+        self.short_press_time = self.get_float_attribute("ShortPressTime", 0.25)
+        self.long_press_time = self.get_float_attribute("LongPressTime", 0.75)
+        self.double_press_time = self.get_float_attribute("DoublePressTime", 1)
+
+    def _set_event_queues(self, button):
+        '''
+        method that sets the consumer queues of each event of a button
+        A queue only receives the event when the consumer subscribed to it, or when
+        the consumer didn't send a subscription
+        '''
+        button.event_queues = {}
+        for event in BUTTON_EVENTS:
+            event_reference = "{}_{}_{}".format(button.board_number, button.pin_number, event)
+            button.event_queues[event] = [
+                queue_name for queue_name in button.consumer_queues
+                if queue_name not in self.consumer_subscriptions or
+                event_reference in self.consumer_subscriptions[queue_name]]
+
+    def _subscribe_consumer(self, queue_name, events):
+        '''
+        method to handle the subscription of a consumer queue. events is a comma
+        separated list of events (<board>_<pin>_<event>) the consumer has rules for
+        '''
+        self.consumer_subscriptions[queue_name] = set(
+            event for event in events.split(",") if event != "")
+        self.logger_instance.info(
+            "RPiInputButton - Queue {} subscribed to {} events".format(
+                queue_name,
+                len(self.consumer_subscriptions[queue_name])))
+        for button in self.input_buttons.values():
+            self._set_event_queues(button)
+
+    def _request_subscriptions(self):
+        '''
+        method that requests all consumers to send their subscriptions
+        '''
+        queue_list = []
+        for button in self.input_buttons.values():
+            for queue_name in button.consumer_queues:
+                if queue_name not in queue_list:
+                    queue_list.append(queue_name)
+        if queue_list:
+            self.process_output_queue_handler.send_message(queue_list, "P;REQUEST_SUBSCRIPTION")
+
+    def _send_button_event(self, button, event):
+        '''
+        method that sends the message of an event of a button to the consumer
+        queues subscribed to the event, or publishes it once on the topic exchange
+        '''
+        if self.event_exchange is not None:
+            self.process_output_queue_handler.send_message(button.event_routing_keys[event],
+                                                           button.event_messages[event],
+                                                           topic=True)
+            return
+        queue_list = button.event_queues[event]
+        if queue_list:
+            self.process_output_queue_handler.send_message(queue_list,
+                                                           button.event_messages[event])
+
+    def _get_input_masks(self):
+        '''
+        method that returns, for each board, the mask of the input pins that are
+        configured as input button
+        '''
+        input_masks = []
+        for board_buttons in self.input_button_table:
+            mask = 0
+            for pin, button in enumerate(board_buttons):
+                if button is not None:
+                    mask |= 1 << pin
+            input_masks.append(mask)
+        return input_masks
+
+    def _synchronize_input_buttons(self):
+        '''
+        method that sets the state of all input buttons to the last known status
+        of the inputs (as seen by the sampler), without creating any events.
+        The sampler is informed about the input pins that are configured
+        '''
+        self.input_sampler.set_input_masks(self._get_input_masks())
+        input_ports = self.input_sampler.input_ports
+        for button in self.input_buttons.values():
+            if button.board_number < len(input_ports):
+                button.state = (input_ports[button.board_number] >> button.pin_number) & 1
+
+    def _input_interrupt_detected(self, board_number, pin_number, state, timestamp):   # pylint: disable=unused-argument
+        '''
+        call back function used by the event listener in INTERRUPT mode
+        The sampler is requested to read the input ports
+        Note: this function is run in the thread of the event listener
+        '''
+        self.input_sampler.wake_up(timestamp)
+
+    def _input_button_changed(self, board_number, pin_number, state, timestamp):
+        '''
+        call back function used to handle the events in the input_event_ring
+        Only input pins that changed are reported, the button is found in the
+        input_button_table using the board and pin number
+        '''
+        # Expire the pending gestures up to the time of this change first
+        self.gesture_timers.advance(timestamp)
+        button = self.input_button_table[board_number][pin_number]
+        if button is not None and state != button.state:
+            button.state = state
+            self._handle_button_change(button, timestamp)
 
-    def _read_input_buttons(self):
+    def process_input_buttons(self):
         '''
-        method that reads all the (physical) inputs on the piface boards
-        and store the actual status in the input_buttons dictionary
-            key[1] represents the board number
-            key[3] represents the pin number on this board
+        method to process changes on input buttons.
+        and send events as required.
+        The changes are detected by the sampler thread and taken from the input_event_ring
         '''
-        for key in self.input_buttons:
-            self._set_button_state(
-                key,
-                self.get_input_button_state(_get_board_number(key), _get_pin_number(key)))
+        self.input_event_ring.drain(self._input_button_changed)
+        self.gesture_timers.advance(time.time())
 
-    def process_input_buttons(self):
+    def _handle_button_change(self, button, timestamp):
         '''
-        method to process changes on input buttons.
+        method to process a change of an input button detected at 'timestamp'
         and send events as required.
         Valid events are:
         - UP
@@ -335,99 +466,151 @@ class RPiInputButton(RPiProcessFramework, RPiPiface):
         - PRESSED
         - PRESSEDLONG
         - PRESSEDDOUBLE
+        - PRESSEDSHORT => Sent when no second short press follows within double_press_time
+          (see _short_press_expired)
         Messages are constructed with following syntax:
         - "I;<process_name>_<board_number>_<pin_number>_<event>"
-        '''
-        # We first read the status of all input buttons
-        self._read_input_buttons()
-
-        # Now let's process the changes
-        for key in self.input_buttons:
-            if self._get_button_state(key) != self._get_previous_button_state(key):
-                message_pre_able = "I;{}_{}_{}_".format(
-                    self.process_attributes.get_item("ProcessName").upper(),
-                    _get_board_number(key),
-                    _get_pin_number(key),)
-                if self._get_button_state(key) == 1:    # Up event dedected
-                    # set "time stamp" of button up event
-                    self._set_button_signalup_timestamp(key, time.time())
-                    # set "time stamp" of the previous button down action
-                    # We know this has taken place, otherwise we couldn't have had a
-                    # button up action
-                    self._set_button_previous_signaldown_timestamp(key)
-                    self.logger_instance.info(
-                        "RPiInputButton - Up event detected on board {} pin {} for {}".format(
-                            _get_board_number(key),
-                            _get_pin_number(key),
-                            self._get_button_description(key))
-                        )
-                    # TO-DO: Add code to send "UP-event" message to consummer queue(s)
-                    self.process_output_queue_handler.send_message(
-                        self.process_consumers[key], message_pre_able+"UP")
-                else:                                   # Down event detected
-                    # set "time stamp" of button down event
-                    self._set_button_signaldown_timestamp(key, time.time())
+        The messages are prepared when the button is created (see event_messages
+        of RPiInputButtonState)
+        '''
+        if button.state == 1:    # Up event dedected
+            # set "time stamp" of button up event
+            button.signalup_timestamp = timestamp
+            # set "time stamp" of the previous button down action
+            # We know this has taken place, otherwise we couldn't have had a
+            # button up action
+            button.previous_signaldown_timestamp = button.signaldown_timestamp
+            # A second press within the double press window, this can't be a
+            # single short press anymore
+            if button.pending_timer is not None:
+                self.gesture_timers.cancel(button.pending_timer)
+                button.pending_timer = None
+            self.logger_instance.info(
+                "RPiInputButton - Up event detected on board {} pin {} for {}".format(
+                    button.board_number,
+                    button.pin_number,
+                    button.description)
+                )
+            # Send the UP event to the consumer queue(s)
+            self._send_button_event(button, "UP")
+        else:                                   # Down event detected
+            # set "time stamp" of button down event
+            button.signaldown_timestamp = timestamp
+            self.logger_instance.info(
+                "RPiInputButton - Down event detected on board {} pin {} for {}".format(
+                    button.board_number,
+                    button.pin_number,
+                    button.description)
+                )
+            # Send the DOWN event to the consumer queue(s)
+            self._send_button_event(button, "DOWN")
+            # Check to see if we have a Pulse, Long Pulse or Double pulse event
+            # by assessing the duration of the pulse and the time since the previous pulse
+            pulse_duration = button.signaldown_timestamp - button.signalup_timestamp
+            duration_since_last_pulse = button.signalup_timestamp -\
+                button.previous_signaldown_timestamp
+            # If the duration since last pulse is more than 1 second
+            # it can no longer be a Double Pulse event.
+            if duration_since_last_pulse > self.double_press_time:
+                button.press_count = 0
+            if button.press_count == 1 and pulse_duration > self.short_press_time:
+                # The previous short press is not followed by a second short press
+                self._short_press_expired(button)
+            if pulse_duration > self.long_press_time:
+                # Long button pressed identified
+                self.logger_instance.info(
+                    "RPiInputButton - Long button pressed event for {}".format(
+                        button.description))
+                self._send_button_event(button, "PRESSEDLONG")
+            elif pulse_duration > self.short_press_time:
+                # Button pressed identified
+                self.logger_instance.info(
+                    "RPiInputButton - Button pressed event for {}".format(
+                        button.description))
+                self._send_button_event(button, "PRESSED")
+            else:
+                # If this is the first "short" pulse (this is a pulse that is shorter
+                # than short_press_time) remember this. It could be the start of
+                # a double button pressed
+                if button.press_count == 0:
+                    # Set the Button Pressed count to 1
+                    button.press_count = 1
+                    # Send a short press event if no second press follows in time
+                    button.pending_timer = self.gesture_timers.schedule(
+                        timestamp + self.double_press_time,
+                        self._short_press_expired,
+                        button)
+                else:
+                    # if this is not the first "short" pulse, it's a double press
                     self.logger_instance.info(
-                        "RPiInputButton - Down event detected on board {} pin {} for {}".format(
-                            _get_board_number(key),
-                            _get_pin_number(key),
-                            self._get_button_description(key))
-                        )
-                    # TO-DO: Add code to send "DOWN-event" message to consummer queue(s)
-                    self.process_output_queue_handler.send_message(
-                        self.process_consumers[key], message_pre_able+"DOWN")
-                    # Check to see if we have a Pulse, Long Pulse or Double pulse event
-                    # by assessing the duration of the pulse and the time since the previous pulse
-                    pulse_duration = self._get_button_signaldown_timestamp(key) -\
-                        self._get_button_signalup_timestamp(key)
-                    duration_since_last_pulse = self._get_button_signalup_timestamp(key) -\
-                        self._get_button_previous_signaldown_timestamp(key)
-                    # If the duration since last pulse is more than 1 second
-                    # it can no longer be a Double Pulse event.
-                    if duration_since_last_pulse > 1:
-                        self._reset_button_presscount(key)
-                    if pulse_duration > 0.75:
-                        # Long button pressed identified
-                        self.logger_instance.info(
-                            "RPiInputButton - Long button pressed event for {}".format(
-                                self._get_button_description(key)))
-                        # TO-DO: Add code to send "Long buttong pressed event" message
-                        # to consummer queue(s)
-                        self.process_output_queue_handler.send_message(
-                            self.process_consumers[key],
-                            message_pre_able+"PRESSEDLONG")
-                    elif pulse_duration > 0.25:
-                        # Button pressed identified
-                        self.logger_instance.info(
-                            "RPiInputButton - Button pressed event for {}".format(
-                                self._get_button_description(key)))
-                        # TO-DO: Add code to send "Long buttong pressed event" message
-                        # to consummer queue(s)
-                        self.process_output_queue_handler.send_message(
-                            self.process_consumers[key],
-                            message_pre_able+"PRESSED")
-                    else:
-                        # If this is the first "short" pulse (this is a pulse that is shorter
-                        # than 0,25 seconds) remember this. It could be the start of
-                        # a double button pressed
-                        if self._get_button_presscount(key) == 0:
-                            # Set the Button Pressed count to 1
-                            self._set_button_presscount(key)
-                        else:
-                            # if this is not the first "short" pulse, it's a double press
-                            self.logger_instance.info(
-                                "RPiInputButton - Double button pressed event for {}".format(
-                                    self._get_button_description(key)))
-                            # TO-DO: Add code to send "Long buttong pressed event"
-                            # message to consummer queue(s)
-                            self.process_output_queue_handler.send_message(
-                                self.process_consumers[key],
-                                message_pre_able+"PRESSEDDOUBLE")
-                            # Reset the Button Pressed Count back to 0
-                            self._reset_button_presscount(key)
-
-                #  set "Previous state" to current state
-                self._set_previous_button_state(key, self._get_button_state(key))
+                        "RPiInputButton - Double button pressed event for {}".format(
+                            button.description))
+                    self._send_button_event(button, "PRESSEDDOUBLE")
+                    # Reset the Button Pressed Count back to 0
+                    button.press_count = 0
+
+    def _short_press_expired(self, button):
+        '''
+        method run when a short press was not followed by a second short press
+        within double_press_time. A PRESSEDSHORT event is sent
+        '''
+        if button.pending_timer is not None:
+            self.gesture_timers.cancel(button.pending_timer)
+            button.pending_timer = None
+        button.press_count = 0
+        self.logger_instance.info(
+            "RPiInputButton - Short button pressed event for {}".format(
+                button.description))
+        self._send_button_event(button, "PRESSEDSHORT")
+
+    def apply_process_attribute_changes(self, changes):
+        '''
+        Method to apply the changed entries of the process configuration file. Only the changed
+        buttons are created again, the state of the other buttons is kept. The consumer queues
+        and the input timing are updated when their entries changed. Other entries (for example
+        InputMode or EventExchange) are applied when the process is restarted
+        '''
+        input_buttons = dict(self.input_buttons)
+        buttons_changed = self.update_output_dictionary(self.input_buttons,
+                                                        self.create_inputbutton_list,
+                                                        changes,
+                                                        self.BUTTON_KEYWORD,
+                                                        ("state",
+                                                         "signalup_timestamp",
+                                                         "signaldown_timestamp",
+                                                         "previous_signaldown_timestamp"))
+        for key, button in input_buttons.items():
+            if self.input_buttons.get(key) is not button and button.pending_timer is not None:
+                # The pending short press of a changed or removed button is dropped
+                self.gesture_timers.cancel(button.pending_timer)
+                button.pending_timer = None
+        if buttons_changed:
+            self.input_button_table = self.create_input_button_table()
+            self.input_sampler.set_input_masks(self._get_input_masks())
+            # The state of a new button is set to the last known status of its input
+            input_ports = self.input_sampler.input_ports
+            for key in self.input_buttons.keys() - input_buttons.keys():
+                button = self.input_buttons[key]
+                if button.board_number < len(input_ports):
+                    button.state = (input_ports[button.board_number] >> button.pin_number) & 1
+
+        if buttons_changed or any(self.CONSUMER_KEYWORD.fullmatch(key) for key in changes):
+            self.process_consumers = self.create_message_senders(
+                self.process_attributes.__repr__())
+            self._request_subscriptions()
+
+        if any(self.TIMING_KEYWORD.fullmatch(key) for key in changes):
+            self.input_sampler.debounce_time = self.get_float_attribute("DebounceTime", 0.02)
+            self._set_input_timing()
+
+        restart_keys = sorted(key for key in changes
+                              if not (self.BUTTON_KEYWORD.fullmatch(key) or
+                                      self.CONSUMER_KEYWORD.fullmatch(key) or
+                                      self.TIMING_KEYWORD.fullmatch(key)))
+        if restart_keys:
+            self.logger_instance.warning(
+                "RPiInputButton - {} changed, restart the process to apply".format(
+                    ", ".join(restart_keys)))
 
     def process_message(self, message):
         '''
@@ -448,23 +631,19 @@ class RPiInputButton(RPiProcessFramework, RPiPiface):
             if reply is True and message_list[1] == 'REFRESH_PROCESS_ATTRIBUTES':
                 self.input_buttons = self.create_inputbutton_list(
                     self.process_attributes.__repr__())
+                self.input_button_table = self.create_input_button_table()
                 self.process_consumers = self.create_message_senders(
                     self.process_attributes.__repr__())
+                self.input_sampler.debounce_time = self.get_float_attribute(
+                    "DebounceTime", 0.02)
+                self._set_input_timing()
+                self._synchronize_input_buttons()
+                self._request_subscriptions()
+            elif reply is True and message_list[1] == 'SUBSCRIBE' and len(message_list) == 4:
+                self._subscribe_consumer(message_list[2], message_list[3])
 
         return reply
 
-def _get_board_number(key):
-    '''
-    function that retrieves the button board number
-    '''
-    return int(key[1])
-
-def _get_pin_number(key):
-    '''
-    function that retrieves the button board number
-    '''
-    return int(key[3])
-
 def main():
     '''
     Initiating the RPiInputButton process including:
@@ -473,11 +652,14 @@ def main():
 
     input_handler_instance = RPiInputButton()
 
-    while input_handler_instance.run_process:
-        with input_handler_instance.process_input_queue as consumer:
-            input_handler_instance.run_process = consumer.consume(  # pylint: disable=assignment-from-no-return
-                input_handler_instance.process_message,
-                input_handler_instance.process_input_buttons)
+    input_handler_instance.run(input_handler_instance.process_message,
+                               input_handler_instance.process_input_buttons)
+
+    # Make sure all pending events are sent before we stop
+    input_handler_instance.deactivate_input_interrupts()
+    input_handler_instance.input_sampler.stop()
+    if input_handler_instance.process_async_runtime is None:
+        input_handler_instance.process_output_queue_handler.stop()
 
 if __name__ == '__main__':
     main()
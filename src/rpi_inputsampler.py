@@ -0,0 +1,239 @@
+'''
+Name:		rpi_inputsampler.py
+Purpose:	Class RPiInputSampler is used to sample the digital inputs of the PiFace boards
+            on a dedicated thread and to report the changes in an event ring buffer
+
+Author:
+
+Created:
+Copyright:
+Licence:
+'''
+import threading
+import time
+from array import array
+
+class RPiInputSampler():
+    '''
+    This class is created to sample the input ports independent of the process that
+    handles the input events (for example the message pump of RPiInputButton)
+    The constructor takes following parameters:
+        - read_input_ports => function returning a list with one 8-bit value per board
+          (for example RPiPiface.get_input_ports_state)
+        - event_ring => RPiEventRing instance receiving a (board, pin, state, timestamp)
+          event for each change on an input pin
+        - sample_rate => number of samples per second
+        - log_handler => handle to the logger instance
+    The sampler runs in one of 2 modes:
+        - Fixed rate: the input ports are read every 1/sample_rate seconds. The time of the
+          next sample is calculated from the start time (deadline based), so the sample rate
+          doesn't drift. When a deadline is missed, the missed samples are skipped
+        - Interrupt: the input ports are only read after wake_up() was called, for example by
+          an interrupt event listener
+    Following counters are available:
+        - samples => number of times the input ports were read
+        - overruns => number of sample deadlines that were missed
+        - max_lateness => highest delay in seconds between a deadline and the actual sample
+        - suppressed_bounces => number of changes ignored by the debounce filter
+    Only the input pins set in the input mask of a board are reported (see set_input_masks)
+    Debounce filter: once a change of an input pin is reported, the pin is locked for the
+    debounce time of its board (see set_debounce_times). Changes during the lock are
+    ignored, at the end of the lock the pin is checked again so a final state that differs
+    from the reported state is still reported
+    '''
+    def __init__(self, read_input_ports, event_ring, sample_rate=200, log_handler=None,
+                 debounce_time=0.0):
+        self.logger_instance = log_handler
+
+        self._read_input_ports = read_input_ports
+        self.event_ring = event_ring
+        self.sample_period = 1.0 / max(sample_rate, 1)
+        self.interrupt_mode = False
+
+        # Last known state of the input ports, one 8-bit value per board
+        self.input_ports = []
+        # Input pins to report, one 8-bit mask per board (all pins when not set)
+        self.input_masks = []
+        # Debounce time in seconds, one value per board (debounce_time when not set)
+        self.debounce_time = debounce_time
+        self.debounce_times = []
+        # Debounce filter state: raw value and locked input pins per board, and the
+        # end of the lock of each input pin (board_number * 8 + pin_number)
+        self._raw_ports = []
+        self._locked_pins = []
+        self._lock_end = array('d')
+        self._next_unlock = None
+
+        self.samples = 0
+        self.overruns = 0
+        self.max_lateness = 0.0
+        self.suppressed_bounces = 0
+
+        self._running = False
+        self._wake_up_event = threading.Event()
+        self._wake_up_timestamp = None
+        self._sampler = None
+
+    def __str__(self):
+        if self.interrupt_mode:
+            long_string = "Input sampler: interrupt mode - {} samples - ".format(self.samples)
+        else:
+            long_string = "Input sampler: {:.0f} samples/s - {} samples - ".format(
+                1 / self.sample_period, self.samples)
+            long_string += "{} overruns - max lateness {:.4f}s - ".format(
+                self.overruns, self.max_lateness)
+        long_string += "{} bounces suppressed\n".format(self.suppressed_bounces)
+        long_string += self.event_ring.__str__()
+        return long_string
+
+    def start(self, input_ports=None, interrupt_mode=False):
+        '''
+        method to start the sampler thread
+        input_ports is the initial state of the input ports. Changes compared to this
+        state are reported as events. When omitted, all inputs are considered inactive
+        '''
+        self.stop()
+        self.interrupt_mode = interrupt_mode
+        if input_ports is not None:
+            self.input_ports = list(input_ports)
+        self._running = True
+        self._wake_up_event.clear()
+        self._sampler = threading.Thread(target=self._run,
+                                         name="RPiInputSampler",
+                                         daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        '''
+        method to stop the sampler thread
+        '''
+        if self._sampler is not None:
+            self._running = False
+            self._wake_up_event.set()
+            self._sampler.join()
+            self._sampler = None
+
+    def set_input_masks(self, input_masks):
+        '''
+        method to set the input pins to report, one 8-bit mask per board
+        Boards without a mask report all input pins
+        '''
+        self.input_masks = list(input_masks)
+
+    def set_debounce_times(self, debounce_times):
+        '''
+        method to set the debounce time in seconds, one value per board
+        Boards without a value use the debounce_time passed to the constructor
+        '''
+        self.debounce_times = list(debounce_times)
+
+    def wake_up(self, timestamp=None):
+        '''
+        method to request a sample in interrupt mode
+        timestamp is the time the change was detected, it is used as time stamp
+        for the events. Can be called from any thread
+        '''
+        if self._wake_up_timestamp is None:
+            self._wake_up_timestamp = timestamp
+        self._wake_up_event.set()
+
+    def _sample(self, timestamp):
+        '''
+        method that reads the input ports and pushes an event for each changed input pin
+        '''
+        try:
+            input_ports = self._read_input_ports()
+        except Exception as err:    # pylint: disable=broad-except
+            if self.logger_instance is not None:
+                self.logger_instance.error(
+                    "RPiInputSampler - Unable to read input ports - {}".format(err))
+            return
+        self.samples += 1
+        if len(self._locked_pins) != len(input_ports):
+            if len(self.input_ports) != len(input_ports):
+                self.input_ports = [0] * len(input_ports)
+            self._raw_ports = list(self.input_ports)
+            self._locked_pins = [0] * len(input_ports)
+            self._lock_end = array('d', bytes(64 * len(input_ports)))
+
+        now = time.monotonic()
+        next_unlock = None
+        input_masks = self.input_masks
+        debounce_times = self.debounce_times
+        for board_number, port_value in enumerate(input_ports):
+            locked = self._locked_pins[board_number]
+            if locked:
+                # Release the input pins at the end of their lock
+                pins = locked
+                while pins:
+                    bit = pins & -pins
+                    pins ^= bit
+                    lock_end = self._lock_end[board_number * 8 + bit.bit_length() - 1]
+                    if lock_end <= now:
+                        locked ^= bit
+                    elif next_unlock is None or lock_end < next_unlock:
+                        next_unlock = lock_end
+                bounces = (port_value ^ self._raw_ports[board_number]) & locked
+                if bounces:
+                    self.suppressed_bounces += bin(bounces).count("1")
+            self._raw_ports[board_number] = port_value
+
+            changed = (port_value ^ self.input_ports[board_number]) & ~locked & 0xFF
+            if changed:
+                self.input_ports[board_number] ^= changed
+                if board_number < len(input_masks):
+                    changed &= input_masks[board_number]
+                if board_number < len(debounce_times):
+                    debounce_time = debounce_times[board_number]
+                else:
+                    debounce_time = self.debounce_time
+                # Only visit the input pins that changed, lowest pin first
+                while changed:
+                    bit = changed & -changed
+                    changed ^= bit
+                    pin_number = bit.bit_length() - 1
+                    self.event_ring.push(board_number,
+                                         pin_number,
+                                         1 if port_value & bit else 0,
+                                         timestamp)
+                    if debounce_time > 0:
+                        locked |= bit
+                        self._lock_end[board_number * 8 + pin_number] = now + debounce_time
+                        if next_unlock is None or now + debounce_time < next_unlock:
+                            next_unlock = now + debounce_time
+            self._locked_pins[board_number] = locked
+        self._next_unlock = next_unlock
+
+    def _run(self):
+        '''
+        Sampler thread
+        '''
+        next_sample = time.monotonic()
+        while self._running:
+            if self.interrupt_mode:
+                if self._next_unlock is None:
+                    self._wake_up_event.wait()
+                else:
+                    # Check the locked input pins again at the end of the debounce time
+                    self._wake_up_event.wait(max(self._next_unlock - time.monotonic(), 0))
+                self._wake_up_event.clear()
+                timestamp = self._wake_up_timestamp
+                self._wake_up_timestamp = None
+                if self._running:
+                    self._sample(timestamp if timestamp is not None else time.time())
+                continue
+
+            delay = next_sample - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            lateness = time.monotonic() - next_sample
+            if lateness > self.max_lateness:
+                self.max_lateness = lateness
+            self._sample(time.time())
+
+            next_sample += self.sample_period
+            if lateness > self.sample_period:
+                # We missed at least one deadline, skip the missed samples
+                self.overruns += int(lateness / self.sample_period)
+                next_sample += int(lateness / self.sample_period) * self.sample_period
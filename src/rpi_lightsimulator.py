@@ -166,7 +166,7 @@ class RPiLightSimulator(RPiProcessFramework):
                         scenario,\
                         activate_time, activate_event,\
                         inactivate_time, inactivate_event,\
-                        message_queue = value.split(";")
+                        message_queue = self.split_attribute_value(value)
 
                         scenario_list_item = [
                             activate_time,
@@ -366,6 +366,24 @@ class RPiLightSimulator(RPiProcessFramework):
             self.logger_instance.warning(
                 "RPILightSimulator - Invalid simulation event received {} - skipping".format(message))
 
+    def apply_process_attribute_changes(self, changes):
+        '''
+        Method to apply the changed entries of the process configuration file. The schedule
+        dictionary and the consumer queues are created again. An active scenario with changed
+        actions is activated again, an active scenario that was removed is deactivated. The
+        other active scenarios keep their scheduled jobs
+        '''
+        schedule_dict = self.schedule_dict
+        self.schedule_dict = self.create_schedule_dict(self.process_attributes.__repr__())
+        self.process_consumers = self.create_message_senders(self.process_attributes.__repr__())
+
+        active_scenarios = {tag for job in schedule.jobs for tag in job.tags}
+        for scenario in active_scenarios:
+            if scenario not in self.schedule_dict:
+                self.deactivate_scenario(scenario)
+            elif schedule_dict.get(scenario) != self.schedule_dict[scenario]:
+                self.activate_scenario(scenario)
+
     def process_message(self, message):
         '''
         Function responsible to handle messages coming from the process
@@ -404,6 +422,8 @@ class RPiLightSimulator(RPiProcessFramework):
         '''
         time.sleep(0.5)
         schedule.run_pending()
+        # Keep the connection to the message exchange alive between scheduled messages
+        self.process_output_queue_handler.process_heartbeats()
 
 
 def main():
@@ -412,11 +432,8 @@ def main():
     '''
     lightsimulator_handler_instance = RPiLightSimulator()
 
-    while lightsimulator_handler_instance.run_process:
-        with lightsimulator_handler_instance.process_input_queue as consumer:
-            lightsimulator_handler_instance.run_process = consumer.consume(  # pylint: disable=assignment-from-no-return
-                lightsimulator_handler_instance.process_message,
-                lightsimulator_handler_instance.process_simulation_message)
+    lightsimulator_handler_instance.run(lightsimulator_handler_instance.process_message,
+                                        lightsimulator_handler_instance.process_simulation_message)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -178,6 +178,13 @@ class RPiLogger(): # pylint: disable=too-many-arguments
         '''
         return self._homedomotica_logger.getEffectiveLevel()
 
+    def is_debug_enabled(self):
+        '''
+        is_debug_enabled returns True when "DEBUG" messages are logged by the
+        _homedomotica_logger class, so building a debug message can be skipped when it isn't
+        '''
+        return self._homedomotica_logger.isEnabledFor(logging.DEBUG)
+
     def enable_logfile_logging(self):
         '''
         Function that enables logging to logfile
@@ -22,6 +22,7 @@ class RPiMessageConsumer():
     - 'queueName'
     - 'exchangeName'
     - 'routingKey'
+    - 'bindingKeys' => list of additional routing keys the queue is bound to (default none)
     - 'host'
     - 'exchangeType'
     - 'exchangePassive'
@@ -33,6 +34,14 @@ class RPiMessageConsumer():
     - 'queueExclusive'
     - 'queueAutoDelete'
     - 'sleepTime'
+    - 'consumeMode'
+    - 'tickTime'
+    - 'topicExchangeName'
+    - 'drainMaxMessages'
+    - 'drainMaxTime'
+    - 'prefetchCount'
+    - 'ackBatchSize'
+    - 'ackBatchTime'
     After creation of the RPiMessageConsumer instance, reading messages from the queue can be
     invoked using the "consume" method. This method takes 2 call back functions as paramaters
     - the first function is triggered when a message was read from the queue
@@ -44,15 +53,49 @@ class RPiMessageConsumer():
     - the second function is run when no message was available on the queue
     - A sleep time, provided by the 'sleepTime' configuration parameter each time no message was
       found on the queue
+    Two consume modes are available, selected by the 'consumeMode' configuration parameter:
+    - 'poll' => the queue is polled (basic_get). When the queue is empty the second call back
+      function is run, followed by a sleep of 'sleepTime' seconds
+    - 'push' => the broker pushes messages to the consumer (basic_consume). The second call back
+      function is run on a fixed tick of 'tickTime' seconds and after each batch of received
+      messages, so no polling of the broker is required
+    In both modes the second call back function is also run after at most 'drainMaxMessages'
+    messages or 'drainMaxTime' seconds of handling messages, so the process keeps driving its
+    outputs and timers while a burst of messages is handled (0 = no limit)
+    Flow control and acknowledgements:
+    - 'prefetchCount' => maximum number of unacknowledged messages the broker delivers in 'push'
+      mode (0 = no limit)
+    - 'ackBatchSize', 'ackBatchTime' => messages are acknowledged with a single cumulative ack
+      every 'ackBatchSize' messages or 'ackBatchTime' seconds (0 = no time limit), whichever
+      comes first. Pending acks are also sent each time the second call back function is run,
+      and before the message pump stops (default: each message is acknowledged separately)
+    When a 'topicExchangeName' is configured, the queue can also be bound to this (durable)
+    topic exchange using the routing key patterns set by set_topic_bindings
+    The next_deadline attribute can be set to a function returning the time (time.monotonic)
+    the second call back function must be run next (for example when a timer expires), or
+    None. The message pump wakes up at that time instead of waiting for the next tick or
+    the end of the sleep time
     '''
 
     def __init__(self, config):
+        self._run_message_pump = True
+        self._messages_received = 0
+        self._slice_messages = 0
+        self._slice_start = 0.0
+        self._ack_delivery_tag = None
+        self._ack_count = 0
+        self._ack_start = 0.0
+        self._channel = None
+        self._topic_bindings = set()
+        self._topic_bindings_applied = set()
+        self.next_deadline = None
         if config.get('queueName') is None:
             self.config = None
         else:
             self.config = {}
             self.config['queueName'] = config.get('queueName')
             self.config['routingKey'] = config.get('routingKey', self.config['queueName'])
+            self.config['bindingKeys'] = config.get('bindingKeys', [])
             self.config['exchangeName'] = config.get('exchangeName', 'HOMEDOMOTICA')
             self.config['host'] = config.get('host', 'localhost')
             self.config['exchangeType'] = config.get('exchangeType', 'direct')
@@ -65,6 +108,14 @@ class RPiMessageConsumer():
             self.config['queueExclusive'] = config.get('queueExclusive', False)
             self.config['queueAutoDelete'] = config.get('queueAutoDelete', False)
             self.config['sleepTime'] = config.get('sleepTime', 0.1)
+            self.config['consumeMode'] = config.get('consumeMode', 'poll')
+            self.config['tickTime'] = config.get('tickTime', self.config['sleepTime'])
+            self.config['topicExchangeName'] = config.get('topicExchangeName')
+            self.config['drainMaxMessages'] = config.get('drainMaxMessages', 0)
+            self.config['drainMaxTime'] = config.get('drainMaxTime', 0)
+            self.config['prefetchCount'] = config.get('prefetchCount', 0)
+            self.config['ackBatchSize'] = config.get('ackBatchSize', 1)
+            self.config['ackBatchTime'] = config.get('ackBatchTime', 0)
 
     def __enter__(self):
         self.connection = self._create_connection() # pylint: disable=attribute-defined-outside-init
@@ -92,16 +143,202 @@ class RPiMessageConsumer():
         channel.queue_bind(queue=self.config['queueName'],
                            exchange=self.config['exchangeName'],
                            routing_key=self.config['routingKey'])
+        for routing_key in self.config['bindingKeys']:
+            channel.queue_bind(queue=self.config['queueName'],
+                               exchange=self.config['exchangeName'],
+                               routing_key=routing_key)
+
+        self.attach_channel(channel)
+
+        if self.config['consumeMode'] == 'push':
+            return self._consume_push(channel, message_received_callback,
+                                      no_message_received_callback)
 
         run_message_pump = True
         while run_message_pump is True:
-            method, header, body = channel.basic_get(queue=self.config['queueName'])    # pylint: disable=unused-variable
-            if method is None:
-                no_message_received_callback()
-                time.sleep(self.config['sleepTime'])
-            else:
+            # Handle messages until the queue is empty or the time slice is used
+            self.start_slice()
+            queue_empty = False
+            while run_message_pump is True:
+                method, header, body = channel.basic_get(queue=self.config['queueName'])    # pylint: disable=unused-variable
+                if method is None:
+                    queue_empty = True
+                    break
                 run_message_pump = message_received_callback(body.decode())
-                channel.basic_ack(delivery_tag=method.delivery_tag)
+                self.ack_message(channel, method.delivery_tag)
+                if self.end_of_slice():
+                    break
+            if run_message_pump is not True:
+                break
+            self.flush_acks(channel)
+            no_message_received_callback()
+            if queue_empty:
+                time.sleep(self._time_to_wake_up(time.monotonic() + self.config['sleepTime']))
+
+        self.flush_acks(channel)
+
+        return run_message_pump
+
+    def ack_message(self, channel, delivery_tag):
+        '''
+        Acknowledge a message. The ack is delayed until 'ackBatchSize' messages are handled
+        or the first delayed ack is 'ackBatchTime' seconds old (when set), then all messages up
+        to and including delivery_tag are acknowledged at once
+        '''
+        if self._ack_count == 0:
+            self._ack_start = time.monotonic()
+        self._ack_delivery_tag = delivery_tag
+        self._ack_count += 1
+        if self._ack_count >= self.config['ackBatchSize'] or\
+           0 < self.config['ackBatchTime'] <= time.monotonic() - self._ack_start:
+            self.flush_acks(channel)
+
+    def flush_acks(self, channel):
+        '''
+        Send the delayed acks (if any)
+        '''
+        if self._ack_count > 0:
+            channel.basic_ack(delivery_tag=self._ack_delivery_tag, multiple=True)
+            self._ack_delivery_tag = None
+            self._ack_count = 0
+
+    def start_slice(self):
+        '''
+        Start a new time slice for handling messages
+        '''
+        self._slice_messages = 0
+        self._slice_start = time.monotonic()
+
+    def end_of_slice(self):
+        '''
+        Count a handled message and check if the 'drainMaxMessages' or 'drainMaxTime'
+        limit of the time slice is reached
+        '''
+        self._slice_messages += 1
+        if 0 < self.config['drainMaxMessages'] <= self._slice_messages:
+            return True
+        if 0 < self.config['drainMaxTime'] <= time.monotonic() - self._slice_start:
+            return True
+        return False
+
+    def _consume_push(self, channel, message_received_callback, no_message_received_callback):
+        '''
+        Message pump used in 'push' mode. Messages are delivered by the broker and handled
+        while waiting for the next tick. The 'no_message_received_callback' function is run
+        every 'tickTime' seconds and as soon as a batch of messages has been handled, so
+        changes triggered by a message are not delayed until the next tick.
+        The broker can deliver a large batch of messages at once, so the function is also run
+        from within the batch each time the time slice is used.
+        '''
+        self._run_message_pump = True
+        self._messages_received = 0
+        self.start_slice()
+
+        def on_message(chan, method, properties, body):    # pylint: disable=unused-argument
+            if self._run_message_pump is True:
+                self._run_message_pump = message_received_callback(body.decode())
+                self._messages_received += 1
+                self.ack_message(chan, method.delivery_tag)
+                if self._run_message_pump is True and self.end_of_slice():
+                    self._messages_received = 0
+                    self.flush_acks(chan)
+                    no_message_received_callback()
+                    self.start_slice()
+            else:
+                # A STOP message was already received, leave the message on the queue
+                self.flush_acks(chan)
+                chan.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+
+        if self.config['prefetchCount'] > 0:
+            channel.basic_qos(prefetch_count=self.config['prefetchCount'])
+
+        consumer_tag = channel.basic_consume(queue=self.config['queueName'],
+                                             on_message_callback=on_message)
+
+        next_tick = time.monotonic()
+        while self._run_message_pump is True:
+            self.connection.process_data_events(time_limit=self._time_to_wake_up(next_tick))
+            if self._run_message_pump is not True:
+                break
+            now = time.monotonic()
+            if now >= next_tick or self._messages_received > 0 or self._deadline_expired(now):
+                self._messages_received = 0
+                self.flush_acks(channel)
+                no_message_received_callback()
+                self.start_slice()
+                if now >= next_tick:
+                    next_tick += self.config['tickTime']
+                    if next_tick < now:
+                        # We are running late, don't try to catch up on the missed ticks
+                        next_tick = now + self.config['tickTime']
+
+        self.flush_acks(channel)
+        channel.basic_cancel(consumer_tag)
+
+        return self._run_message_pump
+
+    def _time_to_wake_up(self, wake_up):
+        '''
+        Return value is the time in seconds until wake_up or the next deadline (see
+        next_deadline), whichever comes first
+        '''
+        if self.next_deadline is not None:
+            deadline = self.next_deadline()
+            if deadline is not None and deadline < wake_up:
+                wake_up = deadline
+        return max(wake_up - time.monotonic(), 0)
+
+    def _deadline_expired(self, now):
+        '''
+        Return value is True when the next deadline (see next_deadline) has expired
+        '''
+        if self.next_deadline is None:
+            return False
+        deadline = self.next_deadline()
+        return deadline is not None and deadline <= now
+
+    def attach_channel(self, channel):
+        '''
+        This method sets the channel used to consume the queue, so the acks and the topic
+        bindings are sent on this channel. Used by consume and by RPiAsyncRuntime
+        When a 'topicExchangeName' is configured, the topic exchange is declared and the
+        queue is bound to the routing keys set by set_topic_bindings
+        '''
+        self._channel = channel
+        self._ack_delivery_tag = None
+        self._ack_count = 0
+        if self.config['topicExchangeName'] is not None:
+            channel.exchange_declare(exchange=self.config['topicExchangeName'],
+                                     exchange_type='topic',
+                                     durable=True)
+            self._topic_bindings_applied = set()
+            self._apply_topic_bindings()
+
+    def set_topic_bindings(self, routing_keys):
+        '''
+        This method sets the routing key patterns the queue is bound to on the topic exchange
+        When the queue is being consumed, the bindings are updated immediately, otherwise
+        they are created when consume is started.
+        '''
+        self._topic_bindings = set(routing_keys)
+        if self._channel is not None and self._channel.is_open:
+            self._apply_topic_bindings()
+
+    def _apply_topic_bindings(self):
+        '''
+        Only the bindings that changed since they were last applied are sent to the broker
+        '''
+        if self.config['topicExchangeName'] is None:
+            return
+        for routing_key in self._topic_bindings - self._topic_bindings_applied:
+            self._channel.queue_bind(queue=self.config['queueName'],
+                                     exchange=self.config['topicExchangeName'],
+                                     routing_key=routing_key)
+        for routing_key in self._topic_bindings_applied - self._topic_bindings:
+            self._channel.queue_unbind(queue=self.config['queueName'],
+                                       exchange=self.config['topicExchangeName'],
+                                       routing_key=routing_key)
+        self._topic_bindings_applied = set(self._topic_bindings)
 
     def _create_exchange(self, channel):
         channel.exchange_declare(exchange=self.config['exchangeName'],
@@ -0,0 +1,150 @@
+'''
+Name:		rpi_messageoutbox.py
+Purpose:	Class RPiMessageOutbox is used to send messages from a background thread
+            so the calling process never has to wait for the message exchange
+
+Author:
+
+Created:
+Copyright:
+Licence:
+'''
+import queue
+import threading
+import time
+
+from rpi_messagesender import RPiMessageSender
+
+class RPiMessageOutbox():
+    '''
+    This class is created to send messages without blocking the calling process
+    Messages are put in a bounded in-process queue (the outbox) and a dedicated
+    publisher thread takes them from the outbox and sends them using an RPiMessageSender
+    instance. The constructor takes the same configuration dictionary as the
+    RPiMessageSender class, extended with:
+    - 'outboxSize' => maximum number of messages waiting in the outbox (default 100)
+    When the outbox is full, new messages are dropped (and counted) so the calling
+    process is never blocked.
+    While the outbox is empty, the publisher thread services the connection every
+    heartbeat/2 seconds (see RPiMessageSender.process_heartbeats), so the first message
+    after a quiet period is sent on a live connection.
+    Following counters are available:
+        - messages_sent => number of messages taken from the outbox and sent
+        - messages_dropped => number of messages dropped because the outbox was full
+        - max_queue_depth => highest number of messages found in the outbox
+        - last_latency, max_latency => time in seconds between putting a message
+          in the outbox and the moment it was sent
+    '''
+    def __init__(self, config=None, log_handler=None):
+        # Initiate Logger function so we can start logging stuff
+        self.logger_instance = log_handler
+
+        self.config = config
+        self.config['outboxSize'] = config.get('outboxSize', 100)
+
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.max_queue_depth = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self._total_latency = 0.0
+
+        self._outbox = queue.Queue(maxsize=self.config['outboxSize'])
+        self._message_sender = RPiMessageSender(config, log_handler)
+        self._publisher = threading.Thread(target=self._publish_messages,
+                                           name="RPiMessageOutbox",
+                                           daemon=True)
+        self._publisher.start()
+
+    def __repr__(self):
+        return self.config
+
+    def __str__(self):
+        if self.messages_sent > 0:
+            average_latency = self._total_latency / self.messages_sent
+        else:
+            average_latency = 0.0
+        long_string = "Outbox queue depth: {} (max {} of {})\n".format(
+            self._outbox.qsize(),
+            self.max_queue_depth,
+            self.config['outboxSize'])
+        long_string += "Outbox messages sent: {} - dropped: {}\n".format(
+            self.messages_sent,
+            self.messages_dropped)
+        long_string += "Outbox publish latency: last {:.4f}s - average {:.4f}s - max {:.4f}s\n".\
+            format(self.last_latency, average_latency, self.max_latency)
+        return long_string
+
+    def send_message(self, queue_list, message, topic=False):
+        '''
+        method that puts a message for the queues in queue_list in the outbox
+        The message is sent by the publisher thread. In case the outbox is full
+        the message is dropped.
+        When topic is True, the message is published to the topic exchange and the
+        entries of queue_list are used as routing keys (see RPiMessageSender)
+        '''
+        try:
+            self._outbox.put_nowait((queue_list, message, topic, time.monotonic()))
+        except queue.Full:
+            self.messages_dropped += 1
+            if self.logger_instance is not None:
+                self.logger_instance.warning(
+                    "RPiMessageOutbox - Outbox full, dropping message {} to queue(s) {}".format(
+                        message,
+                        queue_list))
+            return
+
+        queue_depth = self._outbox.qsize()
+        if queue_depth > self.max_queue_depth:
+            self.max_queue_depth = queue_depth
+
+    def stop(self, timeout=5):
+        '''
+        method that stops the publisher thread once all messages in the outbox are sent
+        '''
+        try:
+            self._outbox.put(None, timeout=timeout)
+        except queue.Full:
+            pass    # Publisher thread is stuck, it's a daemon thread so we just leave it
+        self._publisher.join(timeout)
+
+    def _publish_messages(self):
+        '''
+        Publisher thread: sends the messages in the outbox until stop() is called
+        '''
+        idle_time = None    # No heartbeats are negotiated when the heartbeat is set to 0
+        if self._message_sender.config['heartbeat']:
+            idle_time = self._message_sender.config['heartbeat'] / 2
+        while True:
+            try:
+                item = self._outbox.get(timeout=idle_time)
+            except queue.Empty:
+                self._message_sender.process_heartbeats()
+                continue
+            if item is None:
+                break
+            queue_list, message, topic, queued_time = item
+            self._message_sender.send_message(queue_list, message, topic)
+
+            self.last_latency = time.monotonic() - queued_time
+            self._total_latency += self.last_latency
+            if self.last_latency > self.max_latency:
+                self.max_latency = self.last_latency
+            self.messages_sent += 1
+
+        self._message_sender.close()
+
+def main():
+    '''
+    main function used mainly for testing purposes
+    '''
+    print("Hello world! I'm the Message Outbox class")
+    message_outbox_instance = RPiMessageOutbox({'exchangeName': 'HOMEDOMOTICA',
+                                                'host': 'localhost'})
+    message_outbox_instance.send_message(["TESTQUEUE"], "Test message")
+    message_outbox_instance.stop()
+    print(message_outbox_instance)
+    print("Bye world")
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,7 @@ Copyright:	(c) Wim 2018
 Licence:
 '''
 import pika
+from pika.exceptions import AMQPError
 
 class RPiMessageSender():
     '''
@@ -17,9 +18,22 @@ class RPiMessageSender():
         - queue_name => Name of the message queue
         - connection => Handle to the connection to the message queue
         - channel => Handle to the channel within the connection
+        - exchange_declared => boolean to indicate the exchange was already (passively) declared
+          on the channel
+        - topic_exchange_declared => boolean to indicate the topic exchange was already
+          declared on the channel
     Queue's are created by the "receiver". In case a queue doesn't exist
     an error message is logged and no instance of the RPiMessageSender class
     is created
+    The connection and channel are kept open between messages. They are (re)created
+    when needed, so a message only costs a single publish on the existing channel
+    The configuration dictionary can hold a 'heartbeat' entry: the heartbeat timeout in
+    seconds negotiated with the broker (default 60). An idle connection is only kept
+    alive when process_heartbeats is called at least every heartbeat/2 seconds
+    The configuration dictionary can hold a 'topicExchangeName' entry. Messages sent with
+    topic=True are published to this (durable) topic exchange, using the entries of
+    queue_list as routing keys, so the broker delivers them to all queues bound to a
+    matching pattern
     '''
     def __init__(self, config=None, log_handler=None):
         # Initiate Logger function so we can start logging stuf
@@ -30,6 +44,13 @@ class RPiMessageSender():
         self.config['exchangeName'] = config.get('exchangeName', 'HOMEDOMOTICA')
         self.config['port'] = config.get('port', 5672)
         self.config['virtualHost'] = config.get('virtualHost', '/')
+        self.config['topicExchangeName'] = config.get('topicExchangeName')
+        self.config['heartbeat'] = config.get('heartbeat', 60)
+
+        self.connection = None
+        self.channel = None
+        self.exchange_declared = False
+        self.topic_exchange_declared = False
 
     def __repr__(self):
         return self.config
@@ -37,46 +58,133 @@ class RPiMessageSender():
     def _create_connection(self):
         parameters = pika.ConnectionParameters(self.config['host'],
                                                self.config['port'],
-                                               self.config['virtualHost'])
+                                               self.config['virtualHost'],
+                                               heartbeat=self.config['heartbeat'])
 
         return pika.BlockingConnection(parameters)
 
-    def send_message(self, queue_list, message):
+    def _get_channel(self, topic=False):
+        '''
+        method that returns an open channel on the message exchange
+        The connection and channel are only created when they don't exist yet or
+        when they were closed (for example by the broker)
+        '''
+        if self.connection is not None and self.connection.is_open:
+            # Handle pending events (heartbeats, close requests from the broker) so
+            # a connection that was lost is detected before we publish on it
+            self.connection.process_data_events(time_limit=0)
+
+        if self.connection is None or not self.connection.is_open:
+            self.connection = self._create_connection()
+            self.channel = None
+            if self.logger_instance is not None:
+                self.logger_instance.debug(
+                    "RPiMessageSender - Connected to {}".format(self.config['host']))
+
+        if self.channel is None or not self.channel.is_open:
+            self.channel = self.connection.channel()
+            self.exchange_declared = False
+            self.topic_exchange_declared = False
+
+        if topic:
+            if not self.topic_exchange_declared:
+                self.channel.exchange_declare(exchange=self.config['topicExchangeName'],
+                                              exchange_type='topic',
+                                              durable=True)
+                self.topic_exchange_declared = True
+        elif not self.exchange_declared:
+            self.channel.exchange_declare(exchange=self.config['exchangeName'],
+                                          passive=True)
+            self.exchange_declared = True
+
+        return self.channel
+
+    def process_heartbeats(self):
         '''
-        method that will
-        1) connect to a message exchange
-        2) send a message to this message exchange
-        3) disconnects from the message exchage
+        method that services the connection between messages, so heartbeats are sent and
+        received and the broker doesn't close an idle connection
+        A connection that was lost is closed, a new one is created for the next message
         '''
-        connection = None
+        if self.connection is None or not self.connection.is_open:
+            return
         try:
-            connection = self._create_connection()
-            channel = connection.channel()
+            self.connection.process_data_events(time_limit=0)
+        except AMQPError as err:
+            if self.logger_instance is not None:
+                self.logger_instance.warning(
+                    "RPiMessageSender - Connection lost while idle ({})".format(repr(err)))
+            self.close()
 
-            channel.exchange_declare(exchange=self.config['exchangeName'],
-                                     passive=True)
+    def close(self):
+        '''
+        method that closes the connection to the message exchange (if any)
+        '''
+        try:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.close()
+        except AMQPError:
+            pass    # The connection is gone anyway
+        self.connection = None
+        self.channel = None
+        self.exchange_declared = False
+        self.topic_exchange_declared = False
 
-            if queue_list is not None:
-                for routingkey in queue_list:
-                    channel.basic_publish(exchange=self.config['exchangeName'],
-                                          routing_key=routingkey,
+    def send_message(self, queue_list, message, topic=False):
+        '''
+        method that will send a message to the message exchange for each
+        queue in queue_list.
+        The connection to the message exchange is reused between calls. In case the
+        connection was lost, a new connection is created and sending the message
+        is retried once for the queues that did not receive the message yet
+        When topic is True, the message is published to the topic exchange and the
+        entries of queue_list are used as routing keys
+        '''
+        if queue_list is None:
+            return
+
+        pending_queues = list(queue_list)
+        if topic:
+            exchange_name = self.config['topicExchangeName']
+        else:
+            exchange_name = self.config['exchangeName']
+        for attempt in range(2):
+            try:
+                channel = self._get_channel(topic)
+                while pending_queues:
+                    channel.basic_publish(exchange=exchange_name,
+                                          routing_key=pending_queues[0],
                                           body=message)
                     if self.logger_instance is not None:
                         self.logger_instance.debug(
                             "RPiMessageSender - send message {} to queue {}".format(
                                 message,
-                                routingkey)
+                                pending_queues[0])
                             )
-        except Exception as err:    # pylint: disable=broad-except
-            if self.logger_instance is not None:
-                self.logger_instance.error(
-                    "RPiMessageSender - Unable to send message {} to queue(s) {} - {}".format(
-                        message,
-                        queue_list,
-                        err))
-        finally:
-            if connection:
-                connection.close()
+                    pending_queues.pop(0)
+                return
+            except AMQPError as err:
+                # Connection or channel is no longer usable, start over with a new one
+                self.close()
+                if attempt == 0:
+                    if self.logger_instance is not None:
+                        self.logger_instance.warning(
+                            "RPiMessageSender - Connection lost ({}), reconnecting".format(
+                                repr(err)))
+                    continue
+                if self.logger_instance is not None:
+                    self.logger_instance.error(
+                        "RPiMessageSender - Unable to send message {} to queue(s) {} - {}".format(
+                            message,
+                            pending_queues,
+                            repr(err)))
+            except Exception as err:    # pylint: disable=broad-except
+                if self.logger_instance is not None:
+                    self.logger_instance.error(
+                        "RPiMessageSender - Unable to send message {} to queue(s) {} - {}".format(
+                            message,
+                            pending_queues,
+                            err))
+                return
 
 def main():
     '''
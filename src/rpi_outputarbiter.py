@@ -0,0 +1,230 @@
+'''
+Name:		rpi_outputarbiter.py
+Purpose:	Class RPiOutputArbiter owns the PiFace boards and writes the outputs requested
+            by the output processes, so only one process writes to the boards
+
+Author:
+
+Created:
+Copyright:
+Licence:
+'''
+import os
+import socket
+import time
+
+from rpi_processframework import RPiProcessFramework
+from rpi_piface import RPiPiface
+
+DEFAULT_SOCKET = "/tmp/rpi_outputarbiter.sock"
+
+class RPiOutputArbiter(RPiProcessFramework, RPiPiface):
+    '''
+    This class is created to serialise the writes to the PiFace boards of several output
+    processes (for example rpi_outputlights and rpi_outputrelay, which share output pin 0 and 1).
+    The output processes send the output pins they manage and their desired state to the
+    socket of the arbiter (see RPiPiface, 'OutputArbiter' entry in the configuration file)
+    using following message: "<client name>;<board>,<mask>,<value>;..."
+    Every tick the messages received are merged into one output value per board and each
+    board with changed outputs is written with a single write.
+    An output pin claimed by more than one process is a conflict: the process that claimed
+    the pin first keeps it and a warning is logged.
+    Following attributes are inherited from the RPiProcessFramework class:
+        - run_process => boolean to indicate if process should be running
+        - process_attributes => dictionary containing all attribues used by this process
+        - process_input_queue => Handle to the input queue
+        - logger_instance => Handle to the logger instance
+    Following attributes are defined in the RPiOutputArbiter class:
+        - socket_path => path of the unix domain socket the updates are received on
+        - claim_timeout => time in seconds after which the outputs of a process that
+          didn't send an update are released
+        - output_claims => list with, for each board, a dictionary where
+            - The key is set as the name of the process (client)
+            - The corresponding value is a list [mask, value, timestamp of the last update]
+        - claimed_mask => list with, for each board, the output pins claimed by any client
+          at the previous merge. Pins that are no longer claimed are switched off once
+        - updates_received, invalid_updates, conflicts => counters
+    '''
+    def __init__(self):
+        # Initialize process framework attributes so we can start using them
+        RPiProcessFramework.__init__(self, default_log_level='INFO')
+
+        # The arbiter is the only process initializing the PiFace boards
+        RPiPiface.__init__(self)
+        if self.get_number_of_boards() == 0:
+            self.logger_instance.critical(
+                "RPiOutputArbiter - No PiFace boards detected. \
+                Unable to process output signals"
+                )
+            self.run_process = False    # No need to continue
+        else:
+            self.logger_instance.info(
+                "RPiOutputArbiter - {} PiFace boards detected".format(
+                    self.get_number_of_boards()))
+
+        self.output_claims = [{} for board in range(0, self.number_of_boards)]
+        self.claimed_mask = [0] * self.number_of_boards
+        self.claim_timeout = self.get_float_attribute("ArbiterClaimTimeout", 30.0)
+        self.updates_received = 0
+        self.invalid_updates = 0
+        self.conflicts = 0
+        self._reported_conflicts = set()
+
+        self.socket_path = self.process_attributes.get_item("OutputArbiter")
+        if self.socket_path is None:
+            self.socket_path = DEFAULT_SOCKET
+        self.arbiter_socket = self.open_socket(self.socket_path)
+        if self.arbiter_socket is None:
+            self.run_process = False    # No need to continue
+
+    def __del__(self):
+        if getattr(self, "arbiter_socket", None) is not None:
+            self.arbiter_socket.close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+        self.logger_instance.info("RPiOutputArbiter - Process Stopping!")
+
+    def __str__(self):
+        long_string = RPiProcessFramework.__str__(self)
+        long_string += RPiPiface.__str__(self)
+        long_string += "Output arbiter {}: {} updates - {} invalid - {} conflicts\n".format(
+            self.socket_path,
+            self.updates_received,
+            self.invalid_updates,
+            self.conflicts)
+        for board_number, claims in enumerate(self.output_claims):
+            for client, claim in claims.items():
+                long_string += "Board {} - {}: mask {:08b} value {:08b}\n".format(
+                    board_number,
+                    client,
+                    claim[0],
+                    claim[1])
+
+        return long_string
+
+    def open_socket(self, socket_path):
+        '''
+        Return value is the non blocking unix domain (datagram) socket bound to socket_path,
+        None when the socket can't be created
+        '''
+        try:
+            if os.path.exists(socket_path):
+                # Left behind by a previous instance
+                os.unlink(socket_path)
+            arbiter_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            arbiter_socket.bind(socket_path)
+            arbiter_socket.setblocking(False)
+        except OSError as err:
+            self.logger_instance.critical(
+                "RPiOutputArbiter - Unable to open socket {} - {}".format(socket_path, err))
+            return None
+
+        return arbiter_socket
+
+    def process_update(self, update, timestamp):
+        '''
+        method that stores the outputs requested in an update message:
+        "<client name>;<board>,<mask>,<value>;..."
+        Boards not in the message are released for this client
+        '''
+        update_list = update.split(";")
+        client = update_list[0]
+        requested = {}
+        try:
+            for board_update in update_list[1:]:
+                board_number, mask, value = (int(item) for item in board_update.split(","))
+                if not 0 <= board_number < self.number_of_boards:
+                    raise ValueError("board {} not available".format(board_number))
+                requested[board_number] = (mask & 0xFF, value & mask & 0xFF)
+        except ValueError as err:
+            self.invalid_updates += 1
+            self.logger_instance.warning(
+                "RPiOutputArbiter - Invalid update {} - {}".format(update, err))
+            return
+
+        self.updates_received += 1
+        for board_number, claims in enumerate(self.output_claims):
+            if board_number in requested:
+                mask, value = requested[board_number]
+                claims[client] = [mask, value, timestamp]
+            elif client in claims:
+                del claims[client]
+
+    def merge_output_ports(self, timestamp):
+        '''
+        method that merges the outputs claimed by all clients into the shadow output
+        registers. Claims which were not updated within claim_timeout are released
+        Output pins released since the previous merge (timed out claim or update message
+        without the board) are switched off with the next write, they are not managed
+        anymore afterwards
+        '''
+        for board_number, claims in enumerate(self.output_claims):
+            for client in [client for client, claim in claims.items()
+                           if timestamp - claim[2] > self.claim_timeout]:
+                self.logger_instance.warning(
+                    "RPiOutputArbiter - No update from {} - releasing outputs of board {}".format(
+                        client,
+                        board_number))
+                del claims[client]
+
+            mask = 0
+            value = 0
+            for client, claim in claims.items():
+                conflict = claim[0] & mask
+                if conflict:
+                    self._report_conflict(board_number, client, conflict)
+                value |= claim[1] & ~mask
+                mask |= claim[0]
+            released = self.claimed_mask[board_number] & ~mask
+            self.claimed_mask[board_number] = mask
+            self.output_port_mask[board_number] = mask | released
+            self.output_port_value[board_number] = value
+
+    def _report_conflict(self, board_number, client, conflict):
+        '''
+        Log a conflict once per board, client and set of conflicting pins
+        '''
+        if (board_number, client, conflict) in self._reported_conflicts:
+            return
+        self._reported_conflicts.add((board_number, client, conflict))
+        self.conflicts += 1
+        owners = [owner for owner, claim in self.output_claims[board_number].items()
+                  if owner != client and claim[0] & conflict]
+        self.logger_instance.warning(
+            "RPiOutputArbiter - Output pins {:08b} of board {} requested by {} are already " \
+            "claimed by {} - request ignored".format(
+                conflict,
+                board_number,
+                client,
+                ",".join(owners)))
+
+    def process_output_updates(self):
+        '''
+        method that handles the update messages received since the previous tick and writes
+        the boards with changed outputs (single write per board)
+        '''
+        timestamp = time.monotonic()
+        while True:
+            try:
+                update = self.arbiter_socket.recv(1024)
+            except (BlockingIOError, InterruptedError):
+                break
+            self.process_update(update.decode(errors="replace"), timestamp)
+
+        self.merge_output_ports(timestamp)
+        self.write_output_ports()
+
+def main():
+    '''
+    Initiating the RPiOutputArbiter process
+    '''
+
+    output_arbiter_instance = RPiOutputArbiter()
+
+    output_arbiter_instance.run(output_arbiter_instance.process_message,
+                                output_arbiter_instance.process_output_updates)
+
+if __name__ == '__main__':
+    main()
@@ -8,19 +8,32 @@ Created:	03/03/2019
 Copyright:	(c) Wim 2019
 Licence:
 '''
+import functools
+import re
+
 from rpi_processframework import RPiProcessFramework
 from rpi_piface import RPiPiface
+from rpi_outputslots import RPiOutputSlot
 
 class RPiOutputDimmer(RPiProcessFramework, RPiPiface):
     '''
     Class Name:   RPiOutputDimmer
     '''
+    # Method handling each action of the process logic
+    ACTIONS = {"ON": "_switch_on_dimmer", "OFF": "_switch_off_dimmer"}
+    # Entries of the process configuration file holding the output dimmers
+    OUTPUT_KEYWORD = re.compile(r"Dimmer\d\d")
+
     def __init__(self):
         # Initialize process framework attributes so we can start using them
         RPiProcessFramework.__init__(self, default_log_level='INFO')
 
         # We make use of a PiFace, so let's initialize an instance
-        RPiPiface.__init__(self)
+        # When an output arbiter is configured, the outputs are written by the arbiter
+        RPiPiface.__init__(self,
+                           self.process_attributes.get_item("OutputArbiter"),
+                           self.process_attributes.get_item("ProcessName"),
+                           self.get_float_attribute("OutputResyncTime", 5.0))
         if self.get_number_of_boards() == 0:
             self.logger_instance.critical(
                 "RPiOutputDimmer - No PiFace boards detected. \
@@ -34,13 +47,21 @@ class RPiOutputDimmer(RPiProcessFramework, RPiPiface):
                 "RPiOutputDimmer - Potentially not all PiFace boards detected." +\
                 "Address of last detected board = {}".format(self.get_number_of_boards()-1))
 
+        self.initialize_outputs()
+
+    def __del__(self):
+        self.logger_instance.info("RPiOutputDimmer - Process Stopping!")
+
+    def initialize_outputs(self):
+        '''
+        method that creates the output dimmer list and the process logic dictionary from the
+        process attributes. Also used when the process runs as a role of an output host
+        '''
         # Initialize the output dimmer dictionary
         self.output_dimmer = self.create_output_dimmer_list(self.process_attributes.__repr__())
         # Initialize the process logic dictionary
         self.process_logic = self.create_process_logic_dictionary()
-
-    def __del__(self):
-        self.logger_instance.info("RPiOutputDimmer - Process Stopping!")
+        self.send_event_subscriptions(self.process_logic)
 
     def __str__(self):
         long_string = RPiProcessFramework.__str__(self)
@@ -64,26 +85,26 @@ class RPiOutputDimmer(RPiProcessFramework, RPiPiface):
         '''
         Gether method to retrieve state value for a digital output/dimmer
         '''
-        return self.output_dimmer[key][0]
+        return self.output_dimmer[key].state
 
     def _get_description(self, key):
         '''
         Gether method to retrieve description for an output/dimmer
         '''
-        return self.output_dimmer[key][1]
+        return self.output_dimmer[key].description
 
     def _set_state(self, key, state):
         '''
         Sether method to set state value for a digital output/dimmer to
         the value provided by the state parameter
         '''
-        self.output_dimmer[key][0] = state
+        self.output_dimmer[key].state = state
 
     def create_output_dimmer_list(self, process_attribute_list):
         '''
         Return value is a dictionary where
           - The key is set as the address consisting of the board and 'dimmer' number
-          - The corresponding values a list structure containing following attributes:
+          - The corresponding value is an RPiOutputSlot with following attributes:
             - State => integer that is either 0 => Output pin in 'off' state or
               1 => Output pin in 'on' state
             - Description => String value
@@ -101,26 +122,31 @@ class RPiOutputDimmer(RPiProcessFramework, RPiPiface):
                 key = "Dimmer" + str(board) + str(pin)
                 if key in process_attribute_list:
                     value = process_attribute_list[key]
-                    attribute_key, description, logic = value.split(
-                        ";")
+                    attribute_key, description, logic = self.split_attribute_value(value)
                     logic_list = []
                     logic_list = logic.split(',')
                     self.logger_instance.debug(
                         "RPiOutputDimmer - create_output_dimmer_list - processing {}".format(key))
                     if description != "Not Used":
-                        reply[attribute_key] = [
-                            0,  # State
-                            description,
-                            logic_list]  # Timestamp when pulse status was change
+                        try:
+                            reply[attribute_key] = RPiOutputSlot(attribute_key,
+                                                                 description,
+                                                                 logic_list)
+                        except ValueError:
+                            self.logger_instance.error(
+                                "RPiOutputDimmer - Invalid address {} for {} - skipping".format(
+                                    attribute_key,
+                                    key))
+                            continue
                         self.logger_instance.debug(
                             "RPiOutputDimmer - create_output_dimmer_list - Dimmer: {}".format(
                                 attribute_key) +\
                             " - State: {}".format(
-                                reply[attribute_key][0]) +\
+                                reply[attribute_key].state) +\
                             " - Description: {}".format(
-                                reply[attribute_key][1]) +\
+                                reply[attribute_key].description) +\
                             " - Logic: {}".format(
-                                reply[attribute_key][2])
+                                reply[attribute_key].logic)
                             )
 
         return reply
@@ -137,14 +163,24 @@ class RPiOutputDimmer(RPiProcessFramework, RPiPiface):
             for key in self.output_dimmer:
                 action_list = []
                 attributes = self.output_dimmer[key]
-                logic_list = attributes[2]
+                logic_list = attributes.logic
                 self.logger_instance.debug(
                     "RPIOutputDimmer - create_process_logic_dictionary - Processing {}: {}".format(
                         key,
                         logic_list))
                 for items in logic_list:
                     input_reference, action = items.split('|')
-                    action_list_item = [key, action]
+                    if action not in self.ACTIONS:
+                        self.logger_instance.warning(
+                            "RPIOutputDimmer - Unknown action {} for {} - skipping!".format(
+                                action,
+                                input_reference))
+                        continue
+                    # The action is bound to the attributes of the dimmer, so handling an
+                    # event is a single lookup of the process logic
+                    action_list_item = functools.partial(getattr(self, self.ACTIONS[action]),
+                                                         key,
+                                                         attributes)
                     self.logger_instance.debug(
                         "RPIOutputDimmer - create_process_logic_dictionary - " +
                         "Processing logic_list {}: {}".format(input_reference, action))
@@ -156,7 +192,7 @@ class RPiOutputDimmer(RPiProcessFramework, RPiPiface):
                         "RPIOutputDimmer - create_process_logic_dictionary - " +
                         "Adding item to logic process list {}: {}".format(
                             input_reference,
-                            action_list_item))
+                            [key, action]))
                     action_list.append(action_list_item)
                     logic_dictionary[input_reference] = action_list
         else:
@@ -164,40 +200,50 @@ class RPiOutputDimmer(RPiProcessFramework, RPiPiface):
                 "RPIOutputDimmer - create_process_logic_dictionary - " +
                 "No entries found in output_dimmer list!")
 
-        return logic_dictionary
+        return {input_reference: tuple(action_list)
+                for input_reference, action_list in logic_dictionary.items()}
+
+    def _switch_on_dimmer(self, key, dimmer):
+        '''
+        ON action, dimmer is the RPiOutputSlot of the dimmer
+        '''
+        dimmer.state = 1
+        self.logger_instance.info(
+            "RPIOutputDimmer - 'ON' action received -> Setting dimmer {} - {}".format(
+                key,
+                dimmer.description))
+
+    def _switch_off_dimmer(self, key, dimmer):
+        '''
+        OFF action, dimmer is the RPiOutputSlot of the dimmer
+        '''
+        dimmer.state = 0
+        self.logger_instance.info(
+            "RPIOutputDimmer - 'OFF' action received -> Resetting dimmer {} - {}".format(
+                key,
+                dimmer.description))
 
     def parse_input_button_message(self, message):
         '''
         Method responsible to parse an incomming input button message
-        Valid actions:
+        Valid actions (see ACTIONS):
         - ON
         - OFF
-        Other actions are ignored
+        Other actions are ignored when the process logic dictionary is created
         '''
-        self.logger_instance.debug(
-            "RPIOutputDimmer - Parsing input button message {}".format(message))
+        if self.logger_instance.is_debug_enabled():
+            self.logger_instance.debug(
+                "RPIOutputDimmer - Parsing input button message {}".format(message))
 
         try:
             action_list = self.process_logic[message]
-            for dimmer_key, dimmer_action in action_list:
-                if dimmer_action == "ON":
-                    self._set_state(dimmer_key, 1)
-                    self.logger_instance.info(
-                        "RPIOutputDimmer - 'ON' action received -> Setting dimmer {} - {}".format(
-                            dimmer_key,
-                            self._get_description(dimmer_key)))
-                elif dimmer_action == "OFF":
-                    self._set_state(dimmer_key, 0)
-                    self.logger_instance.info(
-                        "RPIOutputDimmer - 'OFF' action received -> Resetting dimmer {} - {}".
-                        format(dimmer_key, self._get_description(dimmer_key)))
-                else:
-                    self.logger_instance.debug(
-                        "RPIOutputDimmer - Unknown action received {} - skipping!".format(
-                            dimmer_action))
         except KeyError:
             self.logger_instance.debug(
                 "RPIOutputDimmer - Unknow input event received {} - skipping".format(message))
+            return
+
+        for action in action_list:
+            action()
 
     def process_message(self, message):
         '''
@@ -219,6 +265,7 @@ class RPiOutputDimmer(RPiProcessFramework, RPiPiface):
                 self.output_dimmer = self.create_output_dimmer_list(
                     self.process_attributes.__repr__())
                 self.process_logic = self.create_process_logic_dictionary()
+                self.send_event_subscriptions(self.process_logic)
         elif message_list[0] == "I":  # An input button related message was received
             self.logger_instance.debug(
                 "RPIOutputDimmer - Input button message received {} - {}".format(
@@ -228,18 +275,41 @@ class RPiOutputDimmer(RPiProcessFramework, RPiPiface):
 
         return reply
 
-    def process_output_dimmer(self):
+    def apply_process_attribute_changes(self, changes):
+        '''
+        Method to apply the changed entries of the process configuration file. Only the changed
+        dimmers are created again, the state of the other dimmers is kept. A removed dimmer
+        is switched off
+        '''
+        output_dimmer = dict(self.output_dimmer)
+        if self.update_output_dictionary(self.output_dimmer,
+                                         self.create_output_dimmer_list,
+                                         changes,
+                                         self.OUTPUT_KEYWORD,
+                                         ("state",)):
+            for key in output_dimmer.keys() - self.output_dimmer.keys():
+                self.set_output_port_bit(output_dimmer[key].board, output_dimmer[key].pin, 0)
+            self.process_logic = self.create_process_logic_dictionary()
+            self.send_event_subscriptions(self.process_logic)
+
+    def update_output_ports(self):
         '''
         This method will scan all active dimmers in the list
-        and sets the 'state' value as stored in the attributes for each digital output - dimmer.
+        and sets the 'state' value as stored in the attributes in the shadow output register
+        for each digital output - dimmer.
+        '''
+        for dimmer in self.output_dimmer.values():
+            self.set_output_port_bit(dimmer.board, dimmer.pin, dimmer.state)
+
+    def process_output_dimmer(self):
         '''
-        for key in self.output_dimmer:
-            board_number = int(key[1])
-            pin_number = int(key[3])
-            if self._get_state(key):
-                self.set_output_pin(board_number, pin_number)
-            else:
-                self.reset_output_pin(board_number, pin_number)
+        This method updates the shadow output register and writes it to the boards
+        '''
+        self.update_output_ports()
+
+        # Only boards with changed outputs are written
+        self.write_output_ports()
+
 def main():
     '''
     Initiating the RPiOutputDimmer process
@@ -247,11 +317,8 @@ def main():
 
     output_handler_instance = RPiOutputDimmer()
 
-    while output_handler_instance.run_process:
-        with output_handler_instance.process_input_queue as consumer:
-            output_handler_instance.run_process = consumer.consume(  # pylint: disable=assignment-from-no-return
-                output_handler_instance.process_message,
-                output_handler_instance.process_output_dimmer)
+    output_handler_instance.run(output_handler_instance.process_message,
+                                output_handler_instance.process_output_dimmer)
 
 if __name__ == '__main__':
     main()
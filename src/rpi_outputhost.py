@@ -0,0 +1,231 @@
+'''
+Name:		rpi_outputhost.py
+Purpose:	Class RPiOutputHost is used to run several output processes (roles) in a single
+            process sharing the PiFace boards and the connection to the message exchange
+
+Author:
+
+Created:
+Copyright:
+Licence:
+'''
+
+from rpi_processframework import RPiProcessFramework
+from rpi_piface import RPiPiface
+from rpi_outputlights import RPiOutputLights
+from rpi_outputdimmer import RPiOutputDimmer
+from rpi_outputrelay import RPiOutputRelay
+from rpi_outputventilator import RPiOutputVentilator
+
+# Output process class of each role, the role name is the process name of the
+# output process without the Pi reference (for example RPI_OUTPUTLIGHTS_PI1)
+ROLE_CLASSES = {"RPI_OUTPUTLIGHTS": RPiOutputLights,
+                "RPI_OUTPUTDIMMER": RPiOutputDimmer,
+                "RPI_OUTPUTRELAY": RPiOutputRelay,
+                "RPI_OUTPUTVENTILATOR": RPiOutputVentilator}
+
+class RPiOutputHost(RPiProcessFramework, RPiPiface):
+    '''
+    This class is created to run the output processes of a Pi as roles of a single process
+    The roles are set by the 'Roles' entry in the process configuration file, for example
+        Roles=RPI_OUTPUTLIGHTS_PI1,RPI_OUTPUTRELAY_PI1,RPI_OUTPUTDIMMER_PI1
+    Each role reads its own configuration file (<role name>.cfg) and keeps the name of its
+    input queue (IQ_<role name>), so the processes sending messages to the roles don't change.
+    Following is shared by all roles:
+        - The PiFace boards => the boards are only initialized once and the shadow output
+          registers are shared, so all outputs of a board are written with a single write
+          per tick (see process_output_ports)
+        - The logger instance
+        - The input queue => the input queue of the host is bound to the input queue names
+          of the roles as well. Note: the input queues of the separate output processes are
+          no longer consumed and should be deleted
+    Following attributes are inherited from the RPiProcessFramework class:
+        - run_process => boolean to indicate if process should be running
+        - process_attributes => dictionary containing all attribues used by this process
+        - process_input_queue => Handle to the input queue
+        - logger_instance => Handle to the logger instance
+    Following attributes are defined in the RPiOutputHost class:
+        - roles => List with the output process instance of each role
+        - role_deadlines => List with the next_deadline function of the roles using timers
+    '''
+    def __init__(self):
+        # Initialize process framework attributes so we can start using them
+        RPiProcessFramework.__init__(self, default_log_level='INFO')
+
+        # The PiFace boards are initialized once for all roles
+        # When an output arbiter is configured, the outputs are written by the arbiter
+        RPiPiface.__init__(self,
+                           self.process_attributes.get_item("OutputArbiter"),
+                           self.process_attributes.get_item("ProcessName"),
+                           self.get_float_attribute("OutputResyncTime", 5.0))
+        if self.get_number_of_boards() == 0:
+            self.logger_instance.critical(
+                "RPiOutputHost - No PiFace boards detected. \
+                Unable to process output signals"
+                )
+            self.run_process = False    # No need to continue
+        else:
+            self.logger_instance.info(
+                "RPiOutputHost - {} PiFace boards detected".format(self.get_number_of_boards()))
+
+        # The roles are added one by one, the topic bindings are updated for the roles
+        # created so far when a role subscribes to its events
+        self.roles = []
+        self.create_roles(self.process_attributes.get_item("Roles"))
+        if not self.roles:
+            self.logger_instance.critical("RPiOutputHost - No valid roles found")
+            self.run_process = False    # No need to continue
+
+        # Messages sent to the input queue of a role are received on the host input queue
+        self.process_input_queue.config['bindingKeys'] = [
+            role.process_attributes.get_item("InputQueueName") for role in self.roles]
+
+        # Wake up for the timers of all roles
+        self.role_deadlines = [role.next_deadline for role in self.roles
+                               if role.next_deadline is not None]
+        if self.role_deadlines:
+            self.next_deadline = self.next_role_deadline
+
+    def __del__(self):
+        self.logger_instance.info("RPiOutputHost - Process Stopping!")
+
+    def __str__(self):
+        long_string = RPiProcessFramework.__str__(self)
+        long_string += RPiPiface.__str__(self)
+        for role in self.roles:
+            long_string += "Role {}:\n".format(role.process_attributes.get_item("ProcessName"))
+            long_string += role.__str__()
+
+        return long_string
+
+    def create_roles(self, role_names):
+        '''
+        method that adds an output process instance for each role in role_names (comma
+        separated) to the roles of the host. The instances use the PiFace boards, logger
+        and input queue of the host
+        '''
+        if role_names is None:
+            return
+
+        for role_name in str(role_names).split(","):
+            role_name = str.upper(role_name.lstrip().rstrip())
+            role_class = ROLE_CLASSES.get(role_name.rsplit("_", 1)[0])
+            if role_class is None:
+                self.logger_instance.warning(
+                    "RPiOutputHost - Unknown role {} - skipping".format(role_name))
+                continue
+
+            role = role_class.__new__(role_class)
+            role.init_role(self, role_name)
+            role.share_piface(self)
+            if role.run_process is False:
+                self.logger_instance.critical(
+                    "RPiOutputHost - Unable to initialize role {}".format(role_name))
+                continue
+            self.roles.append(role)
+            role.initialize_outputs()
+            self.logger_instance.info("RPiOutputHost - Role {} active".format(role_name))
+
+    def next_role_deadline(self):
+        '''
+        Return value is the first deadline (time.monotonic) of the timers of all roles,
+        None when no timers are pending
+        '''
+        deadlines = [deadline for deadline in (next_deadline()
+                                               for next_deadline in self.role_deadlines)
+                     if deadline is not None]
+        if deadlines:
+            return min(deadlines)
+        return None
+
+    def update_topic_bindings(self):
+        '''
+        method that binds the input queue to the routing keys of the events of all roles
+        on the topic exchange (see RPiProcessFramework.send_event_subscriptions)
+        '''
+        routing_keys = []
+        for role in self.roles:
+            routing_keys.extend(role.event_routing_keys)
+        self.process_input_queue.set_topic_bindings(routing_keys)
+
+    def process_message(self, message):
+        '''
+        Function responsible to handle messages coming from the process
+        input queue. The message is passed as a parameter.
+        - Process messages are handled by the host, REFRESH_PROCESS_ATTRIBUTES and
+          REQUEST_SUBSCRIPTION are passed to all roles as well
+        - Input button and light simulator messages are passed to the roles having
+          a rule for the event
+        Return value:
+        - True: No STOP event received
+        - False: STOP event received
+        '''
+        reply = True    # We assume we keep going
+
+        message_list = message.split(";")
+        if message_list[0] == "P":  # A process related message was received
+            reply = super().process_message(message)
+            if reply is True and message_list[1] in ("REFRESH_PROCESS_ATTRIBUTES",
+                                                     "REQUEST_SUBSCRIPTION"):
+                for role in self.roles:
+                    role.process_message(message)
+        elif len(message_list) > 1:
+            handled = False
+            for role in self.roles:
+                if message_list[1] in role.process_logic:
+                    role.process_message(message)
+                    handled = True
+            if not handled:
+                self.logger_instance.debug(
+                    "RPiOutputHost - No role found for message {} - skipping".format(message))
+
+        return reply
+
+    def check_config_file(self):
+        '''
+        Method run before each tick of the message pump: the changed entries of the
+        configuration files of the host and of the roles are applied
+        '''
+        super().check_config_file()
+        for role in self.roles:
+            role.check_config_file()
+
+    def apply_process_attribute_changes(self, changes):
+        '''
+        Method to apply the changed entries of the host configuration file. The roles are
+        created when the host is started, a change of the roles or of another entry of the
+        host is applied after a restart. The configuration files of the roles are applied by
+        the roles (see check_config_file)
+        '''
+        if "Roles" in changes:
+            self.logger_instance.warning(
+                "RPiOutputHost - Roles changed to {}, restart the process to apply".format(
+                    changes["Roles"][1]))
+        restart_keys = sorted(key for key in changes if key != "Roles")
+        if restart_keys:
+            self.logger_instance.warning(
+                "RPiOutputHost - {} changed, restart the process to apply".format(
+                    ", ".join(restart_keys)))
+
+    def process_output_ports(self):
+        '''
+        This method updates the shadow output registers for all roles and writes the
+        boards with changed outputs, using a single write per board
+        '''
+        for role in self.roles:
+            role.update_output_ports()
+
+        self.write_output_ports()
+
+def main():
+    '''
+    Initiating the RPiOutputHost process
+    '''
+
+    output_host_instance = RPiOutputHost()
+
+    output_host_instance.run(output_host_instance.process_message,
+                             output_host_instance.process_output_ports)
+
+if __name__ == '__main__':
+    main()
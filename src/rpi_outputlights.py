@@ -9,21 +9,33 @@ Updated:    15/07/2019  => Add feature to process light simulator events
 Copyright:	(c) Wim 2018
 Licence:
 '''
+import functools
+import re
 import time
 
 from rpi_processframework import RPiProcessFramework
 from rpi_piface import RPiPiface
+from rpi_outputslots import RPiOutputSlot
 
 class RPiOutputLights(RPiProcessFramework, RPiPiface):
     '''
     
     '''
+    # Method handling each action of the process logic
+    ACTIONS = {"TOGGLE": "_toggle_light", "ON": "_switch_on_light", "OFF": "_switch_off_light"}
+    # Entries of the process configuration file holding the output lights
+    OUTPUT_KEYWORD = re.compile(r"Light\d\d")
+
     def __init__(self):
         # Initialize process framework attributes so we can start using them
         RPiProcessFramework.__init__(self, default_log_level='INFO')
     
         # We make use of a PiFace, so let's initialize an instance
-        RPiPiface.__init__(self)
+        # When an output arbiter is configured, the outputs are written by the arbiter
+        RPiPiface.__init__(self,
+                           self.process_attributes.get_item("OutputArbiter"),
+                           self.process_attributes.get_item("ProcessName"),
+                           self.get_float_attribute("OutputResyncTime", 5.0))
         if self.get_number_of_boards() == 0:
             self.logger_instance.critical(
                 "RPiOutputLights - No PiFace boards detected. \
@@ -37,13 +49,21 @@ class RPiOutputLights(RPiProcessFramework, RPiPiface):
                 "RPiOutputLights - Potentially not all PiFace boards detected." +\
                 "Address of last detected board = {}".format(self.get_number_of_boards()-1))
 
+        self.initialize_outputs()
+
+    def __del__(self):
+        self.logger_instance.info("RPiOutputLights - Process Stopping!")
+
+    def initialize_outputs(self):
+        '''
+        method that creates the output lights list and the process logic dictionary from the
+        process attributes. Also used when the process runs as a role of an output host
+        '''
         # Initialize the output lights dictionary
         self.output_lights = self.create_output_lights_list(self.process_attributes.__repr__())
         # Initialize the process logic dictionary
         self.process_logic = self.create_process_logic_dictionary()
-
-    def __del__(self):
-        self.logger_instance.info("RPiOutputLights - Process Stopping!")
+        self.send_event_subscriptions(self.process_logic)
 
     def __str__(self):
         long_string = RPiProcessFramework.__str__(self)
@@ -67,26 +87,26 @@ class RPiOutputLights(RPiProcessFramework, RPiPiface):
         '''
         Gether method to retrieve state value for a digital output
         '''
-        return self.output_lights[key][0]
+        return self.output_lights[key].state
 
     def _get_description(self, key):
         '''
         Gether method to retrieve description for an output
         '''
-        return self.output_lights[key][1]
+        return self.output_lights[key].description
 
     def _set_state(self, key, state):
         '''
         Sether method to set state value for a digital output to
         the value provided by the state parameter
         '''
-        self.output_lights[key][0] = state
+        self.output_lights[key].state = state
 
     def create_output_lights_list(self, process_attribute_list):
         '''
         Return value is a dictionary where
           - The key is set as the address consisting of the board and light number
-          - The corresponding values a list structure containing following attributes:
+          - The corresponding value is an RPiOutputSlot with following attributes:
             - State => integer that is either 0 => Output pin in 'off' state or
               1 => Output pin in 'on' state
             - Description => String value
@@ -103,26 +123,31 @@ class RPiOutputLights(RPiProcessFramework, RPiPiface):
                 key = "Light" + str(board) + str(pin)
                 if key in process_attribute_list:
                     value = process_attribute_list[key]
-                    attribute_key, description, logic = value.split(
-                        ";")
+                    attribute_key, description, logic = self.split_attribute_value(value)
                     logic_list = []
                     logic_list = logic.split(',')
                     self.logger_instance.debug(
                             "RPiOutputLights - create_output_lights_list - processing {}".format(key))
                     if description != "Not Used":
-                        reply[attribute_key] = [
-                            0,  # State
-                            description,
-                            logic_list]  # Timestamp when pulse status was change
+                        try:
+                            reply[attribute_key] = RPiOutputSlot(attribute_key,
+                                                                 description,
+                                                                 logic_list)
+                        except ValueError:
+                            self.logger_instance.error(
+                                "RPiOutputLights - Invalid address {} for {} - skipping".format(
+                                    attribute_key,
+                                    key))
+                            continue
                         self.logger_instance.debug(
                             "RPiOutputLights - create_output_lights_list - lights: {}".format(
                                 attribute_key) +\
                             " - State: {}".format(
-                                reply[attribute_key][0]) +\
+                                reply[attribute_key].state) +\
                             " - Description: {}".format(
-                                reply[attribute_key][1]) +\
+                                reply[attribute_key].description) +\
                             " - Logic: {}".format(
-                                reply[attribute_key][2])
+                                reply[attribute_key].logic)
                             )
         
         return reply
@@ -139,14 +164,24 @@ class RPiOutputLights(RPiProcessFramework, RPiPiface):
             for key in self.output_lights:
                 action_list = []
                 attributes = self.output_lights[key]
-                logic_list = attributes[2]
+                logic_list = attributes.logic
                 self.logger_instance.debug(
                         "RPIOutputLights - create_process_logic_dictionary - Processing {}: {}".format(
                                                                                             key,
                                                                                             logic_list))
                 for items in logic_list:
                     input_reference, action = items.split('|')
-                    action_list_item = [key, action]
+                    if action not in self.ACTIONS:
+                        self.logger_instance.warning(
+                            "RPIOutputLights - Unknown action {} for {} - skipping!".format(
+                                action,
+                                input_reference))
+                        continue
+                    # The action is bound to the attributes of the light, so handling an
+                    # event is a single lookup of the process logic
+                    action_list_item = functools.partial(getattr(self, self.ACTIONS[action]),
+                                                         key,
+                                                         attributes)
                     self.logger_instance.debug(
                         "RPIOutputLights - create_process_logic_dictionary - Processing logic_list {}: {}".format(
                                                                                             input_reference,
@@ -158,64 +193,64 @@ class RPiOutputLights(RPiProcessFramework, RPiPiface):
                     self.logger_instance.debug(
                         "RPIOutputLights - create_process_logic_dictionary - Adding item to logic process list {}: {}".format(
                                                                                             input_reference,
-                                                                                            action_list_item))
+                                                                                            [key, action]))
                     action_list.append(action_list_item)
                     logic_dictionary[input_reference] = action_list
         else:
             self.logger_instance.debug(
                 "RPIOutputLights - create_process_logic_dictionary - No entries found in output_lights list!")
 
-        return logic_dictionary
+        return {input_reference: tuple(action_list)
+                for input_reference, action_list in logic_dictionary.items()}
+
+    def _toggle_light(self, key, light):
+        '''
+        TOGGLE action, light is the RPiOutputSlot of the light
+        '''
+        if light.state == 0:
+            self._switch_on_light(key, light)
+        else:
+            self._switch_off_light(key, light)
+
+    def _switch_on_light(self, key, light):
+        '''
+        ON action, light is the RPiOutputSlot of the light
+        '''
+        light.state = 1
+        self.logger_instance.info(
+            "RPIOutputLights - Setting light {} - {}".format(key, light.description))
+
+    def _switch_off_light(self, key, light):
+        '''
+        OFF action, light is the RPiOutputSlot of the light
+        '''
+        light.state = 0
+        self.logger_instance.info(
+            "RPIOutputLights - Resetting light {} - {}".format(key, light.description))
 
     def parse_incoming_message(self, message):
         '''
         Method responsible to parse an incoming message either from an input button
         or from the light simulator
-        Valid actions:
+        Valid actions (see ACTIONS):
         - TOGGLE
         - ON
         - OFF
-        Other actions are ignored
+        Other actions are ignored when the process logic dictionary is created
         '''
-        self.logger_instance.debug(
-            "RPIOutputLights - Parsing incoming message {}".format(message))
+        if self.logger_instance.is_debug_enabled():
+            self.logger_instance.debug(
+                "RPIOutputLights - Parsing incoming message {}".format(message))
 
         try:
             action_list = self.process_logic[message]
-            for light_key, light_action in action_list:
-                if light_action == "TOGGLE":
-                    if self._get_state(light_key) == 0:
-                        self._set_state(light_key, 1)
-                        self.logger_instance.info(
-                            "RPIOutputLights - Setting light {} - {}".format(
-                                light_key,
-                                self._get_description(light_key)))
-                    else:
-                        self._set_state(light_key, 0)
-                        self.logger_instance.info(
-                            "RPIOutputLights - Resetting light {} - {}".format(
-                                light_key,
-                                self._get_description(light_key)))
-                elif light_action == "ON":
-                    self._set_state(light_key, 1)
-                    self.logger_instance.info(
-                            "RPIOutputLights - Setting light {} - {}".format(
-                                light_key,
-                                self._get_description(light_key)))
-                elif light_action == "OFF":
-                    self._set_state(light_key, 0)
-                    self.logger_instance.info(
-                            "RPIOutputLights - Resetting light {} - {}".format(
-                                light_key,
-                                self._get_description(light_key)))
-                else:
-                    self.logger_instance.debug(
-                            "RPIOutputLights - Unknown action received {} for message {} - skipping!".format(
-                                light_action,
-                                message))
         except KeyError:
             self.logger_instance.warning(
                 "RPIOutputLights - Unknow incoming event received {} - skipping".format(message))
+            return
+
+        for action in action_list:
+            action()
 
     def process_message(self, message):
         '''
@@ -237,6 +272,7 @@ class RPiOutputLights(RPiProcessFramework, RPiPiface):
                 self.output_lights = self.create_output_lights_list(
                     self.process_attributes.__repr__())
                 self.process_logic = self.create_process_logic_dictionary()
+                self.send_event_subscriptions(self.process_logic)
         elif message_list[0] == "I":  # An input button related message was received
             self.logger_instance.debug(
                 "RPIOutputLights - Input button message received {} - {}".format(
@@ -252,18 +288,41 @@ class RPiOutputLights(RPiProcessFramework, RPiPiface):
 
         return reply
 
-    def process_output_lights(self):
+    def apply_process_attribute_changes(self, changes):
+        '''
+        Method to apply the changed entries of the process configuration file. Only the changed
+        lights are created again, the state of the other lights is kept. A removed light
+        is switched off
+        '''
+        output_lights = dict(self.output_lights)
+        if self.update_output_dictionary(self.output_lights,
+                                         self.create_output_lights_list,
+                                         changes,
+                                         self.OUTPUT_KEYWORD,
+                                         ("state",)):
+            for key in output_lights.keys() - self.output_lights.keys():
+                self.set_output_port_bit(output_lights[key].board, output_lights[key].pin, 0)
+            self.process_logic = self.create_process_logic_dictionary()
+            self.send_event_subscriptions(self.process_logic)
+
+    def update_output_ports(self):
         '''
         This method will scan all active lights in the list
-        and sets the 'state' value as stored in the attributes for each digital output - light.
+        and sets the 'state' value as stored in the attributes in the shadow output register
+        for each digital output - light.
+        '''
+        for light in self.output_lights.values():
+            self.set_output_port_bit(light.board, light.pin, light.state)
+
+    def process_output_lights(self):
+        '''
+        This method updates the shadow output register and writes it to the boards
         '''
-        for key in self.output_lights:
-            board_number = int(key[1])
-            pin_number = int(key[3])
-            if self._get_state(key):
-                self.set_output_pin(board_number, pin_number)
-            else:
-                self.reset_output_pin(board_number, pin_number)
+        self.update_output_ports()
+
+        # Only boards with changed outputs are written
+        self.write_output_ports()
+
 def main():
     '''
     Initiating the RPiOutputLights process
@@ -271,11 +330,8 @@ def main():
 
     output_handler_instance = RPiOutputLights()
 
-    while output_handler_instance.run_process:
-        with output_handler_instance.process_input_queue as consumer:
-            output_handler_instance.run_process = consumer.consume(  # pylint: disable=assignment-from-no-return
-                output_handler_instance.process_message,
-                output_handler_instance.process_output_lights)
+    output_handler_instance.run(output_handler_instance.process_message,
+                                output_handler_instance.process_output_lights)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
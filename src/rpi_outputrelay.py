@@ -9,12 +9,19 @@ Copyright:	(c) Wim 2018
 Licence:
 '''
 
+import functools
+import re
 import time
 from rpi_piface import RPiPiface
+from rpi_outputslots import RPiOutputSlot
 
 from rpi_processframework import RPiProcessFramework
+from rpi_timerheap import RPiTimerHeap
 #from rpi_messagesender import RPiMessageSender
 
+# Time in seconds a relay stays active after a PULSE action
+PULSE_TIME = 1
+
 class RPiOutputRelay(RPiProcessFramework, RPiPiface):
     '''
     This class is created to handle the Output Relays available on a piface board
@@ -46,14 +53,26 @@ class RPiOutputRelay(RPiProcessFramework, RPiPiface):
                      Example: [{(0,1): PULSE}, {(1, 1): PULSE}]
                               => PULSE action should be triggered for output relay 1
                                   on boards 0 and 1
+        - relay_timers => RPiTimerHeap instance running the timers of the relays
+        - pulse_timers => dictionary with the running pulse timer of each relay (same key
+                          as output_relays)
     '''
+    # Method handling each action of the process logic
+    ACTIONS = {"PULSE": "_pulse_relay", "TOGGLE": "_toggle_relay"}
+    # Entries of the process configuration file holding the output relays
+    OUTPUT_KEYWORD = re.compile(r"Relay\d\d")
+
     def __init__(self):
         # Initialize process framework attributes so we can start using them
         RPiProcessFramework.__init__(self, default_log_level='INFO')
 
         # Initialize all installed PiFace boards
         self.logger_instance.debug("RPiOutputRelay - Initializing PiFace boards")
-        RPiPiface.__init__(self)
+        # When an output arbiter is configured, the outputs are written by the arbiter
+        RPiPiface.__init__(self,
+                           self.process_attributes.get_item("OutputArbiter"),
+                           self.process_attributes.get_item("ProcessName"),
+                           self.get_float_attribute("OutputResyncTime", 5.0))
         # Let's share some log information
         if RPiPiface.get_number_of_boards(self) == 0:
             self.logger_instance.critical(
@@ -68,13 +87,25 @@ class RPiOutputRelay(RPiProcessFramework, RPiPiface):
                 "RPiOutputRelay - Potentially not all PiFace boards detected." +\
                 "Address of last detected board = {}".format(RPiPiface.get_number_of_boards(self)-1))
 
+        self.initialize_outputs()
+
+    def __del__(self):
+        self.logger_instance.info("RPiOutputRelay - Process Stopping!")
+
+    def initialize_outputs(self):
+        '''
+        method that creates the output relay list and the process logic dictionary from the
+        process attributes. Also used when the process runs as a role of an output host
+        '''
         # Initialize the output relay dictionary
         self.output_relays = self.create_output_relay_list(self.process_attributes.__repr__())
         # Initialize the process logic dictionary
         self.process_logic = self.create_process_logic_dictionary()
-
-    def __del__(self):
-        self.logger_instance.info("RPiOutputRelay - Process Stopping!")
+        self.send_event_subscriptions(self.process_logic)
+        # Pulses are ended by a timer, the message pump wakes up when the first one expires
+        self.relay_timers = RPiTimerHeap()
+        self.pulse_timers = {}
+        self.next_deadline = self.relay_timers.next_deadline
 
     def __repr__(self):
         return str(RPiPiface.get_number_of_boards(self))
@@ -97,75 +128,61 @@ class RPiOutputRelay(RPiProcessFramework, RPiPiface):
 
         return long_string
 
-    @classmethod
-    def _get_board_number(cls, key):
-        '''
-        function that retrieves the button board number
-        '''
-        return int(key[1])
-
-    @classmethod
-    def _get_relay_number(cls, key):
-        '''
-        function that retrieves the button relay number
-        '''
-        return int(key[3])
-
     def _get_state(self, key):
         '''
         Gether method to retrieve state value for a relay
         '''
-        return self.output_relays[key][0]
+        return self.output_relays[key].state
 
     def _get_description(self, key):
         '''
         Gether method to retrieve description for a relay
         '''
-        return self.output_relays[key][1]
+        return self.output_relays[key].description
 
     def _get_logic(self, key):
         '''
         Gether method to retrieve logic value for a relay
         '''
-        return self.output_relays[key][2]
+        return self.output_relays[key].logic
 
     def _get_pulse(self, key):
         '''
         Gether method to retrieve pulse value for a relay
         '''
-        return self.output_relays[key][3]
+        return self.output_relays[key].pulse
 
     def _get_pulse_timestamp(self, key):
         '''
         Gether method to retrieve pulse timestamp value for a relay
         '''
-        return self.output_relays[key][4]
+        return self.output_relays[key].pulse_timestamp
 
     def _set_state(self, key, state):
         '''
         Sether method to set state value for a relay to
         the value provided by the state parameter
         '''
-        self.output_relays[key][0] = state
+        self.output_relays[key].state = state
 
     def _set_pulse(self, key, state):
         '''
         Sether method to set pulse value for a relay to
         the value provided by the state parameter
         '''
-        self.output_relays[key][3] = state
+        self.output_relays[key].pulse = state
 
     def _set_pulse_timestamp(self, key, timestamp):
         '''
         method that sets the output relay pulse timestamp
         '''
-        self.output_relays[key][4] = timestamp
+        self.output_relays[key].pulse_timestamp = timestamp
 
     def create_output_relay_list(self, process_attribute_list):
         '''
         Return value is a dictionary where
           - The key is set as the address consisting of the board and relay number
-          - The corresponding values a list structure containing following attributes:
+          - The corresponding value is an RPiOutputSlot with following attributes:
             - State => integer that is either 0 =>Relay in 'released' state or
               1 => Relay in 'pulled' state
             - Description => String value
@@ -181,30 +198,33 @@ class RPiOutputRelay(RPiProcessFramework, RPiPiface):
                 key = "Relay" + str(board) + str(pin)
                 if key in process_attribute_list:
                     value = process_attribute_list[key]
-                    attribute_key, description, logic = value.split(
-                        ";")
+                    attribute_key, description, logic = self.split_attribute_value(value)
                     logic_list = []
                     logic_list = logic.split(',')
                     if description != "Not Used":
-                        reply[attribute_key] = [
-                            0,  # State
-                            description,
-                            logic_list,
-                            0,  # Pulse
-                            0]  # Timestamp when pulse status was change
+                        try:
+                            reply[attribute_key] = RPiOutputSlot(attribute_key,
+                                                                 description,
+                                                                 logic_list)
+                        except ValueError:
+                            self.logger_instance.error(
+                                "RPiOutputRelay - Invalid address {} for {} - skipping".format(
+                                    attribute_key,
+                                    key))
+                            continue
                         self.logger_instance.debug(
                             "RPiOutputRelay - Initializing output_relay: {}".format(
                                 attribute_key) +\
                             " - State: {}".format(
-                                reply[attribute_key][0]) +\
+                                reply[attribute_key].state) +\
                             " - Description: {}".format(
-                                reply[attribute_key][1]) +\
+                                reply[attribute_key].description) +\
                             " - Logic: {}".format(
-                                reply[attribute_key][2]) +\
+                                reply[attribute_key].logic) +\
                             " - Pulse: {}".format(
-                                reply[attribute_key][3]) +\
+                                reply[attribute_key].pulse) +\
                             " - Pulse Time Stamp: {}".format(
-                                reply[attribute_key][4])
+                                reply[attribute_key].pulse_timestamp)
                             )
 
         return reply
@@ -221,10 +241,20 @@ class RPiOutputRelay(RPiProcessFramework, RPiPiface):
             for key in self.output_relays:
                 action_list = []
                 attributes = self.output_relays[key]
-                logic_list = attributes[2]
+                logic_list = attributes.logic
                 for items in logic_list:
                     input_reference, action = items.split('|')
-                    action_list_item = [key, action]
+                    if action not in self.ACTIONS:
+                        self.logger_instance.warning(
+                            "RPIOutputRelay - Unknown action {} for {} - skipping!".format(
+                                action,
+                                input_reference))
+                        continue
+                    # The action is bound to the attributes of the relay, so handling an
+                    # event is a single lookup of the process logic
+                    action_list_item = functools.partial(getattr(self, self.ACTIONS[action]),
+                                                         key,
+                                                         attributes)
                     if input_reference in logic_dictionary: # pylint: disable=consider-using-get
                         action_list = logic_dictionary[input_reference]
                     else:
@@ -232,60 +262,67 @@ class RPiOutputRelay(RPiProcessFramework, RPiPiface):
                     self.logger_instance.debug(
                         "RPIOutputRelay - Adding item to process logic list {}: {}".format(
                                                                                            input_reference,
-                                                                                           action_list_item))
+                                                                                           [key, action]))
                     action_list.append(action_list_item)
                     logic_dictionary[input_reference] = action_list
 
-        return logic_dictionary
+        return {input_reference: tuple(action_list)
+                for input_reference, action_list in logic_dictionary.items()}
+
+    def _pulse_relay(self, key, relay):
+        '''
+        PULSE action, relay is the RPiOutputSlot of the relay
+        A new pulse restarts the pulse time
+        '''
+        relay.state = 1
+        relay.pulse = 1
+        relay.pulse_timestamp = time.time()
+        self.relay_timers.cancel(self.pulse_timers.get(key))
+        self.pulse_timers[key] = self.relay_timers.schedule(PULSE_TIME, self._end_pulse, key)
+        self.logger_instance.info(
+            "RPIOutputRelay - Activating pulse event for relay {} - {}".format(key, relay.description))
+
+    def _toggle_relay(self, key, relay):
+        '''
+        TOGGLE action, relay is the RPiOutputSlot of the relay
+        '''
+        if relay.state == 0:
+            relay.state = 1
+            self.logger_instance.info(
+                "RPIOutputRelay - Setting relay {} - {}".format(key, relay.description))
+        else:
+            relay.state = 0
+            self.logger_instance.info(
+                "RPIOutputRelay - Resetting relay {} - {}".format(key, relay.description))
 
     def _handle_output_relays(self):
         '''
         This method will scan all active relays and sets the 'state' value
-        as stored in the attributes for each relay.
+        as stored in the attributes for each relay in the shadow output register.
         '''
-        for key in self.output_relays:
-            if self._get_state(key) == 0:
-                RPiPiface.reset_output_relay(self, self._get_board_number(key), self._get_relay_number(key))
-            else:
-                RPiPiface.set_output_relay(self, self._get_board_number(key), self._get_relay_number(key))
+        for relay in self.output_relays.values():
+            RPiPiface.set_output_relay_bit(self, relay.board, relay.pin, relay.state)
 
     def parse_input_button_message(self, message):
         '''
         Method responsible to parse an incomming input button message
-        Valid actions:
+        Valid actions (see ACTIONS):
         - PULSE
         - TOGGLE
-        Other actions are ignored
+        Other actions are ignored when the process logic dictionary is created
         '''
-        self.logger_instance.debug(
-            "RPIOutputRelay - Parsing input button message {}".format(message))
+        if self.logger_instance.is_debug_enabled():
+            self.logger_instance.debug(
+                "RPIOutputRelay - Parsing input button message {}".format(message))
         try:
             action_list = self.process_logic[message]
-            for relay_key, relay_action in action_list:
-                if relay_action == "PULSE":
-                    self._set_state(relay_key, 1)
-                    self._set_pulse(relay_key, 1)
-                    self._set_pulse_timestamp(relay_key, time.time())
-                    self.logger_instance.info(
-                        "RPIOutputRelay - Activating pulse event for relay {} - {}".format(
-                            relay_key,
-                            self._get_description(relay_key)))
-                elif relay_action == "TOGGLE":
-                    if self._get_state(relay_key) == 0:
-                        self._set_state(relay_key, 1)
-                        self.logger_instance.info(
-                            "RPIOutputRelay - Setting relay {} - {}".format(
-                                relay_key,
-                                self._get_description(relay_key)))
-                    else:
-                        self._set_state(relay_key, 0)
-                        self.logger_instance.info(
-                            "RPIOutputRelay - Resetting relay {} - {}".format(
-                                relay_key,
-                                self._get_description(relay_key)))
         except KeyError:
             self.logger_instance.warning(
                 "RPIOutputRelay - Unknow input event received {} - skipping".format(message))
+            return
+
+        for action in action_list:
+            action()
 
     def process_message(self, message):
         '''
@@ -307,6 +344,7 @@ class RPiOutputRelay(RPiProcessFramework, RPiPiface):
                 self.output_relays = self.create_output_relay_list(
                     self.process_attributes.__repr__())
                 self.process_logic = self.create_process_logic_dictionary()
+                self.send_event_subscriptions(self.process_logic)
         elif message_list[0] == "I":  # An input button related message was received
             self.logger_instance.debug(
                 "RPIOutputRelay - Parsing input button message received {} - {}".format(
@@ -319,17 +357,53 @@ class RPiOutputRelay(RPiProcessFramework, RPiPiface):
     def process_output_relay(self):
         '''
         Method to handle output relays
-        First we process te pulse relays to see if they can be switched off
+        The shadow output register is updated and written to the boards.
+        The relays are only written when their state changed.
+        '''
+        self.update_output_ports()
+
+        # Only boards with changed relays are written
+        RPiPiface.write_output_ports(self)
+
+    def _end_pulse(self, relay):
+        '''
+        Timer call back function resetting a pulse relay at the end of the pulse
+        '''
+        self.pulse_timers.pop(relay, None)
+        if relay in self.output_relays and self._get_pulse(relay) == 1:
+            self._set_state(relay, 0)
+            self._set_pulse(relay, 0)
+            self.logger_instance.debug(
+                "RPIOutputRelay - Resetting pulse state to 0 for {}".format(relay))
+
+    def apply_process_attribute_changes(self, changes):
+        '''
+        Method to apply the changed entries of the process configuration file. Only the changed
+        relays are created again, the state and an ongoing pulse of the other relays are kept.
+        A removed relay is released
+        '''
+        output_relays = dict(self.output_relays)
+        if self.update_output_dictionary(self.output_relays,
+                                         self.create_output_relay_list,
+                                         changes,
+                                         self.OUTPUT_KEYWORD,
+                                         ("state", "pulse", "pulse_timestamp")):
+            for key in output_relays.keys() - self.output_relays.keys():
+                self.relay_timers.cancel(self.pulse_timers.pop(key, None))
+                RPiPiface.set_output_relay_bit(self,
+                                               output_relays[key].board,
+                                               output_relays[key].pin,
+                                               0)
+            self.process_logic = self.create_process_logic_dictionary()
+            self.send_event_subscriptions(self.process_logic)
+
+    def update_output_ports(self):
+        '''
+        Method to update the shadow output register of the output relays
+        First the pulse relays with an expired pulse timer are switched off
         Next we set all the relays accordig to their status
         '''
-        for relay in self.output_relays:
-            if self._get_pulse(relay) == 1:
-                # If the pulse is active for more than 1 second, reset it
-                if (time.time() - self._get_pulse_timestamp(relay)) > 1:
-                    self._set_state(relay, 0)
-                    self._set_pulse(relay, 0)
-                    self.logger_instance.debug(
-                        "RPIOutputRelay - Resetting pulse state to 0 for {}".format(relay))
+        self.relay_timers.advance()
 
         self._handle_output_relays()
 
@@ -340,11 +414,8 @@ def main():
 
     output_handler_instance = RPiOutputRelay()
 
-    while output_handler_instance.run_process:
-        with output_handler_instance.process_input_queue as consumer:
-            output_handler_instance.run_process = consumer.consume(  # pylint: disable=assignment-from-no-return
-                output_handler_instance.process_message,
-                output_handler_instance.process_output_relay)
+    output_handler_instance.run(output_handler_instance.process_message,
+                                output_handler_instance.process_output_relay)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,109 @@
+'''
+Name:		rpi_outputslots.py
+Purpose:	Classes RPiOutputSlot and RPiRelayTimerSlot hold the attributes of a single
+            output (light, dimmer or relay) and relay timer of the output processes
+
+Author:
+
+Created:
+Copyright:
+Licence:
+'''
+import re
+
+# Address of an output in the process configuration file => (<board>,<pin>)
+OUTPUT_ADDRESS = re.compile(r"^\((\d),(\d)\)$")
+
+def parse_output_address(address):
+    '''
+    Return value is the tuple (board number, pin number) of an output address,
+    for example (0,3) => (0, 3). A ValueError is raised for an invalid address
+    '''
+    match = OUTPUT_ADDRESS.match(address)
+    if match is None:
+        raise ValueError("Invalid output address {}".format(address))
+    return int(match.group(1)), int(match.group(2))
+
+class RPiOutputSlot():
+    '''
+    This class is created to hold the attributes of an output, the address is parsed once
+    when the output is created so the output ports are updated using integers only
+    The constructor takes following parameters:
+        - address => address of the output as used in the process configuration file,
+          for example (0,3)
+        - description => String value
+        - logic => list with the logic that indicates what should happen based on the
+          message send by an input handler (for example input buttons)
+    Following attributes are defined:
+        - board => board number of the output
+        - pin => pin number of the output (relay number for a relay)
+        - state => integer that is either 0 => Output in 'off' state or 1 => Output in 'on' state
+        - description => String value
+        - logic => list with the logic of the output
+        - pulse => integer that is either 0 (=Nothing going on) or 1 (=Pulse action ongoing)
+        - pulse_timestamp => timestamp when the pulse state was changed
+    '''
+    __slots__ = ("board", "pin", "state", "description", "logic", "pulse", "pulse_timestamp")
+
+    def __init__(self, address, description, logic):
+        self.board, self.pin = parse_output_address(address)
+        self.state = 0
+        self.description = description
+        self.logic = logic
+        self.pulse = 0
+        self.pulse_timestamp = 0
+
+    def __repr__(self):
+        return "({},{}) - State: {} - Description: {} - Logic: {} - Pulse: {} - ".format(
+            self.board,
+            self.pin,
+            self.state,
+            self.description,
+            self.logic,
+            self.pulse) +\
+            "Pulse Time Stamp: {}".format(self.pulse_timestamp)
+
+class RPiRelayTimerSlot():
+    '''
+    This class is created to hold the attributes of a relay timer of a ventilator
+    The constructor takes following parameters:
+        - description => String value
+        - lagtime => Number of seconds the ventilator will remain active after
+                     "stop" event is received
+        - runtime => Maximum number of seconds the ventilator should run
+    Following attributes are defined:
+        - state => integer that is either 0 => Timer is not running or 1 => Timer is running
+        - description, lagtime, runtime => see above
+        - start_time => timestamp when the ventilator was started
+        - stop_time => timestamp when the stop event was received, 0 when running
+    '''
+    __slots__ = ("state", "description", "lagtime", "runtime", "start_time", "stop_time")
+
+    def __init__(self, description, lagtime, runtime):
+        self.state = 0
+        self.description = description
+        self.lagtime = lagtime
+        self.runtime = runtime
+        self.start_time = 0
+        self.stop_time = 0
+
+    def __repr__(self):
+        return "State: {} - Description: {} - LagTime: {} - RunTime: {} - ".format(
+            self.state,
+            self.description,
+            self.lagtime,
+            self.runtime) +\
+            "Start Time: {} - Stop Time: {}".format(self.start_time, self.stop_time)
+
+def main():
+    '''
+    main function used mainly for testing purposes
+    '''
+    print("Hello world! I'm the Output Slot class")
+    output_slot = RPiOutputSlot("(0,3)", "Light", ["RPI_INPUTBUTTON_PI1_0_1_PRESSED|TOGGLE"])
+    print(output_slot)
+    print(RPiRelayTimerSlot("Ventilator", 60, 600))
+    print("Bye world")
+
+if __name__ == '__main__':
+    main()
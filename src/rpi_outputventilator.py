@@ -11,10 +11,14 @@ Copyright:	(c) Wim 2019
 Licence:
 '''
 
+import functools
+import re
 import time
 from rpi_piface import RPiPiface
+from rpi_outputslots import RPiOutputSlot, RPiRelayTimerSlot
 
 from rpi_processframework import RPiProcessFramework
+from rpi_timerheap import RPiTimerHeap
 
 class RPiOutputVentilator(RPiProcessFramework, RPiPiface):
     '''
@@ -63,14 +67,27 @@ class RPiOutputVentilator(RPiProcessFramework, RPiPiface):
                     - RunTime => Time the Ventilator should run after receiving the "Start" event
                                  Value = 0 means that now timer is used. Stopping the Ventilator
                                  is handled externally
+        - relay_timers => RPiTimerHeap instance running the RunTime and LagTime timers
+        - runtime_timers, lagtime_timers => dictionaries with the running RunTime and LagTime
+                                            timer of each relay (same key as relay_timer)
     '''
+    # Method handling each action of the process logic
+    ACTIONS = {"TOGGLE": "_toggle_ventilator"}
+    # Entries of the process configuration file holding the output relays and relay timers
+    OUTPUT_KEYWORD = re.compile(r"Relay\d\d")
+    TIMER_KEYWORD = re.compile(r"RelayTimer\d\d")
+
     def __init__(self):
         # Initialize process framework attributes so we can start using them
         RPiProcessFramework.__init__(self, default_log_level='INFO')
 
         # Initialize all installed PiFace boards
         self.logger_instance.debug("RPiOutputVentilator - Initializing PiFace boards")
-        RPiPiface.__init__(self)
+        # When an output arbiter is configured, the outputs are written by the arbiter
+        RPiPiface.__init__(self,
+                           self.process_attributes.get_item("OutputArbiter"),
+                           self.process_attributes.get_item("ProcessName"),
+                           self.get_float_attribute("OutputResyncTime", 5.0))
         # Let's share some log information
         if RPiPiface.get_number_of_boards(self) == 0:
             self.logger_instance.critical(
@@ -85,15 +102,30 @@ class RPiOutputVentilator(RPiProcessFramework, RPiPiface):
                 "RPiOutputVentilator - More than one PiFace board detected." +\
                 "Address of last detected board = {}".format(RPiPiface.get_number_of_boards(self)-1))
 
+        self.initialize_outputs()
+
+    def __del__(self):
+        self.logger_instance.info("RPiOutputVentilator - Process Stopping!")
+
+    def initialize_outputs(self):
+        '''
+        method that creates the output relay list, the relay timer list and the process logic
+        dictionary from the process attributes. Also used when the process runs as a role of
+        an output host
+        '''
         # Initialize the output relay dictionary
         self.output_relays = self.create_output_relay_list(self.process_attributes.__repr__())
         # Initialize the relay timer dictionary
         self.relays_timer = self.create_relay_timer_list(self.process_attributes.__repr__())
         # Initialize the process logic dictionary
         self.process_logic = self.create_process_logic_dictionary()
-
-    def __del__(self):
-        self.logger_instance.info("RPiOutputVentilator - Process Stopping!")
+        self.send_event_subscriptions(self.process_logic)
+        # The ventilators are stopped by a timer, the message pump wakes up when
+        # the first one expires
+        self.relay_timers = RPiTimerHeap()
+        self.runtime_timers = {}
+        self.lagtime_timers = {}
+        self.next_deadline = self.relay_timers.next_deadline
 
     def __repr__(self):
         return str(RPiPiface.get_number_of_boards(self))
@@ -122,130 +154,116 @@ class RPiOutputVentilator(RPiProcessFramework, RPiPiface):
 
         return long_string
 
-    @classmethod
-    def _get_board_number(cls, key):
-        '''
-        function that retrieves the button board number
-        '''
-        return int(key[1])
-
-    @classmethod
-    def _get_relay_number(cls, key):
-        '''
-        function that retrieves the button relay number
-        '''
-        return int(key[3])
-
     def _get_state(self, key):
         '''
         Gether method to retrieve state value for a relay
         '''
-        return self.output_relays[key][0]
+        return self.output_relays[key].state
 
     def _get_description(self, key):
         '''
         Gether method to retrieve description for a relay
         '''
-        return self.output_relays[key][1]
+        return self.output_relays[key].description
 
     def _get_logic(self, key):
         '''
         Gether method to retrieve logic value for a relay
         '''
-        return self.output_relays[key][2]
+        return self.output_relays[key].logic
 
     def _get_pulse(self, key):
         '''
         Gether method to retrieve pulse value for a relay
         '''
-        return self.output_relays[key][3]
+        return self.output_relays[key].pulse
 
     def _get_pulse_timestamp(self, key):
         '''
         Gether method to retrieve pulse timestamp value for a relay
         '''
-        return self.output_relays[key][4]
+        return self.output_relays[key].pulse_timestamp
 
     def _set_state(self, key, state):
         '''
         Sether method to set state value for a relay to
         the value provided by the state parameter
         '''
-        self.output_relays[key][0] = state
+        self.output_relays[key].state = state
 
     def _set_pulse(self, key, state):
         '''
         Sether method to set pulse value for a relay to
         the value provided by the state parameter
         '''
-        self.output_relays[key][3] = state
+        self.output_relays[key].pulse = state
 
     def _set_relay_timestamp(self, key, timestamp):
         '''
         method that sets the output relay pulse timestamp
         '''
-        self.output_relays[key][4] = timestamp
+        self.output_relays[key].pulse_timestamp = timestamp
 
     def _get_relaytimer_state(self, key):
         '''
         Gether method to retrieve state value for a relay timer
         '''
-        return self.relays_timer[key][0]
+        return self.relays_timer[key].state
 
     def _get_relaytimer_description(self, key):
         '''
         Gether method to retrieve description for a relay timer
         '''
-        return self.relays_timer[key][1]
+        return self.relays_timer[key].description
 
     def _get_relaytimer_lagtime(self, key):
         '''
         Geter method to retrieve lagtime for a relay timer
         '''
-        return self.relays_timer[key][2]
+        return self.relays_timer[key].lagtime
 
     def _get_relaytimer_runtime(self, key):
         '''
         Geter method to retrieve runtime for a relay timer
         '''
-        return self.relays_timer[key][3]
+        return self.relays_timer[key].runtime
 
     def _get_relaytimer_starttime(self, key):
         '''
         Geter method to retrieve start time for a relay timer
         '''
-        return self.relays_timer[key][4]
+        return self.relays_timer[key].start_time
 
     def _get_relaytimer_stoptime(self, key):
         '''
         Geter method to retrieve stop time for a relay timer
         '''
-        return self.relays_timer[key][5]
+        return self.relays_timer[key].stop_time
 
     def _set_relaytimer_state(self, key, state):
         '''
         Sether method to set state value for a relay timer to
         the value provided by the state parameter
         '''
-        self.relays_timer[key][0] = state
+        self.relays_timer[key].state = state
 
     def _set_relaytimer_start_timestamp(self, key, timestamp):
         '''
         method that sets relay timer start time
         '''
-        self.relays_timer[key][4] = timestamp
+        self.relays_timer[key].start_time = timestamp
 
     def _set_relaytimer_stop_timestamp(self, key, timestamp):
         '''
         method that sets relay timer stop time
         '''
-        self.relays_timer[key][5] = timestamp
+        self.relays_timer[key].stop_time = timestamp
 
     def create_output_relay_list(self, process_attribute_list):
         '''
         Return value is a dictionary where
           - The key is set as the address consisting of the board and relay number
-          - The corresponding values a list structure containing following attributes:
+          - The corresponding value is an RPiOutputSlot with following attributes:
             - State => integer that is either 0 =>Relay in 'released' state or
               1 => Relay in 'pulled' state
             - Description => String value
@@ -261,30 +279,33 @@ class RPiOutputVentilator(RPiProcessFramework, RPiPiface):
                 key = "Relay" + str(board) + str(pin)
                 if key in process_attribute_list:
                     value = process_attribute_list[key]
-                    attribute_key, description, logic = value.split(
-                        ";")
+                    attribute_key, description, logic = self.split_attribute_value(value)
                     logic_list = []
                     logic_list = logic.split(',')
                     if description != "Not Used":
-                        reply[attribute_key] = [
-                            0,  # State
-                            description,
-                            logic_list,
-                            0,  # Pulse
-                            0]  # Timestamp when pulse status was change
+                        try:
+                            reply[attribute_key] = RPiOutputSlot(attribute_key,
+                                                                 description,
+                                                                 logic_list)
+                        except ValueError:
+                            self.logger_instance.error(
+                                "RPiOutputVentilator - Invalid address {} for {} - skipping".format(
+                                    attribute_key,
+                                    key))
+                            continue
                         self.logger_instance.debug(
                             "RPiOutputVentilator - Initializing output_relay: {}".format(
                                 attribute_key) +\
                             " - State: {}".format(
-                                reply[attribute_key][0]) +\
+                                reply[attribute_key].state) +\
                             " - Description: {}".format(
-                                reply[attribute_key][1]) +\
+                                reply[attribute_key].description) +\
                             " - Logic: {}".format(
-                                reply[attribute_key][2]) +\
+                                reply[attribute_key].logic) +\
                             " - Pulse: {}".format(
-                                reply[attribute_key][3]) +\
+                                reply[attribute_key].pulse) +\
                             " - Pulse Time Stamp: {}".format(
-                                reply[attribute_key][4])
+                                reply[attribute_key].pulse_timestamp)
                             )
 
         return reply
@@ -293,7 +314,7 @@ class RPiOutputVentilator(RPiProcessFramework, RPiPiface):
         '''
         Return value is a dictionary where
           - The key is set as the address consisting of the board and relay number
-          - The corresponding values a list structure containing following attributes:
+          - The corresponding value is an RPiRelayTimerSlot with following attributes:
             - State => integer that is either 0 => Timer is not running or
               1 => Timer is running
             - Description => String value
@@ -308,27 +329,22 @@ class RPiOutputVentilator(RPiProcessFramework, RPiPiface):
                 key = "RelayTimer" + str(board) + str(pin)
                 if key in process_attribute_list:
                     value = process_attribute_list[key]
-                    attribute_key, description, lagtime, runtime = value.split(
-                        ";")
+                    attribute_key, description, lagtime, runtime = self.split_attribute_value(value)
                     if description != "Not Used":
-                        reply[attribute_key] = [
-                            0,  # State
-                            description,
-                            int(lagtime),
-                            int(runtime),
-                            0, # start_time
-                            0] # stop_time
+                        reply[attribute_key] = RPiRelayTimerSlot(description,
+                                                                 int(lagtime),
+                                                                 int(runtime))
                         self.logger_instance.debug(
                             "RPiOutputVentilator - Initializing relay_timer: {}".format(
                                 attribute_key) +\
                             " - State: {}".format(
-                                reply[attribute_key][0]) +\
+                                reply[attribute_key].state) +\
                             " - Description: {}".format(
-                                reply[attribute_key][1]) +\
+                                reply[attribute_key].description) +\
                             " - LagTime: {}".format(
-                                reply[attribute_key][2]) +\
+                                reply[attribute_key].lagtime) +\
                             " - RunTime: {}".format(
-                                reply[attribute_key][3])
+                                reply[attribute_key].runtime)
                             )
 
         return reply
@@ -345,10 +361,20 @@ class RPiOutputVentilator(RPiProcessFramework, RPiPiface):
             for key in self.output_relays:
                 action_list = []
                 attributes = self.output_relays[key]
-                logic_list = attributes[2]
+                logic_list = attributes.logic
                 for items in logic_list:
                     input_reference, action = items.split('|')
-                    action_list_item = [key, action]
+                    if action not in self.ACTIONS:
+                        self.logger_instance.warning(
+                            "RPiOutputVentilator - Unknown action {} for {} - skipping!".format(
+                                action,
+                                input_reference))
+                        continue
+                    # The action is bound to the attributes of the relay, so handling an
+                    # event is a single lookup of the process logic
+                    action_list_item = functools.partial(getattr(self, self.ACTIONS[action]),
+                                                         key,
+                                                         attributes)
                     if input_reference in logic_dictionary: # pylint: disable=consider-using-get
                         action_list = logic_dictionary[input_reference]
                     else:
@@ -356,69 +382,104 @@ class RPiOutputVentilator(RPiProcessFramework, RPiPiface):
                     self.logger_instance.debug(
                         "RPiOutputVentilator - Adding item to process logic list {}: {}".format(
                                                                                            input_reference,
-                                                                                           action_list_item))
+                                                                                           [key, action]))
                     action_list.append(action_list_item)
                     logic_dictionary[input_reference] = action_list
 
-        return logic_dictionary
+        return {input_reference: tuple(action_list)
+                for input_reference, action_list in logic_dictionary.items()}
 
     def _handle_output_relays(self):
         '''
         This method will scan all active relays and sets the 'state' value
-        as stored in the attributes for each relay.
+        as stored in the attributes for each relay in the shadow output register.
         '''
-        for key in self.output_relays:
-            if self._get_state(key) == 0:
-                RPiPiface.reset_output_relay(self, self._get_board_number(key), self._get_relay_number(key))
-            else:
-                RPiPiface.set_output_relay(self, self._get_board_number(key), self._get_relay_number(key))
+        for relay in self.output_relays.values():
+            RPiPiface.set_output_relay_bit(self, relay.board, relay.pin, relay.state)
 
     def parse_input_button_message(self, message):
         '''
         Method responsible to parse an incomming input button message
-        Valid actions:
-        - PULSE
-        Other actions are ignored
+        Valid actions (see ACTIONS):
+        - TOGGLE
+        Other actions are ignored when the process logic dictionary is created
         '''
-        self.logger_instance.debug(
-            "RPiOutputVentilator - Parsing input button message {}".format(message))
+        if self.logger_instance.is_debug_enabled():
+            self.logger_instance.debug(
+                "RPiOutputVentilator - Parsing input button message {}".format(message))
         try:
             action_list = self.process_logic[message]
-            for relay_key, relay_action in action_list:
-                if relay_action == "TOGGLE":
-                    if self._get_state(relay_key) == 0:
-                        self._set_state(relay_key, 1)
-                        self.logger_instance.info(
-                            "RPiOutputVentilator - Setting relay {} - {}".format(
-                                relay_key,
-                                self._get_description(relay_key)))
-                        self._set_relaytimer_state(relay_key, 1)
-                        self._set_relaytimer_start_timestamp(relay_key, time.time())
-                        # set stop timestamp to 0 to indicate we entered a new run cycle
-                        self._set_relaytimer_stop_timestamp(relay_key, 0)
-                        self.logger_instance.debug(
-                            "RPiOutputVentilator - Setting relay timer {} - {} at {}".format(
-                                relay_key,
-                                self._get_relaytimer_description(relay_key),
-                                self._get_relaytimer_starttime(relay_key)))
-                    else:
-                    # We don't actually reset the relay state but only set the time we received the
-                    # stop event. Actual resetting of the relay state is handled on a different place
-#                        self._set_state(relay_key, 0)
-#                        self.logger_instance.info(
-#                            "RPiOutputVentilator - Resetting relay {} - {}".format(
-#                                relay_key,
-#                                self._get_description(relay_key)))
-#                        self._set_relaytimer_state(relay_key, 0)
-                        self._set_relaytimer_stop_timestamp(relay_key, time.time())
-                        self.logger_instance.debug(
-                            "RPiOutputVentilator - Stop event received for relay {} - {} at {}".format(
-                                relay_key,
-                                self._get_relaytimer_description(relay_key),
-                                self._get_relaytimer_stoptime(relay_key)))
         except KeyError:
             self.logger_instance.warning(
                 "RPiOutputVentilator - Unknow input event received {} - skipping".format(message))
+            return
+
+        for action in action_list:
+            action()
+
+    def _toggle_ventilator(self, key, relay):
+        '''
+        TOGGLE action, relay is the RPiOutputSlot of the relay driving the Ventilator
+        The first event starts the Ventilator, the next one stops it after the lag time
+        A relay without RelayTimer entry is toggled without run time or lag time
+        '''
+        if key not in self.relays_timer:
+            if relay.state == 0:
+                relay.state = 1
+                self.logger_instance.info(
+                    "RPiOutputVentilator - Setting relay {} - {}".format(
+                        key,
+                        relay.description))
+            else:
+                relay.state = 0
+                self.logger_instance.info(
+                    "RPiOutputVentilator - Resetting relay {} - {}".format(
+                        key,
+                        relay.description))
+            return
+
+        if relay.state == 0:
+            relay.state = 1
+            self.logger_instance.info(
+                "RPiOutputVentilator - Setting relay {} - {}".format(
+                    key,
+                    relay.description))
+            self._set_relaytimer_state(key, 1)
+            self._set_relaytimer_start_timestamp(key, time.time())
+            # set stop timestamp to 0 to indicate we entered a new run cycle
+            self._set_relaytimer_stop_timestamp(key, 0)
+            self._cancel_relay_timers(key)
+            if self._get_relaytimer_runtime(key) > 0:
+                self.runtime_timers[key] = self.relay_timers.schedule(
+                    self._get_relaytimer_runtime(key),
+                    self._runtime_expired,
+                    key)
+            self.logger_instance.debug(
+                "RPiOutputVentilator - Setting relay timer {} - {} at {}".format(
+                    key,
+                    self._get_relaytimer_description(key),
+                    self._get_relaytimer_starttime(key)))
+        else:
+        # We don't actually reset the relay state but only set the time we received the
+        # stop event. Actual resetting of the relay state is handled on a different place
+#            self._set_state(key, 0)
+#            self.logger_instance.info(
+#                "RPiOutputVentilator - Resetting relay {} - {}".format(
+#                    key,
+#                    relay.description))
+#            self._set_relaytimer_state(key, 0)
+            self._set_relaytimer_stop_timestamp(key, time.time())
+            if self._get_relaytimer_state(key) == 1:
+                self.relay_timers.cancel(self.lagtime_timers.get(key))
+                self.lagtime_timers[key] = self.relay_timers.schedule(
+                    self._get_relaytimer_lagtime(key),
+                    self._lagtime_expired,
+                    key)
+            self.logger_instance.debug(
+                "RPiOutputVentilator - Stop event received for relay {} - {} at {}".format(
+                    key,
+                    self._get_relaytimer_description(key),
+                    self._get_relaytimer_stoptime(key)))
 
     def process_message(self, message):
         '''
@@ -444,6 +505,7 @@ class RPiOutputVentilator(RPiProcessFramework, RPiPiface):
                 self.relays_timer = self.create_relay_timer_list(
                     self.process_attributes.__repr__())
                 self.process_logic = self.create_process_logic_dictionary()
+                self.send_event_subscriptions(self.process_logic)
         elif message_list[0] == "I":  # An input button related message was received
             self.logger_instance.debug(
                 "RPiOutputVentilator - Parsing input button message received {} - {}".format(
@@ -456,26 +518,91 @@ class RPiOutputVentilator(RPiProcessFramework, RPiPiface):
     def process_output_ventilator(self):
         '''
         Method to handle output relays to control the ventilators
-        First we check if the Ventilator should be switched off
-        based on the timer function
+        The shadow output register is updated and written to the boards.
+        The relays are only written when their state changed.
+        '''
+        self.update_output_ports()
+
+        # Only boards with changed relays are written
+        RPiPiface.write_output_ports(self)
+
+    def _cancel_relay_timers(self, relay):
+        '''
+        method that cancels the RunTime and LagTime timer of a relay
+        '''
+        self.relay_timers.cancel(self.runtime_timers.pop(relay, None))
+        self.relay_timers.cancel(self.lagtime_timers.pop(relay, None))
+
+    def _runtime_expired(self, relay):
+        '''
+        Timer call back function stopping the Ventilator once it ran for "runtime" seconds
+        Nothing is done when the relay or its RelayTimer entry was removed in the meantime
+        '''
+        self.runtime_timers.pop(relay, None)
+        if relay in self.output_relays and relay in self.relays_timer and \
+                self._get_relaytimer_state(relay) == 1:
+            self._cancel_relay_timers(relay)
+            self._set_state(relay, 0)
+            self._set_relaytimer_state(relay, 0)
+            self.logger_instance.info(
+                "RPiOutputVentilator - Resetting pulse state to 0 for {} after maximum runtime period ({} seconds)".format(relay, self._get_relaytimer_runtime(relay)))
+
+    def _lagtime_expired(self, relay):
+        '''
+        Timer call back function stopping the Ventilator "lagtime" seconds after the stop event
+        Nothing is done when the relay or its RelayTimer entry was removed in the meantime
+        '''
+        self.lagtime_timers.pop(relay, None)
+        if relay in self.output_relays and relay in self.relays_timer and \
+                self._get_relaytimer_state(relay) == 1:
+            self._cancel_relay_timers(relay)
+            self._set_state(relay, 0)
+            self._set_relaytimer_state(relay, 0)
+            self._set_relaytimer_stop_timestamp(relay, 0)
+            self.logger_instance.info(
+                "RPiOutputVentilator - Resetting pulse state to 0 for {} after lagtime period ({} seconds)".format(relay, self._get_relaytimer_lagtime(relay)))
+
+    def apply_process_attribute_changes(self, changes):
+        '''
+        Method to apply the changed entries of the process configuration file. Only the changed
+        relays and relay timers are created again, the state and running timers of the other
+        ventilators are kept. A removed ventilator is stopped, a changed LagTime or RunTime
+        is used the next time the ventilator is started. When the relay timer of a ventilator
+        is removed, its running timers are cancelled and the ventilator is toggled without
+        run time or lag time from then on
+        '''
+        output_relays = dict(self.output_relays)
+        relays_timer = dict(self.relays_timer)
+        relays_changed = self.update_output_dictionary(self.output_relays,
+                                                       self.create_output_relay_list,
+                                                       changes,
+                                                       self.OUTPUT_KEYWORD,
+                                                       ("state", "pulse", "pulse_timestamp"))
+        self.update_output_dictionary(self.relays_timer,
+                                      self.create_relay_timer_list,
+                                      changes,
+                                      self.TIMER_KEYWORD,
+                                      ("state", "start_time", "stop_time"))
+        # Removed ventilators are stopped
+        for key in output_relays.keys() - self.output_relays.keys():
+            self._cancel_relay_timers(key)
+            RPiPiface.set_output_relay_bit(self,
+                                           output_relays[key].board,
+                                           output_relays[key].pin,
+                                           0)
+        for key in relays_timer.keys() - self.relays_timer.keys():
+            self._cancel_relay_timers(key)
+        if relays_changed:
+            self.process_logic = self.create_process_logic_dictionary()
+            self.send_event_subscriptions(self.process_logic)
+
+    def update_output_ports(self):
+        '''
+        Method to update the shadow output register of the ventilator relays
+        First the Ventilators with an expired RunTime or LagTime timer are switched off
         Next we set all the relays accordig to their status
         '''
-        for relay in self.output_relays:
-            if (self._get_relaytimer_state(relay) == 1) and (self._get_relaytimer_runtime(relay) > 0):
-                # If the ventilator is active for more than "runtime" second, reset the relay state
-                if (time.time() - self._get_relaytimer_starttime(relay)) > self._get_relaytimer_runtime(relay):
-                    self._set_state(relay, 0)
-                    self._set_relaytimer_state(relay, 0)
-                    self.logger_instance.info(
-                        "RPiOutputVentilator - Resetting pulse state to 0 for {} after maximum runtime period ({} seconds)".format(relay, self._get_relaytimer_runtime(relay)))
-            if (self._get_relaytimer_state(relay) == 1) and (self._get_relaytimer_stoptime(relay) != 0):
-                # If the ventilator is "stopped" for more than "lagtime" second, reset the relay state
-                if (time.time() - self._get_relaytimer_stoptime(relay)) > self._get_relaytimer_lagtime(relay):
-                    self._set_state(relay, 0)
-                    self._set_relaytimer_state(relay, 0)
-                    self._set_relaytimer_stop_timestamp(relay, 0)
-                    self.logger_instance.info(
-                        "RPiOutputVentilator - Resetting pulse state to 0 for {} after lagtime period ({} seconds)".format(relay, self._get_relaytimer_lagtime(relay)))
+        self.relay_timers.advance()
 
         self._handle_output_relays()
 
@@ -486,11 +613,8 @@ def main():
 
     output_handler_instance = RPiOutputVentilator()
 
-    while output_handler_instance.run_process:
-        with output_handler_instance.process_input_queue as consumer:
-            output_handler_instance.run_process = consumer.consume(  # pylint: disable=assignment-from-no-return
-                output_handler_instance.process_message,
-                output_handler_instance.process_output_ventilator)
+    output_handler_instance.run(output_handler_instance.process_message,
+                                output_handler_instance.process_output_ventilator)
 
 if __name__ == '__main__':
     main()
@@ -9,10 +9,15 @@ Created:	9/09/2018
 Copyright:	(c) Wim 2018
 Licence:
 '''
+import socket
+import time
 
 import pifacedigitalio
 from pifacedigitalio import NoPiFaceDigitalDetectedError
 
+# Maximum number of PiFace boards (addresses 0, 1, 2 and 3)
+MAX_BOARDS = 4
+
 class RPiPiface():
     '''
     This class is created to handle piface specific functionality
@@ -21,12 +26,51 @@ class RPiPiface():
     Following attributes are defined in the RPiInputButton class:
         - piface => List of pifacedigitalio objects. One item per Piface Board
         - number_of_boards => total number of Piface boards detected
+        - output_port_value => List with the shadow output register of each board. This is the
+          8-bit value the outputs of the board should be set to
+        - output_port_mask => List with, for each board, the output pins managed by this process
+        - output_port_written => List with, for each board, the mask and value that were last
+          written to the board (None when nothing was written yet)
+        - input_event_listeners => List of pifacedigitalio event listeners, one per board,
+          when interrupt detection of the digital inputs is active
+        - output_arbiter => Path of the socket of the output arbiter (see RPiOutputArbiter),
+          None when the outputs are written directly to the boards
+        - output_resync_time => time in seconds after which the shadow output registers are
+          written (or sent to the output arbiter) again, even when they didn't change
+    When the outputs are written directly and several processes manage output pins of the
+    same board, each write is a read-modify-write of the output port (two SPI transactions)
+    which is not atomic across processes: when two processes interleave, an update can be
+    lost. Writing the registers again every output_resync_time seconds restores such a lost
+    update, but only an output arbiter (see RPiOutputArbiter) avoids the race.
+    When an output arbiter is used, the boards are not initialized by this process (which
+    would reset the outputs set by other processes). write_output_ports sends the shadow
+    output registers to the arbiter instead, which does the actual writes. The registers are
+    sent again every output_resync_time seconds, so a restarted arbiter gets the actual state.
+    The methods reading or setting a single output (pin or relay) use the shadow output
+    registers in that case, the methods reading the inputs return -1 (no boards opened)
     '''
-    
-    def __init__(self):
+
+    def __init__(self, output_arbiter=None, client_name=None, resync_time=5.0):
         self.piface = []
         self.number_of_boards = 0
-        for board in range(0, 5):
+        self.output_arbiter = output_arbiter
+        self.arbiter_client_name = client_name
+        self.output_resync_time = resync_time
+        self.arbiter_errors = 0
+        self._arbiter_socket = None
+        self._output_resync = 0.0
+        if output_arbiter is not None:
+            # The boards are owned by the output arbiter
+            self.number_of_boards = MAX_BOARDS
+            self._arbiter_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._arbiter_socket.setblocking(False)
+            self.output_port_value = [0] * self.number_of_boards
+            self.output_port_mask = [0] * self.number_of_boards
+            self.output_port_written = [None] * self.number_of_boards
+            self.input_event_listeners = []
+            return
+
+        for board in range(0, MAX_BOARDS + 1):
             # A maximim of 4 boards can be installed, each with a dedicated address 0, 1, 2 or 3
             # We will try to initialize a board with these addresses
             # Once the initialization fails (and it eventually will fail when we try address 4)
@@ -40,7 +84,37 @@ class RPiPiface():
                 break   # we assume that there are no gaps in the addresses of
                         # the PiFace boards so we exit the for loop
 
+        # Shadow output registers, outputs are only written when their value changes
+        self.output_port_value = [0] * self.number_of_boards
+        self.output_port_mask = [0] * self.number_of_boards
+        self.output_port_written = [None] * self.number_of_boards
+
+        self.input_event_listeners = []
+
+    def share_piface(self, piface_owner):
+        '''
+        method to use the PiFace boards of another RPiPiface instance instead of
+        initializing the boards again. The shadow output registers are shared as well,
+        so the outputs set by both instances are written with a single write per board
+        '''
+        self.piface = piface_owner.piface
+        self.number_of_boards = piface_owner.number_of_boards
+        self.output_port_value = piface_owner.output_port_value
+        self.output_port_mask = piface_owner.output_port_mask
+        self.output_port_written = piface_owner.output_port_written
+        self.output_arbiter = piface_owner.output_arbiter
+        self.arbiter_client_name = piface_owner.arbiter_client_name
+        self.output_resync_time = piface_owner.output_resync_time
+        self.arbiter_errors = 0
+        self._arbiter_socket = None
+        self._output_resync = 0.0
+        self.input_event_listeners = []
+
     def __str__(self):
+        if self.output_arbiter is not None:
+            return "Outputs written by output arbiter {} - {} errors\n".format(
+                self.output_arbiter,
+                self.arbiter_errors)
         long_string = "Number of PiFace boards detected: {}\n".format(self.number_of_boards)
         return long_string
 
@@ -55,11 +129,69 @@ class RPiPiface():
         - board_number: allowed values 0->3
         - input_number to represent the pin: allowed values 0->7 
         '''
-        if (0 <= board_number < self.number_of_boards) and (0 <= input_number <= 7):
+        if (0 <= board_number < len(self.piface)) and (0 <= input_number <= 7):
             return self.piface[board_number].input_pins[input_number].value
         else:
             return -1
 
+    def get_input_port_state(self, board_number):
+        '''
+        get method to retrieve the actual status of all 8 digital inputs of a board
+        using a single read of the input port
+        1 parameter needs to be provided:
+        - board_number: allowed values 0->3
+        Bit n of the returned value represents the status of input pin n
+        '''
+        if 0 <= board_number < len(self.piface):
+            return self.piface[board_number].input_port.value
+        else:
+            return -1
+
+    def get_input_ports_state(self):
+        '''
+        get method to retrieve the actual status of the digital inputs of all boards
+        A list is returned with one 8-bit value (bit n => input pin n) per board
+        Only one read is done per board
+        '''
+        return [piface.input_port.value for piface in self.piface]
+
+    def activate_input_interrupts(self, callback):
+        '''
+        method to start interrupt detection of the digital inputs on all boards
+        The interrupt-on-change line of the boards is used, so the inputs don't need
+        to be polled. For each change on an input pin the callback function is run
+        (in the thread of the event listener) with 4 parameters:
+        - board_number
+        - input_number
+        - state: 1 => input became active, 0 => input became inactive
+        - timestamp: time when the change was detected
+        '''
+        self.deactivate_input_interrupts()
+
+        def create_event_handler(board_number):
+            def event_handler(event):
+                callback(board_number,
+                         event.pin_num,
+                         1 if event.direction == pifacedigitalio.IODIR_ON else 0,
+                         event.timestamp)
+            return event_handler
+
+        for board_number, piface in enumerate(self.piface):
+            listener = pifacedigitalio.InputEventListener(chip=piface)
+            event_handler = create_event_handler(board_number)
+            for input_number in range(0, 8):
+                listener.register(input_number, pifacedigitalio.IODIR_BOTH, event_handler)
+            listener.activate()
+            self.input_event_listeners.append(listener)
+
+    def deactivate_input_interrupts(self):
+        '''
+        method to stop interrupt detection of the digital inputs
+        '''
+        for listener in self.input_event_listeners:
+            listener.deactivate()
+        self.input_event_listeners = []
+
     # Methods related to the digital outputs
     def get_output_pin_state(self, board_number, pin_number):
         '''
@@ -69,6 +201,8 @@ class RPiPiface():
         - pin_number to represent the pin: allowed values 0->7 
         '''
         if (0 <= board_number < self.number_of_boards) and (0 <= pin_number <= 7):
+            if self.output_arbiter is not None:
+                return (self.output_port_value[board_number] >> pin_number) & 1
             return self.piface[board_number].output_pins[pin_number].value
         else:
             return -1
@@ -81,7 +215,10 @@ class RPiPiface():
         - pin_number to represent the pin: allowed values 0->7 
         '''
         if (0 <= board_number < self.number_of_boards) and (0 <= pin_number <= 7):
-            self.piface[board_number].output_pins[pin_number].value = 1
+            if self.output_arbiter is not None:
+                self._write_output_bit(board_number, pin_number, 1)
+            else:
+                self.piface[board_number].output_pins[pin_number].value = 1
 
     def reset_output_pin(self, board_number, pin_number):
         '''
@@ -91,7 +228,10 @@ class RPiPiface():
         - pin_number to represent the pin: allowed values 0->7 
         '''
         if (0 <= board_number < self.number_of_boards) and (0 <= pin_number <= 7):
-            self.piface[board_number].output_pins[pin_number].value = 0
+            if self.output_arbiter is not None:
+                self._write_output_bit(board_number, pin_number, 0)
+            else:
+                self.piface[board_number].output_pins[pin_number].value = 0
 
     # Methods related to the output relays
     def get_output_relay_state(self, board_number, relay_number):
@@ -102,6 +242,8 @@ class RPiPiface():
         - relay_number: allowed values 0->1 
         '''
         if (0 <= board_number < self.number_of_boards) and (0 <= relay_number <= 1):
+            if self.output_arbiter is not None:
+                return (self.output_port_value[board_number] >> relay_number) & 1
             return self.piface[board_number].relays[relay_number].value
         else:
             return -1
@@ -114,7 +256,10 @@ class RPiPiface():
         - relay_number: allowed values 0->1 
         '''
         if (0 <= board_number < self.number_of_boards) and (0 <= relay_number <= 1):
-            self.piface[board_number].relays[relay_number].value = 1
+            if self.output_arbiter is not None:
+                self._write_output_bit(board_number, relay_number, 1)
+            else:
+                self.piface[board_number].relays[relay_number].value = 1
 
     def reset_output_relay(self, board_number, relay_number):
         '''
@@ -124,4 +269,119 @@ class RPiPiface():
         - relay_number: allowed values 0->1 
         '''
         if (0 <= board_number < self.number_of_boards) and (0 <= relay_number <= 1):
-            self.piface[board_number].relays[relay_number].value = 0
\ No newline at end of file
+            if self.output_arbiter is not None:
+                self._write_output_bit(board_number, relay_number, 0)
+            else:
+                self.piface[board_number].relays[relay_number].value = 0
+
+    # Methods related to the shadow output registers
+    def _write_output_bit(self, board_number, pin_number, state):
+        '''
+        Used by the methods setting a single output (pin or relay) when the boards are
+        owned by the output arbiter: the output is set in the shadow output register
+        which is sent to the arbiter right away
+        '''
+        self.set_output_port_bit(board_number, pin_number, state)
+        self.write_output_ports()
+
+    def set_output_port_bit(self, board_number, pin_number, state):
+        '''
+        set method to change the status of a digital output in the shadow output register
+        Nothing is written to the board until write_output_ports is called
+        3 parameters need to be provide:
+        - board_number: allowed values 0->3
+        - pin_number to represent the pin: allowed values 0->7
+        - state: 0 => 'off', any other value => 'on'
+        '''
+        if (0 <= board_number < self.number_of_boards) and (0 <= pin_number <= 7):
+            bit = 1 << pin_number
+            self.output_port_mask[board_number] |= bit
+            if state:
+                self.output_port_value[board_number] |= bit
+            else:
+                self.output_port_value[board_number] &= ~bit
+
+    def set_output_relay_bit(self, board_number, relay_number, state):
+        '''
+        set method to change the status of a relay in the shadow output register
+        Relay 0 and 1 are driven by output pin 0 and 1 of the board
+        3 parameters need to be provide:
+        - board_number: allowed values 0->3
+        - relay_number: allowed values 0->1
+        - state: 0 => 'off', any other value => 'on'
+        '''
+        if 0 <= relay_number <= 1:
+            self.set_output_port_bit(board_number, relay_number, state)
+
+    def write_output_ports(self):
+        '''
+        method that writes the shadow output registers to the boards
+        A board is only written when the value of the output pins managed by this process
+        differs from the value that was last written, using a single write of the output port,
+        or when the resync time has expired
+        Output pins which are not managed by this process keep their actual status (the
+        output port is read first, see the class description for the race this leaves)
+        Return value is the number of boards that were written
+        '''
+        if self.output_arbiter is not None:
+            return self._send_output_ports()
+
+        now = time.monotonic()
+        resync = now >= self._output_resync
+        if resync:
+            self._output_resync = now + self.output_resync_time
+
+        boards_written = 0
+        for board_number in range(0, self.number_of_boards):
+            mask = self.output_port_mask[board_number]
+            value = self.output_port_value[board_number] & mask
+            if mask != 0 and (resync or
+                              self.output_port_written[board_number] != (mask << 8) | value):
+                output_port = self.piface[board_number].output_port
+                if mask == 0xFF:
+                    output_port.value = value
+                else:
+                    output_port.value = (output_port.value & ~mask & 0xFF) | value
+                self.output_port_written[board_number] = (mask << 8) | value
+                boards_written += 1
+
+        return boards_written
+
+    def _send_output_ports(self):
+        '''
+        method that sends the shadow output registers to the output arbiter using a single
+        message: "<client name>;<board>,<mask>,<value>;..." (one item per board with
+        managed output pins). The message is only sent when an output changed or when
+        the resync time has expired
+        Return value is the number of boards that changed
+        '''
+        updates = []
+        boards_changed = 0
+        for board_number in range(0, self.number_of_boards):
+            mask = self.output_port_mask[board_number]
+            if mask != 0:
+                value = self.output_port_value[board_number] & mask
+                updates.append("{},{},{}".format(board_number, mask, value))
+                if self.output_port_written[board_number] != (mask << 8) | value:
+                    boards_changed += 1
+
+        now = time.monotonic()
+        if not updates or (boards_changed == 0 and now < self._output_resync):
+            return 0
+
+        try:
+            self._arbiter_socket.sendto(
+                "{};{}".format(self.arbiter_client_name, ";".join(updates)).encode(),
+                self.output_arbiter)
+        except OSError:
+            # Arbiter not running (yet), the message is sent again on the next tick
+            self.arbiter_errors += 1
+            return 0
+
+        for board_number in range(0, self.number_of_boards):
+            mask = self.output_port_mask[board_number]
+            if mask != 0:
+                self.output_port_written[board_number] = \
+                    (mask << 8) | (self.output_port_value[board_number] & mask)
+        self._output_resync = now + self.output_resync_time
+        return boards_changed
@@ -16,13 +16,22 @@ Licence:
 '''
 
 import argparse
-import time
+import re
 
 
 import rpi_logger
 from rpi_processattributes import RPiProcessAttributes
 from rpi_homedomoticaconfigurationfile import RPiHomedomoticaConfigurationFile
 from rpi_messageconsumer import RPiMessageConsumer
+from rpi_messagesender import RPiMessageSender
+from rpi_asyncruntime import RPiAsyncRuntime
+from rpi_configwatcher import RPiConfigWatcher
+
+# Reference to an input event as used in the process logic of the output processes,
+# for example RPI_INPUTBUTTON_PI1_0_1_PRESSED => process name, board, pin and event
+EVENT_REFERENCE = re.compile(r"^(.+)_(\d)_(\d)_([A-Z]+)$")
+# Routing key of an input event on the topic exchange => process name, board, pin and event
+EVENT_ROUTING_KEY = "input.{}.{}.{}.{}"
 
 class RPiProcessFramework():
     '''
@@ -36,6 +45,28 @@ class RPiProcessFramework():
             - InputQueueName
             - All entries provided in the process configuration file in block "[<process name>]"
         - process_input_queue => Handle to the input queue message processor
+        - process_runtime => How the message pump is run (see run), set by the 'Runtime'
+          entry in the process configuration file:
+            - BLOCKING => blocking consume loop of RPiMessageConsumer (default)
+            - ASYNCIO => RPiAsyncRuntime, consuming, ticking and publishing are coroutines
+              on a single asyncio event loop
+        - process_async_runtime => Handle to the RPiAsyncRuntime instance (ASYNCIO only,
+          None otherwise). Messages sent by the process (event subscriptions, input button
+          events) are published on the event loop of the runtime as well
+        - process_host => Handle to the RPiOutputHost instance when the process runs as a role
+          of an output host (see init_role), None otherwise
+        - next_deadline => function returning the time (time.monotonic) the tick call back
+          function must be run next, for example when a timer expires, or None. Set by the
+          process before calling run, so the message pump wakes up for it
+        - config_watcher => Handle to the RPiConfigWatcher instance of the process
+          configuration file, None when 'HotReload' is set to OFF in the configuration file.
+          When the file changes, the changed entries are applied (see check_config_file)
+        - event_routing_keys => routing keys of the events this process has rules for on the
+          topic exchange (see send_event_subscriptions)
+        - event_subscriptions => dictionary where
+            - The key is set as the name of the process producing input events
+            - The corresponding value is the list of events (<board>_<pin>_<event>) this
+              process has rules for, see send_event_subscriptions
     '''
 
     def __init__(self,                                                          # pylint: disable=too-many-arguments
@@ -43,7 +74,14 @@ class RPiProcessFramework():
                  default_log_file="/var/log/homedomotica/RPiHomedomotica.log",
                  default_log_to_console_enabled=False,
                  default_log_to_file_enabled=True,
-                 default_log_to_syslog_enabled=False):
+                 default_log_to_syslog_enabled=False,
+                 default_consume_mode='poll',
+                 default_tick_time=0.1,
+                 default_drain_max_messages=0,
+                 default_drain_max_time=0,
+                 default_prefetch_count=0,
+                 default_ack_batch_size=1,
+                 default_ack_batch_time=0):
 
         # Set variable to indicate the process should be running
         self.run_process = True
@@ -164,6 +202,28 @@ class RPiProcessFramework():
             file_path=self.process_attributes.get_item("ConfigFilePath"))
         self.refresh_process_attributes()
 
+        # Message pump settings can be overruled in the process configuration file
+        # By default the queue is polled and each message is acknowledged on its own
+        # - ConsumeMode => PUSH (broker delivers the messages) or POLL (queue is polled)
+        # - TickTime => Interval in seconds to run the "no message received" process
+        consume_mode = self.process_attributes.get_item("ConsumeMode")
+        if consume_mode is None:
+            consume_mode = default_consume_mode
+        tick_time = self.get_float_attribute("TickTime", default_tick_time)
+        # - DrainMaxMessages, DrainMaxTime => Maximum number of messages and time in seconds
+        #   spent on handling messages before the "no message received" process is run
+        #   (0 => no limit)
+        drain_max_messages = int(self.get_float_attribute("DrainMaxMessages",
+                                                          default_drain_max_messages))
+        drain_max_time = self.get_float_attribute("DrainMaxTime", default_drain_max_time)
+        # - PrefetchCount => Maximum number of unacknowledged messages delivered by the broker
+        #   (0 => no limit)
+        # - AckBatchSize, AckBatchTime => Messages are acknowledged in batches of AckBatchSize
+        #   messages or after AckBatchTime seconds (0 => no time limit)
+        prefetch_count = int(self.get_float_attribute("PrefetchCount", default_prefetch_count))
+        ack_batch_size = int(self.get_float_attribute("AckBatchSize", default_ack_batch_size))
+        ack_batch_time = self.get_float_attribute("AckBatchTime", default_ack_batch_time)
+
         # Initialize Input Queue so we can receive messages
         input_queue_configuration = {'queueName':\
                                         self.process_attributes.get_item("InputQueueName"),
@@ -180,10 +240,33 @@ class RPiProcessFramework():
                                      'queueDurable': False,
                                      'queueExclusive': False,
                                      'queueAutoDelete': False,
-                                     'sleepTime': 0.1}
+                                     'sleepTime': tick_time,
+                                     'consumeMode': str.lower(consume_mode),
+                                     'tickTime': tick_time,
+                                     'drainMaxMessages': drain_max_messages,
+                                     'drainMaxTime': drain_max_time,
+                                     'prefetchCount': prefetch_count,
+                                     'ackBatchSize': ack_batch_size,
+                                     'ackBatchTime': ack_batch_time,
+                                     'topicExchangeName':\
+                                        self.process_attributes.get_item("EventExchange")}
         self.process_input_queue = RPiMessageConsumer(
             input_queue_configuration)
 
+        self.event_subscriptions = {}
+        self.event_routing_keys = []
+        self.process_host = None
+
+        self.process_runtime = str(self.process_attributes.get_item("Runtime")).upper()
+        if self.process_runtime != "ASYNCIO":
+            self.process_runtime = "BLOCKING"
+            self.process_async_runtime = None
+        else:
+            self.process_async_runtime = RPiAsyncRuntime(self.process_input_queue,
+                                                         self.logger_instance)
+        self.next_deadline = None
+        self.config_watcher = self.create_config_watcher()
+
     def __del__(self):
         self.logger_instance.info("{} - Process Stopping!".format(__name__))
 
@@ -219,6 +302,9 @@ class RPiProcessFramework():
         - SET_LOG_LEVEL
         - PRINT_PROCESS_STATUS
         - REFRESH_PROCESS_ATTRIBUTES
+        - REQUEST_SUBSCRIPTION => send the event subscriptions again
+        - SUBSCRIBE => event subscription of a consumer, handled by the process
+          producing the events
         other messages are ignored
         Return value:
         - True: No STOP event received
@@ -251,6 +337,10 @@ class RPiProcessFramework():
                 self.logger_instance.info("Process Status:\n{}".format(self.__str__()))
             elif message_list[1] == "REFRESH_PROCESS_ATTRIBUTES":
                 self.refresh_process_attributes()
+            elif message_list[1] == "REQUEST_SUBSCRIPTION":
+                self.send_event_subscriptions()
+            elif message_list[1] == "SUBSCRIBE":
+                pass    # Handled by the process producing the events
             else:
                 self.logger_instance.warning(
                     "{} - Unknown process message '{}' received on queue {}".format(
@@ -292,6 +382,251 @@ class RPiProcessFramework():
                     self.config_file.invalid_keyword_list))
             self.run_process = False    # No need to continue
 
+    def create_config_watcher(self):
+        '''
+        Return value is an RPiConfigWatcher instance for the process configuration file,
+        None when 'HotReload' is set to OFF in the process configuration file
+        '''
+        if str(self.process_attributes.get_item("HotReload")).upper() == "OFF":
+            return None
+        return RPiConfigWatcher(self.config_file.__repr__(), self.logger_instance)
+
+    def check_config_file(self):
+        '''
+        Method run before each tick of the message pump: when the process configuration file
+        was changed, the changed entries are applied to the process (see
+        reload_process_attributes and apply_process_attribute_changes)
+        '''
+        if self.config_watcher is None or not self.config_watcher.changed():
+            return
+        changes = self.reload_process_attributes()
+        if changes:
+            self.logger_instance.info(
+                "{} - Config file {} changed - {} entries changed".format(
+                    __name__,
+                    self.config_file.__repr__(),
+                    len(changes)))
+            self.apply_process_attribute_changes(changes)
+
+    def reload_process_attributes(self):
+        '''
+        Method to update the process attribute dictionary with the entries of the process
+        configuration file that were added, removed or changed. Unlike
+        refresh_process_attributes, an invalid file is not applied and doesn't stop the process.
+        Return value is a dictionary where
+            - The key is set as the changed entry
+            - The corresponding value is the tuple (old value, new value), where the old value
+              is None for an added entry and the new value is None for a removed entry
+        '''
+        block = "[" + str.upper(self.process_attributes.get_item("ProcessName")) + "]"
+        new_attributes = self.config_file.read_configuration_file(block)
+        if new_attributes is None:
+            self.logger_instance.error(
+                "{} - Invalid entries found in config file {} - {}, changes are not applied".format(
+                    __name__,
+                    self.config_file.__repr__(),
+                    self.config_file.invalid_keyword_list))
+            return {}
+
+        old_attributes = dict(self.process_attributes.push_item({}))
+        old_attributes.pop("ProcessName", None)
+        old_attributes.pop("InputQueueName", None)
+
+        changes = {}
+        for key in old_attributes.keys() | new_attributes.keys():
+            old_value = old_attributes.get(key)
+            new_value = new_attributes.get(key)
+            if old_value != new_value:
+                changes[key] = (old_value, new_value)
+                if new_value is None:
+                    self.process_attributes.delete_item(key)
+                else:
+                    self.process_attributes.push_item({key: new_value})
+        return changes
+
+    def apply_process_attribute_changes(self, changes):     # pylint: disable=unused-argument
+        '''
+        Method to apply the changed entries of the process configuration file (see
+        reload_process_attributes) to the process, should be implemented in the calling class.
+        By default the process handles it as a REFRESH_PROCESS_ATTRIBUTES process message
+        '''
+        self.process_message("P;REFRESH_PROCESS_ATTRIBUTES")
+
+    def update_output_dictionary(self,                                     # pylint: disable=too-many-arguments
+                                 outputs,
+                                 create_output_list,
+                                 changes,
+                                 keyword_regex,
+                                 state_attributes):
+        '''
+        Method to apply the changed entries of the process configuration file to a dictionary
+        of outputs, for example the output lights, without creating it again
+        - outputs => the dictionary of outputs (address => RPiOutputSlot)
+        - create_output_list => method creating the dictionary of outputs for a dictionary of
+          process attributes, for example create_output_lights_list
+        - changes => the changed entries (see reload_process_attributes)
+        - keyword_regex => compiled regular expression matching the entries of the outputs,
+          for example Light<board><pin>
+        - state_attributes => names of the attributes holding the state of an output, for
+          example ("state",). When an output is changed (for example its logic), its state
+          is kept
+        Only the outputs of the changed entries are created again, the other outputs are
+        not touched. Return value is True when the outputs were changed
+        '''
+        changed = False
+        for key, (old_value, new_value) in changes.items():
+            if not keyword_regex.fullmatch(key):
+                continue
+            old_outputs = create_output_list({key: old_value}) if old_value is not None else {}
+            new_outputs = create_output_list({key: new_value}) if new_value is not None else {}
+            for attribute_key in old_outputs:
+                output = outputs.pop(attribute_key, None)
+                if output is not None and attribute_key in new_outputs:
+                    for state_attribute in state_attributes:
+                        setattr(new_outputs[attribute_key],
+                                state_attribute,
+                                getattr(output, state_attribute))
+            outputs.update(new_outputs)
+            changed = changed or bool(old_outputs) or bool(new_outputs)
+        return changed
+
+    def init_role(self, process_host, role_name):
+        '''
+        Method used instead of __init__ when the process runs as a role of an output host
+        (see RPiOutputHost). The logger and the input queue of the host are used, the process
+        attributes are read from the configuration file of the role (<role name>.cfg) in the
+        configuration file path of the host
+        '''
+        self.run_process = True
+        self.process_host = process_host
+        self.logger_instance = process_host.logger_instance
+
+        self.process_attributes = RPiProcessAttributes()
+        self.process_attributes.push_item({"ProcessName": str.lower(role_name)})
+        self.process_attributes.push_item({"InputQueueName": "IQ_" + str.upper(role_name)})
+        self.config_file = RPiHomedomoticaConfigurationFile(
+            file_name=str.lower(role_name) + ".cfg",
+            file_path=process_host.config_file.get_file_path())
+        self.refresh_process_attributes()
+
+        self.process_input_queue = process_host.process_input_queue
+        self.event_subscriptions = {}
+        self.event_routing_keys = []
+        self.process_runtime = process_host.process_runtime
+        self.process_async_runtime = process_host.process_async_runtime
+        self.next_deadline = None
+        self.config_watcher = self.create_config_watcher()
+
+    def run(self, message_received_callback, tick_callback):
+        '''
+        Method that runs the message pump of the process until a STOP message is received
+        - message_received_callback => function handling a message of the input queue,
+          returning False when the process must stop (for example process_message)
+        - tick_callback => function run periodically and after messages were handled,
+          used to drive the outputs
+        '''
+        if self.config_watcher is not None:
+            process_tick = tick_callback
+
+            def tick_callback():
+                self.check_config_file()
+                process_tick()
+
+        if self.process_async_runtime is not None and self.run_process:
+            self.process_async_runtime.next_deadline = self.next_deadline
+            self.run_process = self.process_async_runtime.run(message_received_callback,
+                                                              tick_callback)
+            return
+
+        self.process_input_queue.next_deadline = self.next_deadline
+        while self.run_process:
+            with self.process_input_queue as consumer:
+                self.run_process = consumer.consume(    # pylint: disable=assignment-from-no-return
+                    message_received_callback,
+                    tick_callback)
+
+    def send_event_subscriptions(self, event_references=None):
+        '''
+        Method to tell the processes producing input events which events this process
+        has rules for, so only those events are sent to the input queue of this process
+        event_references is a list of event references as used in the process logic,
+        for example RPI_INPUTBUTTON_PI1_0_1_PRESSED. Other references are ignored.
+        When omitted, the subscriptions sent before are sent again.
+        For each producing process following message is sent to its input queue:
+        - "P;SUBSCRIBE;<input queue name>;<board>_<pin>_<event>,..."
+        When an 'EventExchange' is set in the process configuration file, the input queue
+        is bound to the routing keys (see EVENT_ROUTING_KEY) of these events on this
+        topic exchange as well
+        '''
+        if event_references is not None:
+            # Producers we no longer have rules for get an empty subscription
+            subscriptions = {producer: [] for producer in self.event_subscriptions}
+            routing_keys = []
+            for event_reference in event_references:
+                match = EVENT_REFERENCE.match(event_reference)
+                if match:
+                    subscriptions.setdefault(match.group(1), []).append(
+                        "{}_{}_{}".format(match.group(2), match.group(3), match.group(4)))
+                    routing_keys.append(EVENT_ROUTING_KEY.format(*match.groups()))
+            self.event_subscriptions = subscriptions
+            self.event_routing_keys = routing_keys
+            if self.process_host is not None:
+                # The input queue is shared with the other roles of the host
+                self.process_host.update_topic_bindings()
+            else:
+                self.process_input_queue.set_topic_bindings(routing_keys)
+
+        if not self.event_subscriptions:
+            return
+
+        if self.process_async_runtime is not None:
+            # Published on the event loop, no blocking connection is opened
+            message_sender = self.process_async_runtime
+        else:
+            message_sender = RPiMessageSender({'exchangeName': 'HOMEDOMOTICA',
+                                               'host': 'localhost'},
+                                              self.logger_instance)
+        for producer, events in self.event_subscriptions.items():
+            self.logger_instance.debug(
+                "{} - Subscribing to {} events of {}".format(
+                    __name__,
+                    len(events),
+                    producer))
+            message_sender.send_message(["IQ_" + str.upper(producer)],
+                                        "P;SUBSCRIBE;{};{}".format(
+                                            self.process_attributes.get_item("InputQueueName"),
+                                            ",".join(events)))
+        if self.process_async_runtime is None:
+            message_sender.close()
+
+    def get_float_attribute(self, key, default_value):
+        '''
+        Method to retrieve a numeric value from the process attribute dictionary
+        The default_value is returned when the key is not available or when the value
+        is not a valid number
+        '''
+        value = self.process_attributes.get_item(key)
+        if value is None:
+            return default_value
+        try:
+            return float(value)
+        except ValueError:
+            self.logger_instance.warning(
+                "{} - Invalid value '{}' for {}, using default value {}".format(
+                    __name__,
+                    value,
+                    key,
+                    default_value))
+            return default_value
+
+    def split_attribute_value(self, value):
+        '''
+        Method returning the tuple of the fields (separated by ';') of a value from the
+        process attribute dictionary. The fields stored in the parse tree of the configuration
+        file are used (see RPiHomedomoticaConfigurationFile.split_value)
+        '''
+        return self.config_file.split_value(value)
+
     def no_message_received_process(self):
         '''
         method that should be implemented in the calling class
@@ -305,12 +640,8 @@ def main():
     process_instance = RPiProcessFramework()
     print(process_instance)
 
-    while process_instance.run_process:
-        with process_instance.process_input_queue as consumer:
-            process_instance.run_process = consumer.consume(    # pylint: disable=assignment-from-no-return
-                process_instance.process_message,
-                process_instance.no_message_received_process)
-        time.sleep(0.5)
+    process_instance.run(process_instance.process_message,
+                         process_instance.no_message_received_process)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,118 @@
+'''
+Name:		rpi_timerheap.py
+Purpose:	Class RPiTimerHeap is a timer service based on a min-heap, used to run a
+            function once a deadline has expired
+
+Author:
+
+Created:
+Copyright:
+Licence:
+'''
+import heapq
+import itertools
+import time
+
+from rpi_timerwheel import RPiTimer
+
+class RPiTimerHeap():
+    '''
+    This class implements a timer service where the timers are kept in a min-heap ordered
+    on their deadline. The deadlines are time stamps of the monotonic clock (time.monotonic)
+    so they are not affected by changes of the system time.
+    Checking for expired timers only looks at the earliest deadline, so a tick without
+    expired timers takes a fixed amount of time, independent of the number of timers.
+    next_deadline() returns the earliest deadline, so the process can wait until the
+    next timer expires instead of checking the timers on every tick.
+    Following attributes are defined:
+        - timers_expired => number of timers run since the timer heap was created
+    Cancelled timers stay in the heap until their deadline is reached
+    Note: the timer heap is not thread safe, all methods must be used from the same thread
+    '''
+    def __init__(self):
+        self._heap = []
+        self._sequence = itertools.count()
+        self._pending = 0
+
+        self.timers_expired = 0
+
+    def __len__(self):
+        return self._pending
+
+    def __str__(self):
+        return "Timer heap: {} timers pending, {} timers expired\n".format(
+            self._pending,
+            self.timers_expired)
+
+    def schedule(self, delay, callback, *args):
+        '''
+        method that adds a timer running callback(*args) after delay seconds
+        Returns the timer, which can be used to cancel it
+        '''
+        timer = RPiTimer(time.monotonic() + delay, callback, args)
+        # The sequence number keeps timers with the same deadline in the order
+        # they were scheduled, the timers themselves are never compared
+        heapq.heappush(self._heap, (timer.deadline, next(self._sequence), timer))
+        self._pending += 1
+        return timer
+
+    def cancel(self, timer):
+        '''
+        method that cancels a timer. Cancelling a timer that already expired or was
+        cancelled before has no effect
+        '''
+        if timer is not None and timer.active:
+            timer.active = False
+            self._pending -= 1
+
+    def next_deadline(self):
+        '''
+        Return value is the deadline (time.monotonic) of the first timer to expire,
+        None when no timers are pending
+        '''
+        heap = self._heap
+        while heap and not heap[0][2].active:
+            heapq.heappop(heap)
+        if heap:
+            return heap[0][0]
+        return None
+
+    def advance(self, now=None):
+        '''
+        method that runs the callback of all timers with a deadline before 'now'
+        (default: the current time of the monotonic clock)
+        Returns the number of timers run
+        '''
+        if now is None:
+            now = time.monotonic()
+
+        expired = 0
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            timer = heapq.heappop(heap)[2]
+            if timer.active:
+                timer.active = False
+                self._pending -= 1
+                expired += 1
+                timer.callback(*timer.args)
+
+        self.timers_expired += expired
+        return expired
+
+def main():
+    '''
+    main function used mainly for testing purposes
+    '''
+    print("Hello world! I'm the Timer Heap class")
+    timer_heap_instance = RPiTimerHeap()
+    for delay in (0.3, 0.1, 0.2):
+        timer_heap_instance.schedule(delay, print, "Timer expired, delay", delay)
+    timer_heap_instance.cancel(timer_heap_instance.schedule(0.15, print, "Cancelled"))
+    while timer_heap_instance.next_deadline() is not None:
+        time.sleep(max(timer_heap_instance.next_deadline() - time.monotonic(), 0))
+        timer_heap_instance.advance()
+    print(timer_heap_instance)
+    print("Bye world")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+'''
+Name:		rpi_timerwheel.py
+Purpose:	Class RPiTimerWheel is a hashed timer wheel used to run a function once
+            a deadline has expired
+
+Author:
+
+Created:
+Copyright:
+Licence:
+'''
+
+class RPiTimer():
+    '''
+    This class holds a single timer of the timer wheel
+    Following attributes are defined:
+        - deadline => time stamp when the timer expires
+        - callback => function to run when the timer expires
+        - args => tuple of parameters passed to the callback function
+        - active => False once the timer expired or was cancelled
+    '''
+    __slots__ = ('deadline', 'callback', 'args', 'active')
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.active = True
+
+class RPiTimerWheel():
+    '''
+    This class implements a hashed timer wheel
+    The wheel has number_of_slots slots, each covering tick_time seconds. A timer is added
+    to the slot of the first tick after its deadline, so adding and cancelling a timer takes a fixed amount of
+    time, independent of the number of timers. advance() only visits the slots of the
+    ticks passed since the previous call.
+    Timers with a deadline more than 1 rotation of the wheel ahead stay in their slot until
+    the deadline is reached.
+    Following attributes are defined:
+        - tick_time => time in seconds covered by 1 slot
+        - number_of_slots => number of slots in the wheel (always a power of 2)
+        - timers_expired => number of timers run since the wheel was created
+    Note: the wheel is not thread safe, all methods must be used from the same thread
+    '''
+    def __init__(self, tick_time=0.05, number_of_slots=64):
+        self.tick_time = tick_time
+        # Round the number of slots up to a power of 2 so the slot can be calculated with a mask
+        self.number_of_slots = 1
+        while self.number_of_slots < number_of_slots:
+            self.number_of_slots <<= 1
+        self._slot_mask = self.number_of_slots - 1
+        self._slots = [[] for slot in range(0, self.number_of_slots)]
+        self._current_tick = None
+        self._pending = 0
+
+        self.timers_expired = 0
+
+    def __len__(self):
+        return self._pending
+
+    def __str__(self):
+        return "Timer wheel: {} timers pending, {} timers expired\n".format(
+            self._pending,
+            self.timers_expired)
+
+    def schedule(self, deadline, callback, *args):
+        '''
+        method that adds a timer running callback(*args) once deadline has expired
+        Returns the timer, which can be used to cancel it
+        '''
+        timer = RPiTimer(deadline, callback, args)
+        # Use the slot of the first tick after the deadline, so the deadline has
+        # expired when the slot is handled
+        tick = int(deadline / self.tick_time) + 1
+        if self._current_tick is not None and tick <= self._current_tick:
+            # Deadline is in a slot already handled, use the next one
+            tick = self._current_tick + 1
+        self._slots[tick & self._slot_mask].append(timer)
+        self._pending += 1
+        return timer
+
+    def cancel(self, timer):
+        '''
+        method that cancels a timer. The timer is removed from its slot
+        the next time the slot is handled
+        '''
+        if timer.active:
+            timer.active = False
+            self._pending -= 1
+
+    def advance(self, now):
+        '''
+        method that runs the callback of all timers with a deadline before 'now'
+        Returns the number of timers run
+        '''
+        now_tick = int(now / self.tick_time)
+        if self._current_tick is None:
+            self._current_tick = now_tick - 1
+        if now_tick <= self._current_tick:
+            return 0
+
+        expired = 0
+        # Handle each slot at most once, even if more than 1 rotation has passed
+        first_tick = max(self._current_tick + 1, now_tick - self._slot_mask)
+        self._current_tick = now_tick
+        for tick in range(first_tick, now_tick + 1):
+            index = tick & self._slot_mask
+            slot = self._slots[index]
+            if not slot:
+                continue
+            # Replace the slot before running the callbacks, they may add new timers
+            self._slots[index] = []
+            for timer in slot:
+                if not timer.active:
+                    continue
+                if timer.deadline <= now:
+                    timer.active = False
+                    self._pending -= 1
+                    expired += 1
+                    timer.callback(*timer.args)
+                else:
+                    self._slots[index].append(timer)
+
+        self.timers_expired += expired
+        return expired
+
+def main():
+    '''
+    main function used mainly for testing purposes
+    '''
+    print("Hello world! I'm the Timer Wheel class")
+    timer_wheel_instance = RPiTimerWheel(0.1, 8)
+    timer_wheel_instance.advance(0)
+    for deadline in (0.15, 0.35, 2.5):
+        timer_wheel_instance.schedule(deadline, print, "Timer expired, deadline", deadline)
+    timer_wheel_instance.cancel(timer_wheel_instance.schedule(0.2, print, "Cancelled"))
+    for tick in range(0, 30):
+        timer_wheel_instance.advance(tick / 10)
+    print(timer_wheel_instance)
+    print("Bye world")
+
+if __name__ == '__main__':
+    main()
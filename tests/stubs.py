@@ -0,0 +1,85 @@
+'''
+Name:		stubs.py
+Purpose:	Stub pika and pifacedigitalio modules used by the tests, so no broker or PiFace
+            boards are needed, and helper to create a process from a configuration file
+'''
+import os
+import shutil
+import sys
+import types
+from unittest import mock
+
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config")
+
+NUMBER_OF_BOARDS = 4
+
+def install_stubs():
+    '''
+    Install stub pika and pifacedigitalio modules (four PiFace boards) and add the source
+    path to sys.path
+    '''
+    if SOURCE_PATH not in sys.path:
+        sys.path.insert(0, SOURCE_PATH)
+    if "pika" in sys.modules and "pifacedigitalio" in sys.modules:
+        return
+
+    pika = types.ModuleType("pika")
+    pika.ConnectionParameters = mock.MagicMock()
+    pika.BlockingConnection = mock.MagicMock()
+    exceptions = types.ModuleType("pika.exceptions")
+    exceptions.AMQPError = type("AMQPError", (Exception,), {})
+    for name in ("AMQPConnectionError", "ChannelClosed", "ConnectionClosed",
+                 "StreamLostError"):
+        setattr(exceptions, name, type(name, (exceptions.AMQPError,), {}))
+    pika.exceptions = exceptions
+    adapters = types.ModuleType("pika.adapters")
+    asyncio_connection = types.ModuleType("pika.adapters.asyncio_connection")
+    asyncio_connection.AsyncioConnection = mock.MagicMock()
+    adapters.asyncio_connection = asyncio_connection
+    pika.adapters = adapters
+
+    pifacedigitalio = types.ModuleType("pifacedigitalio")
+    pifacedigitalio.NoPiFaceDigitalDetectedError = type("NoPiFaceDigitalDetectedError",
+                                                        (Exception,), {})
+    pifacedigitalio.IODIR_ON = 0
+    pifacedigitalio.IODIR_OFF = 1
+    pifacedigitalio.IODIR_BOTH = None
+    pifacedigitalio.InputEventListener = mock.MagicMock()
+
+    def piface_digital(board):
+        if board >= NUMBER_OF_BOARDS:
+            raise pifacedigitalio.NoPiFaceDigitalDetectedError()
+        piface = mock.MagicMock()
+        piface.input_port.value = 0     # All input buttons released
+        return piface
+    pifacedigitalio.PiFaceDigital = piface_digital
+
+    sys.modules.update({"pika": pika,
+                        "pika.exceptions": exceptions,
+                        "pika.adapters": adapters,
+                        "pika.adapters.asyncio_connection": asyncio_connection,
+                        "pifacedigitalio": pifacedigitalio})
+
+def copy_config_files(config_path, *config_file_names):
+    '''
+    Copy configuration files of the config directory to config_path
+    '''
+    for config_file_name in config_file_names:
+        shutil.copy(os.path.join(CONFIG_PATH, config_file_name), config_path)
+
+def create_process(process_class, process_name, config_path):
+    '''
+    Return value is an instance of process_class created as process process_name (for
+    example rpi_outputlights_pi1) with the configuration files in config_path.
+    The log file is not used and the configuration watcher is closed
+    '''
+    import rpi_logger   # pylint: disable=import-outside-toplevel
+
+    with mock.patch.object(sys, "argv", [process_name + ".py", "-cfp", config_path]), \
+         mock.patch.object(rpi_logger.RPiLogger, "enable_logfile_logging"):
+        process = process_class()
+    if process.config_watcher is not None:
+        process.config_watcher.close()
+        process.config_watcher = None
+    return process
@@ -0,0 +1,177 @@
+'''
+Name:		test_configurationfile.py
+Purpose:	Tests of the parse tree of the configuration files: the shipped configuration
+            files, the compiled configuration files and the split values
+'''
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import stubs
+
+stubs.install_stubs()
+
+from rpi_homedomoticaconfigurationfile import RPiHomedomoticaConfigurationFile  # pylint: disable=wrong-import-position
+
+def write_file(file_name, content, mtime_offset=0):
+    '''
+    Write content to file_name and move its modification time mtime_offset seconds,
+    so a changed file is detected even when it is written within the same clock tick
+    '''
+    with open(file_name, "w") as file:
+        file.write(content)
+    if mtime_offset:
+        stat = os.stat(file_name)
+        os.utime(file_name, ns=(stat.st_atime_ns,
+                                stat.st_mtime_ns + mtime_offset * 1000000000))
+
+class TestConfigurationFile(unittest.TestCase):
+    '''
+    Read configuration files written to a temporary directory
+    '''
+    def setUp(self):
+        self.config_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.config_path)
+
+    def test_split_value_per_file(self):
+        '''
+        The fields of a value are taken from the parse tree of the file and are replaced
+        when the file changes
+        '''
+        file_name = os.path.join(self.config_path, "test.cfg")
+        write_file(file_name, "[RPI_OUTPUTLIGHTS_PI1]\nLight00=(0,0);Light;RPI_EVENT|ON\n")
+        config_file = RPiHomedomoticaConfigurationFile("test.cfg", self.config_path)
+        value = config_file.read_configuration_file("[RPI_OUTPUTLIGHTS_PI1]")["Light00"]
+        fields = config_file.split_value(value)
+        self.assertEqual(fields, ("(0,0)", "Light", "RPI_EVENT|ON"))
+        self.assertIs(config_file.split_value(value), fields)
+
+        write_file(file_name, "[RPI_OUTPUTLIGHTS_PI1]\nLight01=(0,1);Light;RPI_EVENT|OFF\n", 1)
+        config_file.read_configuration_file("[RPI_OUTPUTLIGHTS_PI1]")
+        value_fields = config_file._parse_tree_cache[repr(config_file)][2]  # pylint: disable=protected-access
+        self.assertEqual(list(value_fields), ["(0,1);Light;RPI_EVENT|OFF"])
+        self.assertIsNot(config_file.split_value(value), fields)
+        self.assertEqual(config_file.split_value(value), fields)
+
+class TestShippedConfigurationFiles(unittest.TestCase):
+    '''
+    Read the configuration files of the config directory, copied to a temporary directory
+    '''
+    def setUp(self):
+        self.config_path = tempfile.mkdtemp()
+        self.config_file_names = sorted(file_name for file_name in os.listdir(stubs.CONFIG_PATH)
+                                        if file_name.endswith(".cfg"))
+        stubs.copy_config_files(self.config_path, *self.config_file_names)
+
+    def tearDown(self):
+        shutil.rmtree(self.config_path)
+
+    def test_keywords_valid(self):
+        '''
+        Every keyword of the shipped configuration files is accepted by the keyword schema
+        '''
+        self.assertTrue(self.config_file_names)
+        for file_name in self.config_file_names:
+            with self.subTest(file_name=file_name):
+                config_file = RPiHomedomoticaConfigurationFile(file_name, self.config_path)
+                self.assertTrue(config_file.is_valid_config_file(),
+                                config_file.invalid_keyword_list)
+
+    def test_compiled_file_equal_to_text_file(self):
+        '''
+        The compiled file gives the same parse tree and blocks as the text file
+        '''
+        for file_name in self.config_file_names:
+            with self.subTest(file_name=file_name):
+                config_file = RPiHomedomoticaConfigurationFile(file_name, self.config_path)
+                text_parse_tree = config_file.parse_configuration_file()
+                text_blocks = {block: config_file.read_configuration_file(block)
+                               for block in text_parse_tree[0]}
+                self.assertTrue(config_file.compile_configuration_file())
+
+                RPiHomedomoticaConfigurationFile._parse_tree_cache.clear()  # pylint: disable=protected-access
+                with mock.patch.object(RPiHomedomoticaConfigurationFile, "_parse_text_file",
+                                       side_effect=AssertionError("text file parsed")):
+                    compiled_parse_tree = config_file.parse_configuration_file()
+                    compiled_blocks = {block: config_file.read_configuration_file(block)
+                                       for block in compiled_parse_tree[0]}
+                self.assertEqual(compiled_parse_tree, text_parse_tree)
+                self.assertEqual(compiled_blocks, text_blocks)
+
+class TestStaleCompiledFile(unittest.TestCase):
+    '''
+    A compiled file that was not compiled from the current text file or with the current
+    keyword schema is not used
+    '''
+    def setUp(self):
+        self.config_path = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.config_path, "test.cfg")
+        write_file(self.file_name, "[RPI_OUTPUTLIGHTS_PI1]\nLight00=(0,0);Light;RPI_EVENT|ON\n")
+        self.config_file = RPiHomedomoticaConfigurationFile("test.cfg", self.config_path)
+        self.assertTrue(self.config_file.compile_configuration_file())
+        RPiHomedomoticaConfigurationFile._parse_tree_cache.clear()  # pylint: disable=protected-access
+
+    def tearDown(self):
+        shutil.rmtree(self.config_path)
+
+    def assert_compiled_file_used(self, used):
+        '''
+        Parse the file, checking whether the compiled file is used or the text file is parsed
+        '''
+        RPiHomedomoticaConfigurationFile._parse_tree_cache.clear()  # pylint: disable=protected-access
+        parse_text_file = RPiHomedomoticaConfigurationFile._parse_text_file  # pylint: disable=protected-access
+        with mock.patch.object(RPiHomedomoticaConfigurationFile, "_parse_text_file",
+                               autospec=True, side_effect=parse_text_file) as parse_text_file:
+            blocks = self.config_file.read_configuration_file("[RPI_OUTPUTLIGHTS_PI1]")
+        self.assertEqual(parse_text_file.called, not used)
+        return blocks
+
+    def assert_stale_and_rebuilt(self):
+        '''
+        The stale compiled file is not used and is used again after compiling the file
+        '''
+        blocks = self.assert_compiled_file_used(False)
+        self.assertTrue(self.config_file.compile_configuration_file())
+        self.assertEqual(self.assert_compiled_file_used(True), blocks)
+        return blocks
+
+    def test_up_to_date(self):
+        '''
+        An up to date compiled file is used
+        '''
+        self.assertEqual(self.assert_compiled_file_used(True),
+                         {"Light00": "(0,0);Light;RPI_EVENT|ON"})
+
+    def test_modification_time_changed(self):
+        '''
+        The text file was changed without changing its size
+        '''
+        write_file(self.file_name, "[RPI_OUTPUTLIGHTS_PI1]\nLight00=(0,0);Light;RPI_EVENT|UP\n", 1)
+        self.assertEqual(self.assert_stale_and_rebuilt(),
+                         {"Light00": "(0,0);Light;RPI_EVENT|UP"})
+
+    def test_size_changed(self):
+        '''
+        The text file was changed keeping its modification time
+        '''
+        stat = os.stat(self.file_name)
+        write_file(self.file_name, "[RPI_OUTPUTLIGHTS_PI1]\nLight00=(0,0);Light;RPI_EVENT|OFF\n")
+        os.utime(self.file_name, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(self.assert_stale_and_rebuilt(),
+                         {"Light00": "(0,0);Light;RPI_EVENT|OFF"})
+
+    def test_keyword_schema_changed(self):
+        '''
+        The file was compiled with another keyword schema (CRC in the header)
+        '''
+        header = RPiHomedomoticaConfigurationFile.COMPILED_FILE_HEADER
+        with mock.patch.object(RPiHomedomoticaConfigurationFile, "COMPILED_FILE_HEADER",
+                               header[:2] + (header[2] ^ 1,)):
+            self.assert_stale_and_rebuilt()
+
+if __name__ == '__main__':
+    unittest.main()
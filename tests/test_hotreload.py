@@ -0,0 +1,137 @@
+'''
+Name:		test_hotreload.py
+Purpose:	Tests of the key-level diff of a changed process configuration file and of the
+            update of the outputs of the changed entries, using the rpi_outputlights_pi1 process
+'''
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+import stubs
+
+stubs.install_stubs()
+
+from rpi_outputlights import RPiOutputLights    # pylint: disable=wrong-import-position
+
+LIGHT02 = "Light02=(0,2);Licht bureau - centraal (L15.1);"
+LIGHT04 = "Light04=(0,4);Licht keuken aan vuur (L6.0 en L6.1);"
+
+class TestHotReload(unittest.TestCase):
+    '''
+    Change the configuration file of the rpi_outputlights_pi1 process
+    '''
+    def setUp(self):
+        self.config_path = tempfile.mkdtemp()
+        stubs.copy_config_files(self.config_path, "rpi_outputlights_pi1.cfg")
+        self.process = stubs.create_process(RPiOutputLights, "rpi_outputlights_pi1",
+                                            self.config_path)
+        self.file_name = os.path.join(self.config_path, "rpi_outputlights_pi1.cfg")
+        with open(self.file_name) as config_file:
+            self.lines = config_file.read().splitlines()
+
+    def tearDown(self):
+        shutil.rmtree(self.config_path)
+
+    def write_config_file(self, lines):
+        '''
+        Write lines to the configuration file, moving its modification time so the change
+        is detected even when it is written within the same clock tick
+        '''
+        stat = os.stat(self.file_name)
+        with open(self.file_name, "w") as config_file:
+            config_file.write("\n".join(lines) + "\n")
+        os.utime(self.file_name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+    def test_unchanged_file(self):
+        '''
+        Reading an unchanged file gives no changes
+        '''
+        self.write_config_file(self.lines)
+        self.assertEqual(self.process.reload_process_attributes(), {})
+
+    def test_changed_added_removed_entries(self):
+        '''
+        The changes hold the old and new value of each entry, None for an added or removed
+        entry, and are applied to the process attributes
+        '''
+        old_light02 = self.process.process_attributes.get_item("Light02")
+        lines = [item for item in self.lines if not item.startswith("Light03=")]
+        lines = [LIGHT02 + "RPI_EVENT|ON" if item.startswith("Light02=") else item
+                 for item in lines]
+        lines.append("HotReload=ON")
+        self.write_config_file(lines)
+        changes = self.process.reload_process_attributes()
+        self.assertEqual(changes, {"Light02": (old_light02, LIGHT02[8:] + "RPI_EVENT|ON"),
+                                   "Light03": ("(0,3);Not Used;", None),
+                                   "HotReload": (None, "ON")})
+        self.assertEqual(self.process.process_attributes.get_item("Light02"),
+                         LIGHT02[8:] + "RPI_EVENT|ON")
+        self.assertNotIn("Light03", self.process.process_attributes.push_item({}))
+        self.assertEqual(self.process.process_attributes.get_item("HotReload"), "ON")
+        self.assertEqual(self.process.process_attributes.get_item("ProcessName"),
+                         "rpi_outputlights_pi1")
+
+    def test_invalid_file(self):
+        '''
+        The entries of an invalid file are not applied
+        '''
+        self.write_config_file(self.lines + ["Lamp02=(0,2);Invalid keyword;"])
+        self.assertEqual(self.process.reload_process_attributes(), {})
+        self.assertIsNotNone(self.process.process_attributes.get_item("Light02"))
+
+    def test_update_output_dictionary(self):
+        '''
+        Only the outputs of the changed entries are created again, a changed output keeps
+        its state, removed outputs are removed and added outputs are added
+        '''
+        self.process.output_lights["(0,2)"].state = 1
+        self.process.output_lights["(0,4)"].state = 1
+        light02 = self.process.output_lights["(0,2)"]
+        light04 = self.process.output_lights["(0,4)"]
+        lines = [LIGHT02 + "RPI_EVENT|ON" if item.startswith("Light02=") else item
+                 for item in self.lines if not item.startswith("Light07=")]
+        lines.append("Light10=(1,0);New light;RPI_EVENT|TOGGLE")
+        self.write_config_file(lines)
+        changes = self.process.reload_process_attributes()
+
+        output_lights = self.process.output_lights
+        self.assertTrue(self.process.update_output_dictionary(
+            output_lights, self.process.create_output_lights_list, changes,
+            re.compile(r"Light\d\d"), ("state",)))
+        self.assertIsNot(output_lights["(0,2)"], light02)
+        self.assertEqual(output_lights["(0,2)"].logic, ["RPI_EVENT|ON"])
+        self.assertEqual(output_lights["(0,2)"].state, 1)
+        self.assertIs(output_lights["(0,4)"], light04)
+        self.assertNotIn("(0,7)", output_lights)
+        self.assertEqual(output_lights["(1,0)"].state, 0)
+
+    def test_update_output_dictionary_other_keys(self):
+        '''
+        Changes of entries that don't match the keyword of the outputs are skipped
+        '''
+        output_lights = dict(self.process.output_lights)
+        self.assertFalse(self.process.update_output_dictionary(
+            self.process.output_lights, self.process.create_output_lights_list,
+            {"HotReload": (None, "ON"), "Light0": ("(0,0);Not Used;", None)},
+            re.compile(r"Light\d\d"), ("state",)))
+        self.assertEqual(self.process.output_lights, output_lights)
+
+    def test_apply_changes(self):
+        '''
+        A removed light is switched off, the process logic has the rules of the new entries
+        '''
+        self.process.process_message("I;RPI_INPUTBUTTON_PI1_0_7_PRESSED")
+        self.process.update_output_ports()
+        self.assertEqual(self.process.output_port_value[0] & 0x80, 0x80)
+        self.write_config_file([LIGHT04 + "RPI_EVENT|ON" if item.startswith("Light04=") else item
+                                for item in self.lines if not item.startswith("Light07=")])
+        self.process.apply_process_attribute_changes(self.process.reload_process_attributes())
+        self.process.update_output_ports()
+        self.assertEqual(self.process.output_port_value[0] & 0x80, 0)
+        self.assertIn("RPI_EVENT", self.process.process_logic)
+        self.assertNotIn("RPI_INPUTBUTTON_PI1_0_7_PRESSED", self.process.process_logic)
+
+if __name__ == '__main__':
+    unittest.main()
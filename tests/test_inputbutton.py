@@ -0,0 +1,164 @@
+'''
+Name:		test_inputbutton.py
+Purpose:	Tests of the inputbutton process using the shipped configuration file: the
+            button gestures and the changes of the configuration file
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+import stubs
+
+stubs.install_stubs()
+
+from rpi_inputbutton import RPiInputButton      # pylint: disable=wrong-import-position
+
+class TestInputButton(unittest.TestCase):
+    '''
+    Create the rpi_inputbutton_pi1 process with stub PiFace boards
+    '''
+    def setUp(self):
+        self.config_path = tempfile.mkdtemp()
+        stubs.copy_config_files(self.config_path, "rpi_inputbutton_pi1.cfg")
+        self.process = stubs.create_process(RPiInputButton, "rpi_inputbutton_pi1",
+                                            self.config_path)
+        self.process.input_sampler.stop()
+
+    def tearDown(self):
+        shutil.rmtree(self.config_path)
+
+    def change_config_file(self, old, new):
+        '''
+        Replace old by new in the configuration file and apply the changed entries
+        '''
+        file_name = os.path.join(self.config_path, "rpi_inputbutton_pi1.cfg")
+        with open(file_name) as config_file:
+            content = config_file.read()
+        self.assertIn(old, content)
+        with open(file_name, "w") as config_file:
+            config_file.write(content.replace(old, new))
+        stat = os.stat(file_name)
+        os.utime(file_name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        changes = self.process.reload_process_attributes()
+        self.process.apply_process_attribute_changes(changes)
+        return changes
+
+    def test_apply_changed_button(self):
+        '''
+        Only the changed button is created again, the other buttons keep their state
+        '''
+        button00 = self.process.input_buttons["(0,0)"]
+        button01 = self.process.input_buttons["(0,1)"]
+        button01.state = 1
+        changes = self.change_config_file("(0,0);Lichtknop links - Deur slaapkamer Ouders (K1);"
+                                          "ConsumerQueue5",
+                                          "(0,0);Lichtknop links - Deur slaapkamer Ouders (K1);"
+                                          "ConsumerQueue4")
+        self.assertEqual(list(changes), ["Button00"])
+        self.assertIsNot(self.process.input_buttons["(0,0)"], button00)
+        self.assertEqual(self.process.input_buttons["(0,0)"].consumer, "ConsumerQueue4")
+        self.assertIs(self.process.input_button_table[0][0], self.process.input_buttons["(0,0)"])
+        self.assertIs(self.process.input_buttons["(0,1)"], button01)
+        self.assertEqual(button01.state, 1)
+        self.assertEqual(self.process.process_consumers["(0,0)"], ["IQ_RPI_OUTPUTLIGHTS_PI1"])
+
+    def test_apply_removed_button(self):
+        '''
+        A removed button is no longer reported by the input sampler
+        '''
+        self.change_config_file("Button00=", "# Button00=")
+        self.assertNotIn("(0,0)", self.process.input_buttons)
+        self.assertIsNone(self.process.input_button_table[0][0])
+        self.assertEqual(self.process.input_sampler.input_masks[0] & 1, 0)
+
+    def test_apply_input_timing(self):
+        '''
+        A changed press time is used for the next button change
+        '''
+        self.change_config_file("Button00=", "LongPressTime=2\nButton00=")
+        self.assertEqual(self.process.long_press_time, 2)
+
+class TestButtonGestures(unittest.TestCase):
+    '''
+    Input changes of button (0,0) of the rpi_inputbutton_pi1 process, using the default
+    gesture timing (short press 0.25s, long press 0.75s, double press 1s). The input is 1
+    while the button is pressed
+    '''
+    def setUp(self):
+        self.config_path = tempfile.mkdtemp()
+        stubs.copy_config_files(self.config_path, "rpi_inputbutton_pi1.cfg")
+        self.process = stubs.create_process(RPiInputButton, "rpi_inputbutton_pi1",
+                                            self.config_path)
+        self.process.input_sampler.stop()
+        self.button = self.process.input_buttons["(0,0)"]
+        self.events = []
+        self.process._send_button_event = \
+            lambda button, event: self.events.append(event)  # pylint: disable=protected-access
+
+    def tearDown(self):
+        shutil.rmtree(self.config_path)
+
+    def press(self, pressed, released):
+        '''
+        Press the button at time pressed and release it at time released
+        '''
+        self.process._input_button_changed(0, 0, 1, pressed)    # pylint: disable=protected-access
+        self.process._input_button_changed(0, 0, 0, released)   # pylint: disable=protected-access
+
+    def test_pressed(self):
+        '''
+        A press between the short and the long press time
+        '''
+        self.press(100.0, 100.5)
+        self.assertEqual(self.events, ["UP", "DOWN", "PRESSED"])
+
+    def test_pressed_long(self):
+        '''
+        A press longer than the long press time
+        '''
+        self.press(100.0, 101.0)
+        self.assertEqual(self.events, ["UP", "DOWN", "PRESSEDLONG"])
+
+    def test_pressed_short(self):
+        '''
+        A short press is reported once no second short press followed within the double
+        press time
+        '''
+        self.press(100.0, 100.1)
+        self.process.gesture_timers.advance(101.0)
+        self.assertEqual(self.events, ["UP", "DOWN"])
+        self.process.gesture_timers.advance(101.2)
+        self.assertEqual(self.events, ["UP", "DOWN", "PRESSEDSHORT"])
+        self.assertIsNone(self.button.pending_timer)
+
+    def test_pressed_double(self):
+        '''
+        Two short presses within the double press time, no short press is reported
+        '''
+        self.press(100.0, 100.1)
+        self.press(100.3, 100.4)
+        self.process.gesture_timers.advance(102.0)
+        self.assertEqual(self.events, ["UP", "DOWN", "UP", "DOWN", "PRESSEDDOUBLE"])
+        self.assertEqual(self.button.press_count, 0)
+
+    def test_pressed_short_followed_by_pressed(self):
+        '''
+        A short press followed by a longer press within the double press time
+        '''
+        self.press(100.0, 100.1)
+        self.press(100.3, 100.8)
+        self.assertEqual(self.events, ["UP", "DOWN", "UP", "DOWN", "PRESSEDSHORT", "PRESSED"])
+
+    def test_short_presses_after_double_press_time(self):
+        '''
+        Two short presses further apart than the double press time are 2 short presses
+        '''
+        self.press(100.0, 100.1)
+        self.press(102.0, 102.1)
+        self.process.gesture_timers.advance(104.0)
+        self.assertEqual(self.events.count("PRESSEDSHORT"), 2)
+        self.assertNotIn("PRESSEDDOUBLE", self.events)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+'''
+Name:		test_inputsampler.py
+Purpose:	Tests of the input sampler, its debounce filter and the event ring buffer passing
+            its input events
+'''
+import unittest
+from unittest import mock
+
+import stubs
+
+stubs.install_stubs()
+
+from rpi_eventring import RPiEventRing          # pylint: disable=wrong-import-position
+from rpi_inputsampler import RPiInputSampler    # pylint: disable=wrong-import-position
+
+def drain_events(event_ring):
+    '''
+    Return value is the list of (board_number, pin_number, state, timestamp) events
+    drained from event_ring
+    '''
+    events = []
+    event_ring.drain(lambda *event: events.append(event))
+    return events
+
+class TestEventRing(unittest.TestCase):
+    '''
+    Push and drain events
+    '''
+    def test_size_rounded_to_power_of_2(self):
+        '''
+        The size is rounded up to a power of 2
+        '''
+        self.assertEqual(RPiEventRing(5).size, 8)
+        self.assertEqual(RPiEventRing(8).size, 8)
+
+    def test_drain_in_push_order(self):
+        '''
+        The events are drained in the order they were pushed, also after the indexes
+        wrapped around the end of the ring buffer
+        '''
+        event_ring = RPiEventRing(4)
+        for timestamp in range(0, 10):
+            self.assertTrue(event_ring.push(timestamp % 4, timestamp % 8, timestamp % 2,
+                                            float(timestamp)))
+            self.assertEqual(drain_events(event_ring),
+                             [(timestamp % 4, timestamp % 8, timestamp % 2, float(timestamp))])
+        self.assertEqual(len(event_ring), 0)
+
+    def test_overflow(self):
+        '''
+        Events pushed on a full ring buffer are dropped and counted
+        '''
+        event_ring = RPiEventRing(2)
+        self.assertTrue(event_ring.push(0, 0, 1, 1.0))
+        self.assertTrue(event_ring.push(0, 1, 1, 2.0))
+        self.assertFalse(event_ring.push(0, 2, 1, 3.0))
+        self.assertEqual(event_ring.overflow_count, 1)
+        self.assertEqual(event_ring.drain(lambda *event: None), 2)
+        self.assertTrue(event_ring.push(0, 3, 1, 4.0))
+        self.assertEqual(drain_events(event_ring), [(0, 3, 1, 4.0)])
+
+class TestInputSampler(unittest.TestCase):
+    '''
+    Sample input ports returned by a list of port values, without starting the sampler thread
+    '''
+    def setUp(self):
+        self.input_ports = [0, 0]
+        self.event_ring = RPiEventRing(64)
+        self.input_sampler = RPiInputSampler(lambda: list(self.input_ports), self.event_ring)
+
+    def sample(self, input_ports, timestamp=1.0):
+        '''
+        Sample input_ports and return the events reported
+        '''
+        self.input_ports = input_ports
+        self.input_sampler._sample(timestamp)   # pylint: disable=protected-access
+        return drain_events(self.event_ring)
+
+    def test_changed_pins_reported(self):
+        '''
+        Each changed pin is reported once with its new state, lowest pin first
+        '''
+        self.assertEqual(self.sample([0b00000101, 0]), [(0, 0, 1, 1.0), (0, 2, 1, 1.0)])
+        self.assertEqual(self.sample([0b00000101, 0]), [])
+        self.assertEqual(self.sample([0b00000100, 0b10000000], 2.0),
+                         [(0, 0, 0, 2.0), (1, 7, 1, 2.0)])
+        self.assertEqual(self.input_sampler.input_ports, [0b00000100, 0b10000000])
+        self.assertEqual(self.input_sampler.samples, 3)
+
+    def test_initial_input_ports(self):
+        '''
+        Only the changes compared to the initial state are reported
+        '''
+        self.input_sampler.input_ports = [0b00000011, 0]
+        self.assertEqual(self.sample([0b00000010, 0]), [(0, 0, 0, 1.0)])
+
+    def test_input_masks(self):
+        '''
+        Only the pins of the input mask are reported, the state of the other pins is kept
+        '''
+        self.input_sampler.set_input_masks([0b00000001])
+        self.assertEqual(self.sample([0b00000011, 0b00000001]),
+                         [(0, 0, 1, 1.0), (1, 0, 1, 1.0)])
+        self.assertEqual(self.input_sampler.input_ports, [0b00000011, 0b00000001])
+        self.assertEqual(self.sample([0b00000011, 0b00000001]), [])
+
+    def test_read_error(self):
+        '''
+        A failing read of the input ports is skipped
+        '''
+        def read_input_ports():
+            raise OSError("SPI error")
+        input_sampler = RPiInputSampler(read_input_ports, self.event_ring)
+        input_sampler._sample(1.0)   # pylint: disable=protected-access
+        self.assertEqual(input_sampler.samples, 0)
+        self.assertEqual(len(self.event_ring), 0)
+
+class TestDebounceFilter(unittest.TestCase):
+    '''
+    Sample the input port of 1 board with a debounce time of 0.02 seconds, using a patched
+    monotonic clock
+    '''
+    def setUp(self):
+        self.input_ports = [0]
+        self.event_ring = RPiEventRing(64)
+        self.input_sampler = RPiInputSampler(lambda: list(self.input_ports), self.event_ring,
+                                             debounce_time=0.02)
+
+    def sample(self, input_port, now):
+        '''
+        Sample input_port at time now (monotonic clock) and return the events reported
+        '''
+        self.input_ports = [input_port]
+        with mock.patch("rpi_inputsampler.time.monotonic", return_value=now):
+            self.input_sampler._sample(now)  # pylint: disable=protected-access
+        return drain_events(self.event_ring)
+
+    def test_bounces_suppressed(self):
+        '''
+        Changes during the lock of a pin are ignored and counted
+        '''
+        self.assertEqual(self.sample(1, 10.0), [(0, 0, 1, 10.0)])
+        self.assertEqual(self.input_sampler._next_unlock, 10.02)  # pylint: disable=protected-access
+        self.assertEqual(self.sample(0, 10.005), [])
+        self.assertEqual(self.sample(1, 10.01), [])
+        self.assertEqual(self.input_sampler.suppressed_bounces, 2)
+        # The pin is stable at the end of the lock, nothing to report
+        self.assertEqual(self.sample(1, 10.03), [])
+        self.assertIsNone(self.input_sampler._next_unlock)  # pylint: disable=protected-access
+        self.assertEqual(self.sample(0, 10.04), [(0, 0, 0, 10.04)])
+
+    def test_final_state_reported_after_lock(self):
+        '''
+        A state that differs from the reported state at the end of the lock is reported
+        '''
+        self.assertEqual(self.sample(1, 10.0), [(0, 0, 1, 10.0)])
+        self.assertEqual(self.sample(0, 10.01), [])
+        self.assertEqual(self.sample(0, 10.03), [(0, 0, 0, 10.03)])
+
+    def test_debounce_time_per_board(self):
+        '''
+        Each board uses its own debounce time, other pins of the board are not locked
+        '''
+        self.input_sampler.set_debounce_times([0.05])
+        self.assertEqual(self.sample(0b01, 10.0), [(0, 0, 1, 10.0)])
+        self.assertEqual(self.sample(0b11, 10.01), [(0, 1, 1, 10.01)])
+        self.assertEqual(self.sample(0b10, 10.03), [])
+        self.assertEqual(self.sample(0b10, 10.06), [(0, 0, 0, 10.06)])
+
+if __name__ == '__main__':
+    unittest.main()
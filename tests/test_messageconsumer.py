@@ -0,0 +1,63 @@
+'''
+Name:		test_messageconsumer.py
+Purpose:	Tests of the batched acknowledgements of RPiMessageConsumer
+'''
+import unittest
+from unittest import mock
+
+import stubs
+
+stubs.install_stubs()
+
+import rpi_messageconsumer                              # pylint: disable=wrong-import-position
+from rpi_messageconsumer import RPiMessageConsumer      # pylint: disable=wrong-import-position
+
+class TestAckBatching(unittest.TestCase):
+    '''
+    Cumulative acks sent by ack_message and flush_acks
+    '''
+    def _ack_messages(self, message_consumer, number_of_messages):
+        channel = mock.MagicMock()
+        for delivery_tag in range(1, number_of_messages + 1):
+            message_consumer.ack_message(channel, delivery_tag)
+        return [call.kwargs['delivery_tag'] for call in channel.basic_ack.call_args_list]
+
+    def test_default_acks_each_message(self):
+        '''
+        Without batching each message is acknowledged separately
+        '''
+        message_consumer = RPiMessageConsumer({'queueName': "TESTQUEUE"})
+        self.assertEqual(self._ack_messages(message_consumer, 3), [1, 2, 3])
+
+    def test_batch_size_without_batch_time(self):
+        '''
+        Only setting ackBatchSize sends one cumulative ack per ackBatchSize messages
+        '''
+        message_consumer = RPiMessageConsumer({'queueName': "TESTQUEUE", 'ackBatchSize': 4})
+        with mock.patch.object(rpi_messageconsumer.time, "monotonic", side_effect=range(100)):
+            self.assertEqual(self._ack_messages(message_consumer, 10), [4, 8])
+
+    def test_batch_time(self):
+        '''
+        The pending acks are sent once the first delayed ack is ackBatchTime seconds old
+        '''
+        message_consumer = RPiMessageConsumer({'queueName': "TESTQUEUE",
+                                               'ackBatchSize': 100,
+                                               'ackBatchTime': 2})
+        with mock.patch.object(rpi_messageconsumer.time, "monotonic", side_effect=range(100)):
+            self.assertEqual(self._ack_messages(message_consumer, 5), [2, 4])
+
+    def test_flush_acks(self):
+        '''
+        flush_acks sends the pending acks once
+        '''
+        message_consumer = RPiMessageConsumer({'queueName': "TESTQUEUE", 'ackBatchSize': 4})
+        channel = mock.MagicMock()
+        message_consumer.ack_message(channel, 1)
+        message_consumer.ack_message(channel, 2)
+        message_consumer.flush_acks(channel)
+        message_consumer.flush_acks(channel)
+        channel.basic_ack.assert_called_once_with(delivery_tag=2, multiple=True)
+
+if __name__ == '__main__':
+    unittest.main()
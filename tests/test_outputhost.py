@@ -0,0 +1,65 @@
+'''
+Name:		test_outputhost.py
+Purpose:	Start-up test of RPiOutputHost running several output processes as roles
+            pika and pifacedigitalio are replaced by stubs (see stubs.py)
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+import stubs
+
+stubs.install_stubs()
+
+from rpi_outputhost import RPiOutputHost    # pylint: disable=wrong-import-position
+
+class TestOutputHost(unittest.TestCase):
+    '''
+    Build an output host with the shipped role configuration files
+    '''
+    def setUp(self):
+        self.config_path = tempfile.mkdtemp()
+        stubs.copy_config_files(self.config_path,
+                                "rpi_outputlights_pi1.cfg", "rpi_outputrelay_pi1.cfg")
+        with open(os.path.join(self.config_path, "rpi_outputhost_pi1.cfg"), "w") as config_file:
+            config_file.write("[RPI_OUTPUTHOST_PI1]\n"
+                              "Roles=RPI_OUTPUTLIGHTS_PI1,RPI_OUTPUTRELAY_PI1\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.config_path)
+
+    def test_host_with_two_roles(self):
+        '''
+        The host starts with both roles and binds the input queues of the roles
+        '''
+        output_host = stubs.create_process(RPiOutputHost, "rpi_outputhost_pi1", self.config_path)
+
+        self.assertTrue(output_host.run_process)
+        self.assertEqual([role.process_attributes.get_item("ProcessName")
+                          for role in output_host.roles],
+                         ["rpi_outputlights_pi1", "rpi_outputrelay_pi1"])
+        self.assertEqual(output_host.process_input_queue.config['bindingKeys'],
+                         ["IQ_RPI_OUTPUTLIGHTS_PI1", "IQ_RPI_OUTPUTRELAY_PI1"])
+        self.assertTrue(all(role.process_logic for role in output_host.roles))
+        for role in output_host.roles:
+            role.config_watcher.close()
+
+    def test_host_input_button_messages(self):
+        '''
+        The input button messages are passed to the roles having a rule for the event
+        '''
+        output_host = stubs.create_process(RPiOutputHost, "rpi_outputhost_pi1", self.config_path)
+        for role in output_host.roles:
+            role.config_watcher.close()
+
+        lights, relays = output_host.roles
+        light = lights.output_lights["(0,2)"]
+        event = next(item.split("|")[0] for item in light.logic if item.endswith("|TOGGLE"))
+        self.assertTrue(output_host.process_message("I;" + event))
+        self.assertEqual(light.state, 1)
+        for event in relays.process_logic:
+            self.assertTrue(output_host.process_message("I;" + event))
+
+if __name__ == '__main__':
+    unittest.main()
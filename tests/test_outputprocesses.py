@@ -0,0 +1,132 @@
+'''
+Name:		test_outputprocesses.py
+Purpose:	Tests of the input button messages handled by the output processes, using the
+            shipped configuration files and the RPiLogger of the process
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+import stubs
+
+stubs.install_stubs()
+
+from rpi_outputdimmer import RPiOutputDimmer            # pylint: disable=wrong-import-position
+from rpi_outputlights import RPiOutputLights            # pylint: disable=wrong-import-position
+from rpi_outputrelay import RPiOutputRelay              # pylint: disable=wrong-import-position
+from rpi_outputventilator import RPiOutputVentilator    # pylint: disable=wrong-import-position
+
+OUTPUT_PROCESSES = ((RPiOutputLights, "rpi_outputlights_pi1"),
+                    (RPiOutputDimmer, "rpi_outputdimmer_pi2"),
+                    (RPiOutputRelay, "rpi_outputrelay_pi1"),
+                    (RPiOutputVentilator, "rpi_outputventilator_pi4"))
+
+class TestOutputProcesses(unittest.TestCase):
+    '''
+    Send input button messages to each output process, with and without debug logging
+    '''
+    def setUp(self):
+        self.config_path = tempfile.mkdtemp()
+        stubs.copy_config_files(self.config_path,
+                                *(process_name + ".cfg"
+                                  for process_class, process_name in OUTPUT_PROCESSES))
+
+    def tearDown(self):
+        shutil.rmtree(self.config_path)
+
+    def test_input_button_messages(self):
+        '''
+        Each event of the process logic is handled at log level INFO and DEBUG,
+        an unknown event is skipped
+        '''
+        for process_class, process_name in OUTPUT_PROCESSES:
+            for log_level in ("INFO", "DEBUG"):
+                with self.subTest(process=process_name, log_level=log_level):
+                    process = stubs.create_process(process_class, process_name,
+                                                   self.config_path)
+                    process.logger_instance.set_log_level(log_level)
+                    self.assertTrue(process.process_logic)
+                    for event in process.process_logic:
+                        self.assertTrue(process.process_message("I;" + event))
+                    self.assertTrue(process.process_message("I;RPI_UNKNOWN_EVENT"))
+
+    def test_toggle_light(self):
+        '''
+        A TOGGLE event switches the light on and off again
+        '''
+        process = stubs.create_process(RPiOutputLights, "rpi_outputlights_pi1", self.config_path)
+        light = process.output_lights["(0,2)"]
+        event = next(item.split("|")[0] for item in light.logic if item.endswith("|TOGGLE"))
+        process.process_message("I;" + event)
+        self.assertEqual(light.state, 1)
+        process.process_message("I;" + event)
+        self.assertEqual(light.state, 0)
+
+    def test_apply_ventilator_changes(self):
+        '''
+        Only a removed ventilator is stopped, removing a relay timer cancels its timers and
+        keeps the state of the ventilator
+        '''
+        process = stubs.create_process(RPiOutputVentilator, "rpi_outputventilator_pi4",
+                                       self.config_path)
+        process.process_message("I;RPI_INPUTBUTTON_PI2_3_0_PRESSED")
+        process.process_message("I;RPI_INPUTBUTTON_PI2_3_0_PRESSEDDOUBLE")
+        process.update_output_ports()
+        self.assertEqual(process.output_port_value[0] & 0b11, 0b11)
+        self.assertIn("(0,0)", process.runtime_timers)
+
+        file_name = os.path.join(self.config_path, "rpi_outputventilator_pi4.cfg")
+        with open(file_name) as config_file:
+            lines = config_file.readlines()
+        with open(file_name, "w") as config_file:
+            config_file.writelines(line for line in lines
+                                   if not line.startswith(("RelayTimer00=", "Relay01=")))
+        stat = os.stat(file_name)
+        os.utime(file_name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        changes = process.reload_process_attributes()
+        self.assertEqual(sorted(changes), ["Relay01", "RelayTimer00"])
+        process.apply_process_attribute_changes(changes)
+        process.update_output_ports()
+
+        self.assertEqual(process.output_relays["(0,0)"].state, 1)
+        self.assertNotIn("(0,0)", process.runtime_timers)
+        self.assertNotIn("(0,1)", process.output_relays)
+        self.assertEqual(process.output_port_value[0] & 0b11, 0b01)
+
+    def test_expired_timer_of_removed_relay_timer(self):
+        '''
+        A timer expiring after the RelayTimer entry of its relay was removed is skipped
+        '''
+        process = stubs.create_process(RPiOutputVentilator, "rpi_outputventilator_pi4",
+                                       self.config_path)
+        process.process_message("I;RPI_INPUTBUTTON_PI2_3_0_PRESSED")
+        del process.relays_timer["(0,0)"]
+        process._runtime_expired("(0,0)")     # pylint: disable=protected-access
+        process._lagtime_expired("(0,0)")     # pylint: disable=protected-access
+        self.assertEqual(process.output_relays["(0,0)"].state, 1)
+
+    def test_message_pump_settings(self):
+        '''
+        The message pump settings of the configuration file are used, the queue is polled
+        when they are not set
+        '''
+        process = stubs.create_process(RPiOutputLights, "rpi_outputlights_pi1", self.config_path)
+        self.assertEqual(process.process_input_queue.config["consumeMode"], "push")
+        self.assertEqual(process.process_input_queue.config["prefetchCount"], 20)
+
+        file_name = os.path.join(self.config_path, "rpi_outputlights_pi1.cfg")
+        with open(file_name) as config_file:
+            lines = config_file.readlines()
+        with open(file_name, "w") as config_file:
+            config_file.writelines(line for line in lines
+                                   if not line.startswith(("ConsumeMode=", "DrainMax",
+                                                           "PrefetchCount=")))
+        process = stubs.create_process(RPiOutputLights, "rpi_outputlights_pi1", self.config_path)
+        config = process.process_input_queue.config
+        self.assertEqual((config["consumeMode"], config["drainMaxMessages"],
+                          config["drainMaxTime"], config["prefetchCount"]),
+                         ("poll", 0, 0, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+'''
+Name:		test_timers.py
+Purpose:	Tests of the timer services used to run a function once a deadline has expired
+'''
+import unittest
+from unittest import mock
+
+import stubs
+
+stubs.install_stubs()
+
+from rpi_timerheap import RPiTimerHeap      # pylint: disable=wrong-import-position
+from rpi_timerwheel import RPiTimerWheel    # pylint: disable=wrong-import-position
+
+class TestTimerWheel(unittest.TestCase):
+    '''
+    Timer wheel of 8 slots of 0.1 seconds, started at time 0
+    '''
+    def setUp(self):
+        self.timer_wheel = RPiTimerWheel(0.1, 8)
+        self.timer_wheel.advance(0)
+        self.expired = []
+
+    def schedule(self, deadline):
+        '''
+        Schedule a timer adding its deadline to the expired timers
+        '''
+        return self.timer_wheel.schedule(deadline, self.expired.append, deadline)
+
+    def test_number_of_slots_rounded_to_power_of_2(self):
+        '''
+        The number of slots is rounded up to a power of 2
+        '''
+        self.assertEqual(RPiTimerWheel(0.1, 5).number_of_slots, 8)
+
+    def test_expire_in_deadline_order(self):
+        '''
+        A timer runs once its deadline has expired, not before
+        '''
+        for deadline in (0.35, 0.15, 0.25):
+            self.schedule(deadline)
+        self.assertEqual(self.timer_wheel.advance(0.14), 0)
+        self.assertEqual(self.timer_wheel.advance(0.2), 1)
+        self.assertEqual(self.timer_wheel.advance(0.4), 2)
+        self.assertEqual(self.expired, [0.15, 0.25, 0.35])
+        self.assertEqual(len(self.timer_wheel), 0)
+        self.assertEqual(self.timer_wheel.timers_expired, 3)
+
+    def test_cancel(self):
+        '''
+        A cancelled timer doesn't run, cancelling it again has no effect
+        '''
+        timer = self.schedule(0.15)
+        self.schedule(0.25)
+        self.timer_wheel.cancel(timer)
+        self.timer_wheel.cancel(timer)
+        self.assertEqual(len(self.timer_wheel), 1)
+        self.timer_wheel.advance(1.0)
+        self.assertEqual(self.expired, [0.25])
+
+    def test_deadline_after_1_rotation(self):
+        '''
+        A timer more than 1 rotation ahead stays in its slot until the deadline is reached
+        '''
+        self.schedule(2.05)
+        for tick in range(1, 21):
+            self.timer_wheel.advance(tick / 10)
+        self.assertEqual(self.expired, [])
+        self.timer_wheel.advance(2.1)
+        self.assertEqual(self.expired, [2.05])
+
+    def test_deadline_in_the_past(self):
+        '''
+        A timer with a deadline in a slot already handled runs on the next tick
+        '''
+        self.timer_wheel.advance(0.5)
+        self.schedule(0.2)
+        self.assertEqual(self.timer_wheel.advance(0.65), 1)
+        self.assertEqual(self.expired, [0.2])
+
+    def test_skip_more_than_1_rotation(self):
+        '''
+        All timers expire when more than 1 rotation passed since the previous advance
+        '''
+        for deadline in (0.15, 0.55, 1.25):
+            self.schedule(deadline)
+        self.assertEqual(self.timer_wheel.advance(5.0), 3)
+
+    def test_schedule_from_callback(self):
+        '''
+        A timer scheduled by the callback of an expired timer runs on a later tick
+        '''
+        self.timer_wheel.schedule(0.15, lambda: self.schedule(0.25))
+        self.timer_wheel.advance(0.2)
+        self.assertEqual(self.expired, [])
+        self.timer_wheel.advance(0.35)
+        self.assertEqual(self.expired, [0.25])
+
+class TestTimerHeap(unittest.TestCase):
+    '''
+    Timer heap using a patched monotonic clock, started at time 100
+    '''
+    def setUp(self):
+        patcher = mock.patch("rpi_timerheap.time.monotonic", return_value=100.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.timer_heap = RPiTimerHeap()
+        self.expired = []
+
+    def schedule(self, delay):
+        '''
+        Schedule a timer adding its delay to the expired timers
+        '''
+        return self.timer_heap.schedule(delay, self.expired.append, delay)
+
+    def test_expire_in_deadline_order(self):
+        '''
+        Timers run in the order of their deadline once it has expired, timers with the same
+        deadline in the order they were scheduled
+        '''
+        self.timer_heap.schedule(0.3, self.expired.append, "first")
+        for delay in (0.3, 0.1, 0.2):
+            self.schedule(delay)
+        self.assertEqual(self.timer_heap.next_deadline(), 100.1)
+        self.assertEqual(self.timer_heap.advance(100.05), 0)
+        self.assertEqual(self.timer_heap.advance(100.2), 2)
+        self.assertEqual(self.timer_heap.advance(100.3), 2)
+        self.assertEqual(self.expired, [0.1, 0.2, "first", 0.3])
+        self.assertEqual(len(self.timer_heap), 0)
+        self.assertIsNone(self.timer_heap.next_deadline())
+        self.assertEqual(self.timer_heap.timers_expired, 4)
+
+    def test_cancel(self):
+        '''
+        A cancelled timer doesn't run and is skipped by next_deadline, cancelling None,
+        an expired timer or a cancelled timer has no effect
+        '''
+        timer = self.schedule(0.1)
+        self.schedule(0.2)
+        self.timer_heap.cancel(timer)
+        self.timer_heap.cancel(timer)
+        self.timer_heap.cancel(None)
+        self.assertEqual(len(self.timer_heap), 1)
+        self.assertAlmostEqual(self.timer_heap.next_deadline(), 100.2)
+        self.timer_heap.advance(101.0)
+        self.timer_heap.cancel(timer)
+        self.assertEqual(self.expired, [0.2])
+        self.assertEqual(len(self.timer_heap), 0)
+
+    def test_advance_default_now(self):
+        '''
+        advance uses the monotonic clock when now is omitted
+        '''
+        self.schedule(0.0)
+        self.schedule(0.1)
+        self.assertEqual(self.timer_heap.advance(), 1)
+        self.assertEqual(self.expired, [0.0])
+
+if __name__ == '__main__':
+    unittest.main()
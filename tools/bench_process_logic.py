@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+'''
+Name:		bench_process_logic.py
+Purpose:	Micro-benchmark of the input event handling of RPiOutputLights, comparing the
+            compiled process logic (tuple of bound actions per event) with the previous
+            implementation (list of [key, action] items, if/elif on the action string)
+
+Author:
+
+Created:
+Copyright:
+Licence:
+'''
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from rpi_homedomoticaconfigurationfile import RPiHomedomoticaConfigurationFile  # pylint: disable=wrong-import-position
+from rpi_logger import RPiLogger                # pylint: disable=wrong-import-position
+from rpi_outputlights import RPiOutputLights    # pylint: disable=wrong-import-position
+
+NUMBER_OF_EVENTS = 200000
+
+def create_output_lights():
+    '''
+    Return value is an RPiOutputLights instance with 32 lights, each light having a TOGGLE,
+    an ON and an OFF rule. No PiFace boards, broker or configuration file are used
+    '''
+    output_lights = RPiOutputLights.__new__(RPiOutputLights)
+    output_lights.logger_instance = RPiLogger("WARNING")
+    output_lights.number_of_boards = 4
+    # The configuration file is never read, the values are split when the lights are created
+    output_lights.config_file = RPiHomedomoticaConfigurationFile(
+        "bench_process_logic.cfg", os.path.dirname(os.path.abspath(__file__)))
+
+    process_attributes = {}
+    for board in range(0, 4):
+        for pin in range(0, 8):
+            process_attributes["Light{}{}".format(board, pin)] = \
+                "({},{});Light {}{};".format(board, pin, board, pin) +\
+                "RPI_INPUTBUTTON_PI1_{}_{}_PRESSED|TOGGLE,".format(board, pin) +\
+                "RPI_LIGHTSIMULATOR_MGMT_{}_{}_ON|ON,".format(board, pin) +\
+                "RPI_LIGHTSIMULATOR_MGMT_{}_{}_OFF|OFF".format(board, pin)
+    output_lights.output_lights = output_lights.create_output_lights_list(process_attributes)
+    output_lights.process_logic = output_lights.create_process_logic_dictionary()
+    return output_lights
+
+def create_legacy_process_logic(output_lights):
+    '''
+    Return value is the process logic dictionary as created before the actions were compiled
+    '''
+    logic_dictionary = {}
+    for key, attributes in output_lights.output_lights.items():
+        for items in attributes.logic:
+            input_reference, action = items.split('|')
+            logic_dictionary.setdefault(input_reference, []).append([key, action])
+    return logic_dictionary
+
+def legacy_parse_incoming_message(output_lights, process_logic, message):
+    '''
+    Replica of RPiOutputLights.parse_incoming_message before the actions were compiled
+    The debug message is guarded the same way as in RPiOutputLights, so both implementations
+    only differ in the dispatch of the actions
+    '''
+    if output_lights.logger_instance.is_debug_enabled():
+        output_lights.logger_instance.debug(
+            "RPIOutputLights - Parsing incoming message {}".format(message))
+
+    try:
+        action_list = process_logic[message]
+        for light_key, light_action in action_list:
+            if light_action == "TOGGLE":
+                if output_lights._get_state(light_key) == 0:    # pylint: disable=protected-access
+                    output_lights._set_state(light_key, 1)      # pylint: disable=protected-access
+                    output_lights.logger_instance.info(
+                        "RPIOutputLights - Setting light {} - {}".format(
+                            light_key,
+                            output_lights._get_description(light_key)))    # pylint: disable=protected-access
+                else:
+                    output_lights._set_state(light_key, 0)      # pylint: disable=protected-access
+                    output_lights.logger_instance.info(
+                        "RPIOutputLights - Resetting light {} - {}".format(
+                            light_key,
+                            output_lights._get_description(light_key)))    # pylint: disable=protected-access
+            elif light_action == "ON":
+                output_lights._set_state(light_key, 1)          # pylint: disable=protected-access
+                output_lights.logger_instance.info(
+                    "RPIOutputLights - Setting light {} - {}".format(
+                        light_key,
+                        output_lights._get_description(light_key)))    # pylint: disable=protected-access
+            elif light_action == "OFF":
+                output_lights._set_state(light_key, 0)          # pylint: disable=protected-access
+                output_lights.logger_instance.info(
+                    "RPIOutputLights - Resetting light {} - {}".format(
+                        light_key,
+                        output_lights._get_description(light_key)))    # pylint: disable=protected-access
+    except KeyError:
+        output_lights.logger_instance.warning(
+            "RPIOutputLights - Unknow incoming event received {} - skipping".format(message))
+
+def main():
+    '''
+    Run both implementations on the same events and print the number of events per second
+    '''
+    output_lights = create_output_lights()
+    legacy_process_logic = create_legacy_process_logic(output_lights)
+    events = list(output_lights.process_logic)
+
+    def run_legacy():
+        for event_number in range(0, NUMBER_OF_EVENTS):
+            legacy_parse_incoming_message(output_lights,
+                                          legacy_process_logic,
+                                          events[event_number % len(events)])
+
+    def run_compiled():
+        for event_number in range(0, NUMBER_OF_EVENTS):
+            output_lights.parse_incoming_message(events[event_number % len(events)])
+
+    print("{} events, {} rules".format(NUMBER_OF_EVENTS, len(events)))
+    for name, function in (("if/elif dispatch", run_legacy), ("compiled dispatch", run_compiled)):
+        duration = min(timeit.repeat(function, number=1, repeat=15))
+        print("{:20s}: {:10.0f} events/s".format(name, NUMBER_OF_EVENTS / duration))
+
+if __name__ == '__main__':
+    main()
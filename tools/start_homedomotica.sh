@@ -16,6 +16,8 @@ path_to_configuration_file=/home/homedomotica/environments/green/config
 h=`hostname`
 pi_reference=`echo -n $h|tail -c 1`
 
+echo "Compiling configuration files"
+python3  $path_to_source_file/rpi_compileconfig.py -cfp $path_to_configuration_file
 echo "Starting 'inputbutton' process"
 python3  $path_to_source_file/rpi_inputbutton_pi$pi_reference.py -l $log_level -cfp $path_to_configuration_file &
 echo "Starting 'outputrelay' process"
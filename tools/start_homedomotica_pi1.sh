@@ -19,6 +19,8 @@ path_to_source_file=/home/homedomotica/environments/$active_environment/src
 path_to_configuration_file=/home/homedomotica/environments/$active_environment/config
 pi_reference=pi1
 
+echo "Compiling configuration files"
+python3  $path_to_source_file/rpi_compileconfig.py -cfp $path_to_configuration_file
 echo "Starting 'inputbutton' process"
 python3  $path_to_source_file/rpi_inputbutton_$pi_reference.py -l $log_level -cfp $path_to_configuration_file &
 echo "Starting 'outputrelay' process"